@@ -10,6 +10,7 @@ from fastapi.middleware.gzip import GZipMiddleware
 
 from backend.config import CONFIG, override_schema
 CONFIG['importer'] = 'app.py'
+from backend.db.utils import dispose_async_engines, dispose_engines
 from backend.routes import cset_crud, db, graph
 
 # users on the same server
@@ -27,6 +28,19 @@ APP.add_middleware(
 APP.add_middleware(GZipMiddleware, minimum_size=1000)
 
 
+@APP.on_event("startup")
+def load_graph_in_background():
+    """Start loading the relationship graph without blocking startup. Graph routes return 503 until it's ready."""
+    graph.GRAPH_LOADER.start()
+
+
+@APP.on_event("shutdown")
+async def close_db_connections():
+    """Close pooled DB connections"""
+    dispose_engines()
+    await dispose_async_engines()
+
+
 @APP.middleware("http")
 async def set_schema_globally(request: Request, call_next):
     print(request.url)
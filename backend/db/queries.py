@@ -3,8 +3,10 @@ from functools import cache
 from typing import List, Dict, Set, Union
 from fastapi import Query
 from sqlalchemy import Connection
+from sqlalchemy.ext.asyncio import AsyncConnection
 
-from backend.db.utils import sql_query, sql_query_single_col, get_db_connection, sql_in
+from backend.db.utils import get_async_db_connection, sql_query, sql_query_async, sql_query_single_col, \
+    get_db_connection, sql_in
 
 
 def get_concepts(concept_ids: Union[List[int], Set[int]], con: Connection = None, table:str='concepts_with_counts') -> List:
@@ -20,6 +22,20 @@ def get_concepts(concept_ids: Union[List[int], Set[int]], con: Connection = None
     return rows
 
 
+async def get_concepts_async(
+    concept_ids: Union[List[int], Set[int]], con: AsyncConnection = None, table: str = 'concepts_with_counts'
+) -> List:
+    """Async version of get_concepts(), for async routes"""
+    q = f"""
+          SELECT *
+          FROM {table}
+          WHERE concept_id {sql_in(concept_ids)};"""
+    if con:
+        return await sql_query_async(con, q)
+    async with get_async_db_connection() as conn:
+        return await sql_query_async(conn, q)
+
+
 def get_vocab_of_concepts(id: List[int] = Query(...), con: Connection = None, table:str='concept') -> List:
     """Expecting only one vocab for the list of concepts"""
     conn = con if con else get_db_connection()
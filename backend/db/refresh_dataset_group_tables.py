@@ -118,9 +118,10 @@ def refresh_dataset_group_tables(
         # Vocab refresh only
         # todo: ideally this notification would happen differently. More comments near bottom of refresh_voc.yml
         if group_name == 'vocab' and len(dataset_group) == 1:  # Will be the case for GH actions
-            raise NotAnError('Notification: Restart deployment backend.\nThis is not an error. It is only being raised '
-                'as an easy way to trigger a GitHub action notification. Vocabulary refresh has completed '
-                'successfully. Please restart backend to refresh networkx graph.')
+            raise NotAnError('Notification: Vocabulary refresh complete.\nThis is not an error. It is only being '
+                'raised as an easy way to trigger a GitHub action notification. Vocabulary refresh has completed '
+                'successfully. Once the relationship graph has been rebuilt, running backends pick it up at their next '
+                'graph watch poll (every TERMHUB_GRAPH_WATCH_SECONDS). Backends with watching disabled need a restart.')
 
     print('Done')
 
@@ -0,0 +1,489 @@
+"""Synthetic OMOP vocabulary and concept set data, for scale testing
+
+Generates the dataset tables that TermHub loads (concept, concept_ancestor, concept_relationship, relationship,
+code_sets, concept_set_container, concept_set_version_item, concept_set_members, and counts), plus the minimal object
+tables that the derived table DDL joins on, at any size up to millions of concepts. The data is internally consistent:
+concept_ancestor is the transitive closure of the hierarchy, and concept_set_members is the expansion of each version's
+items. Output is either CSVs, in the layout `load_csv()` reads, or a DB schema loaded from them, with primary keys and
+derived tables, like `initialize_test_schema()` makes.
+
+The shape of the data mimics the real vocabularies:
+  - Hierarchies: Each vocabulary is its own DAG. Depths are roughly Poisson around `mean_depth`, like SNOMED's. Parents
+    are chosen with heavy-tailed (Pareto) weights, so most concepts have a handful of children and a few have thousands
+    (super nodes). A share of concepts get extra parents from any level above them, as SNOMED's do.
+  - Concept sets: Containers have one or more versions. Each version's items come from one vocabulary, with a
+    heavy-tailed (Zipf) number of items, mostly including descendants, with some exclusions.
+All randomness comes from `seed`, so a given configuration always generates the same data.
+
+How to run:
+    python backend/db/synthetic.py --concepts 1000000 --codesets 5000 --outdir synthetic_data
+    python backend/db/synthetic.py --concepts 1000000 --codesets 5000 --outdir synthetic_data --schema synthetic -l
+"""
+import os
+import sys
+import uuid
+from argparse import ArgumentParser
+from typing import Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+DB_DIR = os.path.dirname(os.path.realpath(__file__))
+BACKEND_DIR = os.path.join(DB_DIR, '..')
+PROJECT_ROOT = os.path.join(BACKEND_DIR, '..')
+sys.path.insert(0, str(PROJECT_ROOT))
+from backend.graph.compact_graph import build_offsets, expand_ranges
+
+DESC = 'Generate synthetic OMOP vocabulary and concept set data, as CSVs and optionally loaded into a DB schema.'
+# vocabulary_id, share of concepts, domain_id, concept_class_id, share standard ('S'), share classification ('C')
+VOCABULARIES = [
+    ('SNOMED', 0.45, 'Condition', 'Clinical Finding', 0.85, 0.10),
+    ('RxNorm', 0.12, 'Drug', 'Clinical Drug', 0.95, 0.0),
+    ('RxNorm Extension', 0.13, 'Drug', 'Clinical Drug', 0.95, 0.0),
+    ('LOINC', 0.12, 'Measurement', 'Lab Test', 0.90, 0.05),
+    ('ICD10CM', 0.10, 'Condition', '5-char billing code', 0.0, 0.0),
+    ('CPT4', 0.08, 'Procedure', 'CPT4', 0.90, 0.05),
+]
+NAME_WORDS = np.array([
+    'acute', 'chronic', 'disorder', 'of', 'left', 'right', 'upper', 'lower', 'limb', 'heart', 'kidney', 'liver',
+    'lung', 'infection', 'syndrome', 'due', 'to', 'type', 'primary', 'secondary', 'malignant', 'benign', 'neoplasm',
+    'injury', 'fracture', 'oral', 'tablet', 'injection', 'mg', 'serum', 'plasma', 'level', 'measurement', 'procedure',
+    'excision', 'repair', 'screening', 'with', 'without', 'complication'])
+RELATIONSHIPS = pd.DataFrame([
+    ('Is a', 'Is a', 1, 1, 'Subsumes', 44818820),
+    ('Subsumes', 'Subsumes', 1, 1, 'Is a', 44818723),
+    ('Maps to', 'Non-standard to Standard map (OMOP)', 0, 0, 'Mapped from', 44818977),
+    ('Mapped from', 'Standard to Non-standard map (OMOP)', 0, 0, 'Maps to', 44818978),
+], columns=['relationship_id', 'relationship_name', 'is_hierarchical', 'defines_ancestry', 'reverse_relationship_id',
+            'relationship_concept_id'])
+DATASET_TABLES = [
+    'concept', 'concept_ancestor', 'concept_relationship', 'relationship', 'code_sets', 'concept_set_container',
+    'concept_set_members', 'concept_set_version_item', 'concept_set_counts_clamped',
+    'deidentified_term_usage_by_domain_clamped']
+# Only the columns that the derived table DDL uses
+OBJECT_TABLES = ['researcher', 'omopconceptset', 'omopconceptsetcontainer']
+VALID_START_DATE, VALID_END_DATE = '1970-01-01', '2099-12-31'
+CREATED_AT = '2023-01-01T00:00:00.000Z'
+
+
+def weighted_choice(rng: np.random.Generator, weights: np.ndarray, size: int) -> np.ndarray:
+    """Indexes into weights, drawn with replacement with probability proportional to weight"""
+    cumulative = np.cumsum(weights)
+    return np.minimum(np.searchsorted(cumulative, rng.random(size) * cumulative[-1], side='right'), len(weights) - 1)
+
+
+def generate_hierarchy(
+    rng: np.random.Generator, n: int, mean_depth: float = 7.0, root_share: float = 0.001, fanout_alpha: float = 1.2,
+    multi_parent_share: float = 0.3
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Random DAG of n nodes, numbered in order of level, so every parent has a lower number than its children
+
+    :param mean_depth: Mean level of non-root nodes.
+    :param root_share: Share of nodes that are roots.
+    :param fanout_alpha: Pareto shape of the weights with which parents are picked. Lower is more heavy-tailed.
+    :param multi_parent_share: Share of non-root nodes that get a second parent, from any level above them.
+    :return: (level of each node, parent, child) of each edge, sorted by child, then parent."""
+    n_roots = min(n, max(1, int(n * root_share)))
+    depths = np.sort(np.concatenate([
+        np.zeros(n_roots, dtype=np.int64), 1 + rng.poisson(max(mean_depth - 1, 0), n - n_roots)]))
+    # Skipped levels would leave nodes without parents
+    _, level = np.unique(depths, return_inverse=True)
+    level_offsets = build_offsets(level, int(level.max()) + 1 if n else 0)
+    weights = rng.pareto(fanout_alpha, n) + 1
+
+    parents, children = [], []
+    for lv in range(1, len(level_offsets) - 1):
+        start, stop = level_offsets[lv], level_offsets[lv + 1]
+        nodes = np.arange(start, stop)
+        prev_start = level_offsets[lv - 1]
+        parents.append(prev_start + weighted_choice(rng, weights[prev_start:start], len(nodes)))
+        children.append(nodes)
+        extra = nodes[rng.random(len(nodes)) < multi_parent_share]
+        parents.append(weighted_choice(rng, weights[:start], len(extra)))
+        children.append(extra)
+    parent = np.concatenate(parents) if parents else np.empty(0, dtype=np.int64)
+    child = np.concatenate(children) if children else np.empty(0, dtype=np.int64)
+    edges = np.unique(np.stack([child, parent], axis=1), axis=0)
+    return level, edges[:, 1], edges[:, 0]
+
+
+def transitive_closure(
+    level: np.ndarray, parent: np.ndarray, child: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """concept_ancestor rows of a hierarchy from generate_hierarchy(), including each node as its own ancestor
+
+    Built a level at a time: a node's ancestors are its parents' ancestors (and the parents themselves, via their self
+    rows), one level further away.
+
+    :return: (ancestor, descendant, min_levels_of_separation, max_levels_of_separation), sorted by descendant, then
+     ancestor."""
+    n = len(level)
+    level_offsets = build_offsets(level, int(level.max()) + 1 if n else 0)
+    anc, desc, min_sep, max_sep = [np.empty(0, dtype=np.int64) for _ in range(4)]
+    for lv in range(len(level_offsets) - 1):
+        start, stop = level_offsets[lv], level_offsets[lv + 1]
+        nodes = np.arange(start, stop)
+        in_level = (child >= start) & (child < stop)
+        p, c = parent[in_level], child[in_level]
+        # Rows so far are sorted by descendant, and cover every node of earlier levels
+        offsets = build_offsets(desc, start)
+        counts = offsets[p + 1] - offsets[p]
+        rows = expand_ranges(offsets[p], counts)
+        new_anc, new_desc = anc[rows], np.repeat(c, counts)
+        new_min, new_max = min_sep[rows] + 1, max_sep[rows] + 1
+        # An ancestor reachable through several parents gets one row
+        order = np.lexsort((new_anc, new_desc))
+        new_anc, new_desc, new_min, new_max = new_anc[order], new_desc[order], new_min[order], new_max[order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = (new_anc[1:] != new_anc[:-1]) | (new_desc[1:] != new_desc[:-1])
+        starts = np.flatnonzero(first)
+        if len(starts):
+            new_min, new_max = np.minimum.reduceat(new_min, starts), np.maximum.reduceat(new_max, starts)
+        new_anc, new_desc = new_anc[first], new_desc[first]
+
+        zeros = np.zeros(len(nodes), dtype=np.int64)
+        level_anc, level_desc = np.concatenate([new_anc, nodes]), np.concatenate([new_desc, nodes])
+        level_min, level_max = np.concatenate([new_min, zeros]), np.concatenate([new_max, zeros])
+        order = np.lexsort((level_anc, level_desc))
+        anc, desc = np.concatenate([anc, level_anc[order]]), np.concatenate([desc, level_desc[order]])
+        min_sep = np.concatenate([min_sep, level_min[order]])
+        max_sep = np.concatenate([max_sep, level_max[order]])
+    return anc, desc, min_sep, max_sep
+
+
+def random_names(rng: np.random.Generator, n: int, prefix: str, min_words=2, max_words=6) -> List[str]:
+    """Names made of a prefix and random words"""
+    n_words = rng.integers(min_words, max_words + 1, n)
+    words = NAME_WORDS[rng.integers(0, len(NAME_WORDS), int(n_words.sum()))]
+    return [f'{prefix} ' + ' '.join(w) for w in np.split(words, np.cumsum(n_words)[:-1])]
+
+
+def random_uuids(rng: np.random.Generator, n: int) -> List[str]:
+    """Random UUIDs, as strings"""
+    return [str(uuid.UUID(bytes=rng.bytes(16), version=4)) for _ in range(n)]
+
+
+def generate_vocabulary(
+    rng: np.random.Generator, n_concepts: int, mean_depth: float = 7.0, root_share: float = 0.001,
+    fanout_alpha: float = 1.2, multi_parent_share: float = 0.3
+) -> Dict[str, pd.DataFrame]:
+    """concept, concept_ancestor, concept_relationship and relationship tables. See generate_hierarchy() for params."""
+    shares = np.array([v[1] for v in VOCABULARIES])
+    sizes = np.floor(shares / shares.sum() * n_concepts).astype(np.int64)
+    sizes[0] += n_concepts - sizes.sum()
+    # Real concept_ids are sparse and unordered w/ respect to the hierarchy
+    concept_ids = np.sort(rng.choice(max(50_000_000, 4 * n_concepts), n_concepts, replace=False) + 1)
+    concept_ids = rng.permutation(concept_ids)
+
+    concepts, ancestors, edges = [], [], []
+    offset = 0
+    for (vocab, _, domain, concept_class, standard_share, classification_share), size in zip(VOCABULARIES, sizes):
+        if not size:
+            continue
+        level, parent, child = generate_hierarchy(
+            rng, int(size), mean_depth, root_share, fanout_alpha, multi_parent_share)
+        anc, desc, min_sep, max_sep = transitive_closure(level, parent, child)
+        ids = concept_ids[offset:offset + size]
+        draw = rng.random(size)
+        standard = np.where(draw < standard_share, 'S', np.where(
+            draw < standard_share + classification_share, 'C', None))
+        concepts.append(pd.DataFrame({
+            'concept_id': ids,
+            'concept_name': random_names(rng, int(size), vocab),
+            'domain_id': domain,
+            'vocabulary_id': vocab,
+            'concept_class_id': concept_class,
+            'standard_concept': standard,
+            'concept_code': [f'{vocab[:3].upper()}{i}' for i in range(size)],
+            'valid_start_date': VALID_START_DATE,
+            'valid_end_date': VALID_END_DATE,
+            'invalid_reason': None,
+        }))
+        ancestors.append(pd.DataFrame({
+            'ancestor_concept_id': ids[anc],
+            'descendant_concept_id': ids[desc],
+            'min_levels_of_separation': min_sep,
+            'max_levels_of_separation': max_sep,
+        }))
+        edges.append((ids[parent], ids[child]))
+        offset += size
+    concept = pd.concat(concepts, ignore_index=True)
+    concept_ancestor = pd.concat(ancestors, ignore_index=True)
+
+    parent_ids = np.concatenate([e[0] for e in edges])
+    child_ids = np.concatenate([e[1] for e in edges])
+    # Non-standard concepts map to a random standard concept of the same domain
+    mapped_from, mapped_to = [], []
+    for domain, group in concept.groupby('domain_id'):
+        is_standard = (group['standard_concept'] == 'S').to_numpy()
+        sources, targets = group['concept_id'].to_numpy()[~is_standard], group['concept_id'].to_numpy()[is_standard]
+        if len(sources) and len(targets):
+            mapped_from.append(sources)
+            mapped_to.append(targets[rng.integers(0, len(targets), len(sources))])
+    mapped_from = np.concatenate(mapped_from) if mapped_from else np.empty(0, dtype=np.int64)
+    mapped_to = np.concatenate(mapped_to) if mapped_to else np.empty(0, dtype=np.int64)
+    concept_relationship = pd.DataFrame({
+        'concept_id_1': np.concatenate([child_ids, parent_ids, mapped_from, mapped_to]),
+        'concept_id_2': np.concatenate([parent_ids, child_ids, mapped_to, mapped_from]),
+        'relationship_id': np.repeat(
+            ['Is a', 'Subsumes', 'Maps to', 'Mapped from'],
+            [len(child_ids), len(child_ids), len(mapped_from), len(mapped_from)]),
+        'valid_start_date': VALID_START_DATE,
+        'valid_end_date': VALID_END_DATE,
+        'invalid_reason': None,
+    })
+    return {
+        'concept': concept,
+        'concept_ancestor': concept_ancestor,
+        'concept_relationship': concept_relationship,
+        'relationship': RELATIONSHIPS.copy(),
+    }
+
+
+def generate_concept_sets(
+    rng: np.random.Generator, vocab: Dict[str, pd.DataFrame], n_codesets: int, mean_versions: float = 2.0,
+    zipf_items: float = 2.0, max_items: int = 500, max_descendants: int = 5000, include_descendants_share: float = 0.7,
+    exclude_share: float = 0.05, n_researchers: int = 100
+) -> Dict[str, pd.DataFrame]:
+    """Concept set tables for the concepts of vocab, as returned by generate_vocabulary()
+
+    :param mean_versions: Mean number of versions (codesets) per container.
+    :param zipf_items: Zipf exponent of the number of items per version. Lower is more heavy-tailed.
+    :param max_descendants: Concepts with more descendants than this aren't picked as items, so that no version has
+     a vocabulary's worth of members.
+    :param include_descendants_share: Share of items with includeDescendants.
+    :param exclude_share: Share of items with isExcluded."""
+    concept, concept_ancestor = vocab['concept'], vocab['concept_ancestor']
+    concept_ids = concept['concept_id'].to_numpy()
+    names = concept['concept_name'].to_numpy()
+    codes = concept['concept_code'].to_numpy()
+    vocab_ids = concept['vocabulary_id'].to_numpy()
+    # Descendants of each concept, by position in `concept`
+    sorter = np.argsort(concept_ids)
+    anc_pos = sorter[np.searchsorted(concept_ids, concept_ancestor['ancestor_concept_id'].to_numpy(), sorter=sorter)]
+    desc_pos = sorter[np.searchsorted(concept_ids, concept_ancestor['descendant_concept_id'].to_numpy(), sorter=sorter)]
+    order = np.argsort(anc_pos, kind='stable')
+    desc_pos = desc_pos[order]
+    desc_offsets = build_offsets(anc_pos[order], len(concept_ids))
+    n_descendants = np.diff(desc_offsets)
+
+    researchers = random_uuids(rng, n_researchers)
+    n_containers = max(1, int(round(n_codesets / max(mean_versions, 1))))
+    container_of = np.sort(np.concatenate([
+        np.arange(min(n_containers, n_codesets)), rng.integers(0, n_containers, max(n_codesets - n_containers, 0))]))
+    n_containers = len(np.unique(container_of))
+    container_starts = np.flatnonzero(np.diff(container_of, prepend=-1))
+    version = np.arange(n_codesets) - np.repeat(container_starts, np.diff(np.append(container_starts, n_codesets)))
+    version += 1
+    is_most_recent = np.append(container_of[1:] != container_of[:-1], True) if n_codesets else np.empty(0, dtype=bool)
+    codeset_ids = np.sort(rng.choice(1_000_000_000, n_codesets, replace=False) + 1)
+    container_names = np.array([f'[SYN] {name}' for name in random_names(rng, n_containers, 'Concept set', 1, 4)])
+    container_names = np.array([f'{name} {i}' for i, name in enumerate(container_names)])
+    container_ids = random_uuids(rng, n_containers)
+    container_creator = rng.choice(researchers, n_containers)
+    archived = rng.random(n_containers) < 0.02
+    cset_names = container_names[container_of]
+
+    items, members = [], []
+    shares = np.array([v[1] for v in VOCABULARIES])
+    vocab_names = np.array([v[0] for v in VOCABULARIES])
+    pickable = {v: np.flatnonzero((vocab_ids == v) & (n_descendants <= max_descendants)) for v in vocab_names}
+    n_items = np.minimum(rng.zipf(zipf_items, n_codesets), max_items)
+    for i in range(n_codesets):
+        candidates = pickable[vocab_names[weighted_choice(rng, shares, 1)[0]]]
+        if not len(candidates):
+            candidates = np.flatnonzero(n_descendants <= max_descendants)
+        pos = np.unique(rng.choice(candidates, min(int(n_items[i]), len(candidates)), replace=False))
+        include_descendants = rng.random(len(pos)) < include_descendants_share
+        excluded = rng.random(len(pos)) < exclude_share
+        # A version needs at least one included item
+        excluded[0] = False
+
+        expanded = []
+        for mask in (~excluded, excluded):
+            with_desc = pos[mask & include_descendants]
+            starts = desc_offsets[with_desc]
+            expanded.append(np.union1d(pos[mask], desc_pos[expand_ranges(starts, desc_offsets[with_desc + 1] - starts)]))
+        member_pos = np.setdiff1d(*expanded)
+        items.append(pd.DataFrame({
+            'codeset_id': codeset_ids[i],
+            'concept_id': concept_ids[pos],
+            'code': codes[pos],
+            'codeSystem': vocab_ids[pos],
+            'isExcluded': excluded,
+            'includeDescendants': include_descendants,
+            'includeMapped': False,
+            'item_id': random_uuids(rng, len(pos)),
+            'annotation': None,
+            'created_by': container_creator[container_of[i]],
+            'created_at': CREATED_AT,
+        }))
+        members.append(pd.DataFrame({
+            'codeset_id': codeset_ids[i],
+            'concept_id': concept_ids[member_pos],
+            'concept_set_name': cset_names[i],
+            'is_most_recent_version': is_most_recent[i],
+            'version': version[i],
+            'concept_name': names[member_pos],
+            'archived': archived[container_of[i]],
+        }))
+
+    parent_version = np.where(version > 1, np.concatenate([[0], codeset_ids[:-1]]), 0) if n_codesets else []
+    code_sets = pd.DataFrame({
+        'codeset_id': codeset_ids,
+        'concept_set_name': cset_names,
+        'concept_set_version_title': [f'{name} (v{v})' for name, v in zip(cset_names, version)],
+        'project': 'N3C',
+        'source_application': 'UNITE',
+        'source_application_version': '2.0',
+        'created_at': CREATED_AT,
+        'atlas_json': None,
+        'is_most_recent_version': is_most_recent,
+        'version': version,
+        'comments': None,
+        'intention': None,
+        'limitations': None,
+        'issues': None,
+        'update_message': None,
+        'status': np.where(is_most_recent, 'Under Construction', 'Finished'),
+        'has_review': False,
+        'reviewed_by': None,
+        'created_by': container_creator[container_of],
+        'provenance': None,
+        'atlas_json_resource_url': None,
+        'parent_version_id': pd.array(
+            [int(x) if x else None for x in parent_version], dtype='Int64'),
+        'is_draft': False,
+        'authoritative_source': None,
+        'omop_vocab_version': 'v5.0 30-AUG-23',
+    })
+    concept_set_container = pd.DataFrame({
+        'concept_set_id': container_ids,
+        'concept_set_name': container_names,
+        'project_id': None,
+        'assigned_informatician': None,
+        'assigned_sme': None,
+        'status': 'Under Construction',
+        'stage': 'Awaiting Editing',
+        'intention': None,
+        'n3c_reviewer': None,
+        'alias': None,
+        'archived': archived,
+        'created_by': container_creator,
+        'created_at': CREATED_AT,
+    })
+    # Counts are roughly log-normal, w/ person counts a fraction of record counts
+    record_counts = np.round(rng.lognormal(8, 3, n_codesets)).astype(np.int64) + 20
+    concept_set_counts_clamped = pd.DataFrame({
+        'codeset_id': codeset_ids,
+        'approx_distinct_person_count': np.maximum(20, (record_counts * rng.random(n_codesets)).astype(np.int64)),
+        'approx_total_record_count': record_counts,
+    })
+    used = concept_ids[rng.random(len(concept_ids)) < 0.3]
+    term_counts = np.round(rng.lognormal(6, 3, len(used))).astype(np.int64) + 20
+    domains = concept['domain_id'].to_numpy()[np.searchsorted(concept_ids, used, sorter=sorter)]
+    term_usage = pd.DataFrame({
+        'concept_id': used,
+        'domain': domains,
+        'total_count': term_counts,
+        'distinct_person_count': np.maximum(20, (term_counts * rng.random(len(used))).astype(np.int64)),
+    })
+    return {
+        'code_sets': code_sets,
+        'concept_set_container': concept_set_container,
+        'concept_set_members': pd.concat(members, ignore_index=True) if members else pd.DataFrame(),
+        'concept_set_version_item': pd.concat(items, ignore_index=True) if items else pd.DataFrame(),
+        'concept_set_counts_clamped': concept_set_counts_clamped,
+        'deidentified_term_usage_by_domain_clamped': term_usage,
+        'researcher': pd.DataFrame({
+            'multipassId': researchers,
+            'emailAddress': [f'researcher{i}@example.org' for i in range(n_researchers)],
+            'institution': 'Synthetic University',
+            'name': [f'Researcher {i}' for i in range(n_researchers)],
+        }),
+        'omopconceptset': pd.DataFrame({
+            'codesetId': codeset_ids, 'rid': [f'ri.synthetic.codeset.{x}' for x in codeset_ids]}),
+        'omopconceptsetcontainer': pd.DataFrame({
+            'conceptSetId': container_ids, 'rid': [f'ri.synthetic.container.{x}' for x in container_ids]}),
+    }
+
+
+def generate(
+    n_concepts: int = 100_000, n_codesets: int = 1000, seed: int = 0, mean_depth: float = 7.0,
+    root_share: float = 0.001, fanout_alpha: float = 1.2, multi_parent_share: float = 0.3, mean_versions: float = 2.0,
+    max_descendants: int = 5000
+) -> Dict[str, pd.DataFrame]:
+    """All tables, by name. See generate_hierarchy() and generate_concept_sets() for params."""
+    rng = np.random.default_rng(seed)
+    tables = generate_vocabulary(rng, n_concepts, mean_depth, root_share, fanout_alpha, multi_parent_share)
+    tables.update(generate_concept_sets(
+        rng, tables, n_codesets, mean_versions=mean_versions, max_descendants=max_descendants))
+    return tables
+
+
+def write_csvs(tables: Dict[str, pd.DataFrame], outdir: str) -> Dict[str, str]:
+    """Write tables as <outdir>/<table>.csv, which is how load_csv() expects dataset CSVs to be named
+
+    :return: Paths, by table name"""
+    os.makedirs(outdir, exist_ok=True)
+    paths = {}
+    for table, df in tables.items():
+        paths[table] = os.path.join(outdir, f'{table}.csv')
+        df.to_csv(paths[table], index=False)
+        print(f'INFO: wrote {paths[table]} ({len(df)} rows)')
+    return paths
+
+
+def load_synthetic_schema(paths: Dict[str, str], schema: str, local=False):
+    """Load CSVs from write_csvs() into a schema, then set primary keys and create derived tables, as
+    initialize_test_schema() does"""
+    from backend.db.utils import get_db_connection, load_csv, refresh_any_dependent_tables, run_sql
+    from enclave_wrangler.config import DATASET_REGISTRY
+
+    if schema == 'n3c':
+        raise RuntimeError('Refusing to load synthetic data into the n3c schema.')
+    with get_db_connection(schema='', local=local) as con_initial:
+        run_sql(con_initial, f'CREATE SCHEMA IF NOT EXISTS {schema};')
+    with get_db_connection(schema=schema, local=local) as con:
+        for table in DATASET_TABLES + OBJECT_TABLES:
+            run_sql(con, f'DROP TABLE IF EXISTS {schema}.{table} CASCADE;')
+            load_csv(con, table, replace_rule=None, schema=schema, local=local, path_override=paths[table])
+        for table in DATASET_TABLES:
+            pk = DATASET_REGISTRY[table].get('primary_key')
+            if pk:
+                pk = pk if isinstance(pk, str) else ', '.join(pk)
+                run_sql(con, f'ALTER TABLE {schema}.{table} ADD PRIMARY KEY({pk});')
+    with get_db_connection(schema='', local=local) as con_initial:
+        refresh_any_dependent_tables(con_initial, schema=schema)
+
+
+def cli():
+    """Command line interface"""
+    parser = ArgumentParser(prog='Synthetic data', description=DESC)
+    parser.add_argument('-n', '--concepts', type=int, default=100_000, help='Number of concepts.')
+    parser.add_argument('-c', '--codesets', type=int, default=1000, help='Number of concept set versions.')
+    parser.add_argument('-s', '--seed', type=int, default=0, help='Random seed.')
+    parser.add_argument('-d', '--mean-depth', type=float, default=7.0, help='Mean depth of the hierarchies.')
+    parser.add_argument(
+        '-a', '--fanout-alpha', type=float, default=1.2,
+        help='Pareto shape of parent weights. Lower values make for bigger super nodes.')
+    parser.add_argument(
+        '-m', '--multi-parent-share', type=float, default=0.3, help='Share of concepts with a second parent.')
+    parser.add_argument('-o', '--outdir', required=True, help='Directory to write CSVs to.')
+    parser.add_argument(
+        '--schema', required=False,
+        help='If passed, also load the CSVs into this schema and create derived tables. Not n3c.')
+    parser.add_argument(
+        '-l', '--use-local-db', action='store_true', default=False, required=False,
+        help='Use local database instead of server.')
+    d = vars(parser.parse_args())
+    tables = generate(
+        d['concepts'], d['codesets'], d['seed'], d['mean_depth'], fanout_alpha=d['fanout_alpha'],
+        multi_parent_share=d['multi_parent_share'])
+    paths = write_csvs(tables, d['outdir'])
+    if d['schema']:
+        load_synthetic_schema(paths, d['schema'], d['use_local_db'])
+
+
+if __name__ == '__main__':
+    cli()
@@ -5,13 +5,18 @@ todo's
   2. Making 'Connection' optional: Can write a wrapper function and decorate all functions that need, where all it does
   is `conn = con if con else get_db_connection()`, run the inner function, and then close conn if not con.
 """
+import asyncio
+import io
 import json
 import os
 import sys
+import threading
 import time
 from argparse import ArgumentParser
+from contextlib import contextmanager
 from pathlib import Path
 from random import randint
+from weakref import WeakKeyDictionary
 
 import pytz
 import dateutil.parser as dp
@@ -25,8 +30,9 @@ from jinja2 import Template
 from psycopg2.errors import UndefinedTable
 from sqlalchemy import create_engine, event, CursorResult
 from sqlalchemy.engine import Row, RowMapping
-from sqlalchemy.engine.base import Connection
-from sqlalchemy.exc import OperationalError, ProgrammingError
+from sqlalchemy.engine.base import Connection, Engine
+from sqlalchemy.exc import OperationalError, ProgrammingError, TimeoutError as SATimeoutError
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine, create_async_engine
 from sqlalchemy.sql import text
 from sqlalchemy.sql.elements import TextClause
 from typing import Any, Dict, Set, Tuple, Union, List
@@ -197,6 +203,11 @@ def refresh_derived_tables_exec(
         run_sql(con, f'ALTER TABLE {schema}.{module}{temp_table_suffix} RENAME TO {module};')
         print(f'   - completed in {(datetime.now() - t0_2).seconds} seconds')
 
+    # Record what changed in the hierarchy, so the relationship graph can be updated incrementally
+    if 'concept_graph' in ddl_modules_queue and 'concept_graph_old' in list_tables(con, schema):
+        print(f' - recording concept_graph delta...')
+        record_concept_graph_delta(con, schema)
+
     # Delete old tables/views. Because of view dependencies, order & commands are different
     print(f' - Removing older, temporarily backed up tables/views...')
     for view in views:
@@ -209,6 +220,31 @@ def refresh_derived_tables_exec(
     print(f' - completed in {(t1 - t0).seconds} seconds')
 
 
+def record_concept_graph_delta(con: Connection, schema=SCHEMA):
+    """Store the edges added to and removed from concept_graph by a refresh in concept_graph_delta
+
+    Must be called after concept_graph_new has been renamed to concept_graph, but before concept_graph_old is dropped.
+    The delta takes a relationship graph built from the old table to one built from the new. The status var
+    `concept_graph_delta_base` records which graph that is, i.e. the `last_refreshed_vocab_tables` of the old table.
+    Since status vars are not schema-specific, that's only set for the main schema."""
+    run_sql(con, f'DROP TABLE IF EXISTS {schema}.concept_graph_delta;')
+    run_sql(con, f"""
+        CREATE TABLE {schema}.concept_graph_delta AS
+        SELECT source_id, target_id, true AS added FROM (
+            SELECT source_id, target_id FROM {schema}.concept_graph
+            EXCEPT
+            SELECT source_id, target_id FROM {schema}.concept_graph_old
+        ) a
+        UNION ALL
+        SELECT source_id, target_id, false AS added FROM (
+            SELECT source_id, target_id FROM {schema}.concept_graph_old
+            EXCEPT
+            SELECT source_id, target_id FROM {schema}.concept_graph
+        ) r;""")
+    if schema == SCHEMA:
+        update_db_status_var('concept_graph_delta_base', check_db_status_var('last_refreshed_vocab_tables') or '')
+
+
 # todo: move this somewhere else, possibly load.py or db_refresh.py
 # todo: what to do if this process fails? any way to roll back? should we?
 # todo: currently has no way of passing 'local' down to db status var funcs
@@ -248,71 +284,195 @@ def refresh_derived_tables(
             break
 
 
-# todo: Any use to having this? If not, remove. Otherwise, needs fixing. It was working when in get_db_connection() we
-#  were not passing schema... but that's not really working. We need to be able to control the schema. After changing to
-#  pass schema, sometimes it worked, and sometimes we got err: AttributeError: 'dict' object has no attribute 'cursor',
-#  indicating that the kwargs weren't getting passed appropriately.
-# from functools import partial
-# from sqlalchemy.pool import QueuePool
-# def set_search_path(dbapi_connection, schema=SCHEMA, connection_record=None):
-#     """Set the search_path when connecting.
-#
-#     Source: https://chat.openai.com/share/0472ba44-0e58-44ad-bbcb-5eabffae3d39
-#
-#     Note: This hasn't helped w/ a problem we were having. If it continues to not help, we could rever to the old
-#     version of get_db_connection().
-#     """
-#     cursor = dbapi_connection.cursor()
-#     cursor.execute(f"SET SESSION search_path='{schema}'")
-#     cursor.close()
-#
-#
-# def get_db_connection(isolation_level='AUTOCOMMIT', schema: str = SCHEMA, local=False) -> Connection:
-#     """Get database connection object
-#
-#     :param local: If True, connection is on local instead of production database.
-#     """
-#     if schema == None:
-#         raise ValueError('Must pass schema to get_db_connection()')
-#     engine = create_engine(
-#         get_pg_connect_url(local),
-#         poolclass=QueuePool,
-#         isolation_level=isolation_level,
-#     )
-#     # event.listen(engine, "connect", set_search_path)
-#     event.listen(engine, "connect", partial(set_search_path, {'schema': schema}))
-#     return engine.connect()
+# Engines are pooled and shared process-wide, one per (local, schema, isolation_level), so that connecting doesn't pay for
+# a new TCP / TLS / auth handshake every time. Pool settings can be overridden w/ environment variables.
+DB_POOL_SIZE = int(os.getenv('TERMHUB_DB_POOL_SIZE', 5))
+DB_POOL_MAX_OVERFLOW = int(os.getenv('TERMHUB_DB_POOL_MAX_OVERFLOW', 10))
+DB_POOL_TIMEOUT_SECONDS = float(os.getenv('TERMHUB_DB_POOL_TIMEOUT_SECONDS', 30))
+# Recycle connections before the server or a proxy closes them for being idle
+DB_POOL_RECYCLE_SECONDS = int(os.getenv('TERMHUB_DB_POOL_RECYCLE_SECONDS', 1800))
+DB_POOL_PRE_PING = os.getenv('TERMHUB_DB_POOL_PRE_PING', 'true').lower() in ('1', 'true', 'yes')
+# insert_from_dicts() switches to COPY at this many rows; COPY sends this many rows at a time
+COPY_THRESHOLD_ROWS = int(os.getenv('TERMHUB_DB_COPY_THRESHOLD_ROWS', 1000))
+COPY_CHUNK_ROWS = int(os.getenv('TERMHUB_DB_COPY_CHUNK_ROWS', 10000))
+# Column sets of each table's unique constraints / indexes, by (engine, table OID); see has_unique_key()
+UNIQUE_KEYS: Dict[Tuple[Engine, int], List[Set[str]]] = {}
+EngineKey = Tuple[bool, str, str]
+ENGINES: Dict[EngineKey, Engine] = {}
+ENGINE_STATS: Dict[EngineKey, Dict[str, Union[int, float]]] = {}
+_ENGINES_LOCK = threading.Lock()
+_ENGINES_PID = os.getpid()
+
+
+def _new_engine_stats() -> Dict[str, Union[int, float]]:
+    """Counters for one engine's pool"""
+    return {'checkouts': 0, 'connects': 0, 'timeouts': 0, 'wait_seconds': 0.0, 'max_wait_seconds': 0.0,
+            'max_overflow_seen': 0}
+
+
+def get_engine(isolation_level='AUTOCOMMIT', schema: str = SCHEMA, local=False) -> Engine:
+    """Get the process-wide pooled engine for a database, schema, and isolation level, creating it on first use
+
+    Each new pooled connection has its search_path set to schema once, when it's opened. After a fork (e.g. gunicorn
+    preloading, multiprocessing), the child makes its own engines rather than sharing the parent's sockets."""
+    global _ENGINES_PID
+    key: EngineKey = (bool(local), schema or '', isolation_level)
+    with _ENGINES_LOCK:
+        if _ENGINES_PID != os.getpid():
+            for engine in ENGINES.values():
+                engine.dispose(close=False)
+            ENGINES.clear()
+            ENGINE_STATS.clear()
+            _ENGINES_PID = os.getpid()
+        engine = ENGINES.get(key)
+        if engine is not None:
+            return engine
+        engine = create_engine(
+            get_pg_connect_url(local), isolation_level=isolation_level, pool_size=DB_POOL_SIZE,
+            max_overflow=DB_POOL_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT_SECONDS,
+            pool_recycle=DB_POOL_RECYCLE_SECONDS, pool_pre_ping=DB_POOL_PRE_PING)
+        stats = ENGINE_STATS[key] = _new_engine_stats()
+
+        # noinspection PyUnusedLocal
+        @event.listens_for(engine, "connect", insert=True)
+        def set_search_path(dbapi_connection, connection_record):
+            """This does "set search_path to n3c;" when a pooled connection is opened.
+            https://docs.sqlalchemy.org/en/14/dialects/postgresql.html#setting-alternate-search-paths-on-connect
+            :param connection_record: Part of the example but we're not using yet."""
+            stats['connects'] += 1
+            if not schema:
+                return
+            existing_autocommit = dbapi_connection.autocommit
+            dbapi_connection.autocommit = True
+            cursor = dbapi_connection.cursor()
+            cursor.execute(f"SET SESSION search_path='{schema}'")
+            cursor.close()
+            dbapi_connection.autocommit = existing_autocommit
+
+        # noinspection PyUnusedLocal
+        @event.listens_for(engine, "checkout")
+        def count_checkout(dbapi_connection, connection_record, connection_proxy):
+            """Track checkouts, and the most overflow connections in use at once"""
+            stats['checkouts'] += 1
+            stats['max_overflow_seen'] = max(stats['max_overflow_seen'], engine.pool.overflow())
+
+        ENGINES[key] = engine
+        return engine
 
 
 # todo: make 'isolation_level' the final param, since we never override it. this would it so we dont' have to pass the
 #  other params as named params.
 def get_db_connection(isolation_level='AUTOCOMMIT', schema: str = SCHEMA, local=False) -> Connection:
-    """Get DB connection object.
+    """Get DB connection object, from a pooled engine. See get_engine().
+
+    Closing the connection, e.g. by using it as a context manager, returns it to the pool.
 
     :param local: If True, connection is on local instead of production database.
     """
-    engine = create_engine(get_pg_connect_url(local), isolation_level=isolation_level)
+    engine = get_engine(isolation_level, schema, local)
+    stats = ENGINE_STATS[(bool(local), schema or '', isolation_level)]
+    t0 = time.perf_counter()
+    try:
+        con = engine.connect()
+    except SATimeoutError:
+        stats['timeouts'] += 1
+        raise
+    wait = time.perf_counter() - t0
+    stats['wait_seconds'] += wait
+    stats['max_wait_seconds'] = max(stats['max_wait_seconds'], wait)
+    return con
+
+
+def get_engine_stats() -> List[Dict[str, Any]]:
+    """Pool status and counters of each engine: connections checked out and idle, overflow in use, checkouts, and time
+    spent waiting to get a connection (which includes opening new ones). Wait times aren't tracked for async engines."""
+    stats = []
+    engines: List[Tuple[EngineKey, Engine, bool]] = [(key, engine, False) for key, engine in list(ENGINES.items())]
+    for loop_engines in list(ASYNC_ENGINES.values()):
+        engines += [(key, engine.sync_engine, True) for key, engine in loop_engines.items()]
+    for (local, schema, isolation_level), engine, is_async in engines:
+        counters = (ASYNC_ENGINE_STATS if is_async else ENGINE_STATS).get(
+            (local, schema, isolation_level), _new_engine_stats())
+        pool = engine.pool
+        stats.append({
+            'async': is_async,
+            'local': local,
+            'schema': schema,
+            'isolation_level': isolation_level,
+            'pool_size': pool.size(),
+            'checked_out': pool.checkedout(),
+            'checked_in': pool.checkedin(),
+            'overflow': max(pool.overflow(), 0),
+            'max_overflow': DB_POOL_MAX_OVERFLOW,
+            **counters,
+            'wait_seconds': round(counters['wait_seconds'], 4),
+            'max_wait_seconds': round(counters['max_wait_seconds'], 4),
+            'mean_wait_seconds': round(counters['wait_seconds'] / counters['checkouts'], 4)
+                if counters['checkouts'] else None,
+        })
+    return stats
+
+
+# Async engines, for async routes, so that queries don't block the event loop. asyncpg connections belong to the event
+# loop they were opened on, so there's a registry per loop, which goes away with the loop.
+ASYNC_DB_DRIVER = os.getenv('TERMHUB_DB_ASYNC_DRIVER', 'asyncpg')
+ASYNC_ENGINES: 'WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[EngineKey, AsyncEngine]]' = WeakKeyDictionary()
+ASYNC_ENGINE_STATS: Dict[EngineKey, Dict[str, Union[int, float]]] = {}
+
+
+def get_async_engine(schema: str = SCHEMA, local=False) -> AsyncEngine:
+    """Get the pooled async engine for a database and schema, on the running event loop, creating it on first use. Uses
+    the same pool settings as get_engine(). search_path is set by the server when each pooled connection is opened."""
+    key: EngineKey = (bool(local), schema or '', 'AUTOCOMMIT')
+    loop = asyncio.get_running_loop()
+    engines = ASYNC_ENGINES.setdefault(loop, {})
+    engine = engines.get(key)
+    if engine is not None:
+        return engine
+    engine = create_async_engine(
+        get_pg_connect_url(local, ASYNC_DB_DRIVER), isolation_level='AUTOCOMMIT', pool_size=DB_POOL_SIZE,
+        max_overflow=DB_POOL_MAX_OVERFLOW, pool_timeout=DB_POOL_TIMEOUT_SECONDS, pool_recycle=DB_POOL_RECYCLE_SECONDS,
+        pool_pre_ping=DB_POOL_PRE_PING, connect_args={'server_settings': {'search_path': schema}} if schema else {})
+    stats = ASYNC_ENGINE_STATS.setdefault(key, _new_engine_stats())
 
     # noinspection PyUnusedLocal
-    @event.listens_for(engine, "connect", insert=True)
-    def set_search_path(dbapi_connection, connection_record):
-        """This does "set search_path to n3c;" when you connect.
-        https://docs.sqlalchemy.org/en/14/dialects/postgresql.html#setting-alternate-search-paths-on-connect
-        :param connection_record: Part of the example but we're not using yet.
-
-        Ideally, we'd want to be able to call this whenever we want. But cannot be called outside of context of
-        initializing a connection.
-        """
-        if not schema:
-            return
-        existing_autocommit = dbapi_connection.autocommit
-        dbapi_connection.autocommit = True
-        cursor = dbapi_connection.cursor()
-        cursor.execute(f"SET SESSION search_path='{schema}'")
-        cursor.close()
-        dbapi_connection.autocommit = existing_autocommit
+    @event.listens_for(engine.sync_engine, "connect")
+    def count_connect(dbapi_connection, connection_record):
+        """Track new connections"""
+        stats['connects'] += 1
+
+    # noinspection PyUnusedLocal
+    @event.listens_for(engine.sync_engine, "checkout")
+    def count_checkout(dbapi_connection, connection_record, connection_proxy):
+        """Track checkouts, and the most overflow connections in use at once"""
+        stats['checkouts'] += 1
+        stats['max_overflow_seen'] = max(stats['max_overflow_seen'], engine.sync_engine.pool.overflow())
+
+    engines[key] = engine
+    return engine
+
+
+def get_async_db_connection(schema: str = SCHEMA, local=False) -> AsyncConnection:
+    """Get async DB connection object, from a pooled engine. Use as `async with get_async_db_connection() as con:`,
+    which returns the connection to the pool at the end.
+
+    :param local: If True, connection is on local instead of production database."""
+    return get_async_engine(schema, local).connect()
+
+
+async def dispose_async_engines():
+    """Close the running event loop's pooled async connections"""
+    for engine in ASYNC_ENGINES.pop(asyncio.get_running_loop(), {}).values():
+        await engine.dispose()
+
 
-    return engine.connect()
+def dispose_engines():
+    """Close all pooled connections and forget the engines, e.g. before forking, or at shutdown"""
+    with _ENGINES_LOCK:
+        for engine in ENGINES.values():
+            engine.dispose()
+        ENGINES.clear()
+        ENGINE_STATS.clear()
 
 
 def chunk_list(input_list: List, chunk_size) -> List[List]:
@@ -569,6 +729,33 @@ def sql_query_single_col(*argv) -> List:
     return [r[0] for r in results]
 
 
+async def sql_query_async(
+    con: AsyncConnection, query: Union[text, str], params: Dict = {}, debug: bool = DEBUG, return_with_keys=True
+) -> Union[List[RowMapping], List[List[Any]]]:
+    """Async version of sql_query(), for use in async routes. See get_async_db_connection()."""
+    try:
+        query = text(query) if not isinstance(query, TextClause) else query
+        q: CursorResult = await con.execute(query, params) if params else await con.execute(query)
+        if debug:
+            print(f'{query}\n{json.dumps(params, indent=2)}')
+        if return_with_keys:
+            # noinspection PyTypeChecker
+            results: List[RowMapping] = q.mappings().all()  # Key value pairs
+            return results
+        # noinspection PyTypeChecker
+        results: List[Row] = q.fetchall()  # Row tuples, with additional properties
+        return [list(x) for x in results]
+    except (ProgrammingError, OperationalError) as err:
+        raise RuntimeError(
+            f'Got an error [{err}] executing the following statement:\n{query}, {json.dumps(params, indent=2)}')
+
+
+async def sql_query_single_col_async(*argv) -> List:
+    """Async version of sql_query_single_col()"""
+    results: List = await sql_query_async(*argv, return_with_keys=False)
+    return [r[0] for r in results]
+
+
 # todo: consider adding 'schema' param
 def delete_obj_by_composite_key(con, table: str, key_ids: Dict[str, Union[str, int]]):
     """Delete object by ID"""
@@ -649,23 +836,26 @@ def fix_jagged_rows(rows: List[Dict]) -> List[Dict]:
     return [{field: row.get(field, None) for field in fields} for row in rows]
 
 
-def update_from_dicts(con: Connection, table: str, rows: List[Dict]):
-    """Update rows in table from a list of dictionaries"""
-    pk: str = pkey(table)
-    rows = fix_jagged_rows(rows)
-    # todo: fully use parameterized queries to prevent SQL injection
-    key_vals: Dict[str, Any] = key_vals_for_sqlalchemy_query(rows)
-    values: str = value_str_for_sqlalchemy_query(rows)
-    fields: str = ', '.join([f'"{x}"' for x in rows[0].keys()])
-    field_set_str: str= ', '.join([f'"{x}" = v.{x}' for x in [x for x in rows[0].keys() if x != pk]])
-    statement = f"""
-        UPDATE {table}
-        SET {field_set_str}
-        FROM (VALUES
-            {values}
-        ) AS v({fields})
-        WHERE {table}.{pk} = v.{pk};"""
-    run_sql_update(con, statement, key_vals, handle_none_as_null_on_table=table)
+def update_from_dicts(con: Connection, table: str, rows: List[Dict], chunk_size: int = COPY_CHUNK_ROWS):
+    """Update rows in table from a list of dictionaries, matching on the primary key (from PKEYS)
+
+    Rows are COPYed into a staging table w/ the table's column types, and then applied w/ a single UPDATE ... FROM. So
+    None is NULL for any column type, and there's no limit on batch size. Fields missing from some rows are set to NULL
+    on those rows. If there are several rows for a key, the last one wins."""
+    pk_cols: List[str] = pkey_cols(table)
+    if not pk_cols:
+        raise ValueError(f'No primary key for {table} in PKEYS, so can\'t tell which rows to update.')
+    if not rows:
+        return
+    rows = dedupe_by_key(fix_jagged_rows(rows), pk_cols)
+    columns: List[str] = list(rows[0].keys())
+    field_set_str: str = ', '.join([f'"{x}" = s."{x}"' for x in columns if x not in pk_cols])
+    if not field_set_str:
+        return
+    join: str = ' AND '.join([f't."{k}" = s."{k}"' for k in pk_cols])
+    with staging_table(con, table, columns) as stage:
+        copy_rows(con, stage, rows, columns, chunk_size)
+        run_sql(con, f'UPDATE {table} t SET {field_set_str} FROM {stage} s WHERE {join};')
 
 
 def key_vals_for_sqlalchemy_query(rows: List[Dict]) -> Dict[str, Any]:
@@ -678,40 +868,186 @@ def value_str_for_sqlalchemy_query(rows: List[Dict]) -> str:
     return  ', '.join([f"({', '.join([':' + str(k) + str(i) for k in d.keys()])})" for i, d in enumerate(rows)])
 
 def insert_from_dicts(con: Connection, table: str, rows: List[Dict], skip_if_already_exists=True):
-    """Insert rows into table from a list of dictionaries"""
-    pk: str = pkey(table)
-    if skip_if_already_exists:
-        if pk and isinstance(pk, str):  # normal, single primary key
-            already_in_db: List[Dict] = get_objs_by_id(con, table, pk, [row[pk] for row in rows])
-            already_in_db_ids = set([row[pk] for row in already_in_db])
-            rows = [row for row in rows if row[pk] not in already_in_db_ids]
-        elif pk and isinstance(pk, list):  # composite key
-            already_in_db: List[Dict] = get_objs_by_composite_key(con, table, pk, rows)
-            already_in_db_ids = [[row[pk_n] for pk_n in pk] for row in already_in_db]
-            rows = [row for row in rows if [row[pk_n] for pk_n in pk] not in already_in_db_ids]
-    if rows:
-        rows = fix_jagged_rows(rows)
-        # todo: fully use parameterized queries to prevent SQL injection
-        key_vals: Dict[str, Any] = key_vals_for_sqlalchemy_query(rows)
-        values: str = value_str_for_sqlalchemy_query(rows)
-        statement = f"""INSERT INTO {table} ({', '.join([f'"{x}"' for x in rows[0].keys()])}) VALUES {values}"""
-        run_sql(con, statement, key_vals)
+    """Insert rows into table from a list of dictionaries
+
+    If skip_if_already_exists and the table has a primary key in PKEYS, rows whose keys are already in the table are
+    skipped, via upsert_from_dicts(). Batches of COPY_THRESHOLD_ROWS rows or more go through copy_from_dicts(), which is
+    much faster, and doesn't run into limits on the number of bind parameters."""
+    if not rows:
+        return
+    if skip_if_already_exists and pkey(table):
+        return upsert_from_dicts(con, table, rows)
+    if len(rows) >= COPY_THRESHOLD_ROWS:
+        return copy_from_dicts(con, table, rows, skip_if_already_exists=False)
+    rows = fix_jagged_rows(rows)
+    # todo: fully use parameterized queries to prevent SQL injection
+    key_vals: Dict[str, Any] = key_vals_for_sqlalchemy_query(rows)
+    values: str = value_str_for_sqlalchemy_query(rows)
+    statement = f"""INSERT INTO {table} ({', '.join([f'"{x}"' for x in rows[0].keys()])}) VALUES {values}"""
+    run_sql(con, statement, key_vals)
+
+
+def pkey_cols(table: str) -> List[str]:
+    """Primary key columns of table, from PKEYS. Empty if it has none."""
+    pk: Union[str, List[str]] = pkey(table)
+    return [pk] if isinstance(pk, str) and pk else list(pk or [])
+
+
+def has_unique_key(con: Connection, table: str, cols: List[str]) -> bool:
+    """Does table have a unique constraint or index on exactly cols? ON CONFLICT (cols) needs one.
+
+    Not all tables get their primary key in the DDL, so this is checked. The table's unique column sets are cached by
+    its OID, so a table that's recreated, e.g. by a refresh, is looked up again. Tables w/out any aren't cached, in case
+    a primary key is added to them later."""
+    oid: Union[int, None] = sql_query_single_col(con, 'SELECT to_regclass(:table)::oid;', {'table': table})[0]
+    if oid is None:
+        return False
+    cache_key = (con.engine, oid)
+    if cache_key not in UNIQUE_KEYS:
+        query = """
+            SELECT ARRAY(
+                SELECT a.attname::text FROM unnest(i.indkey::int2[]) k
+                JOIN pg_attribute a ON a.attrelid = i.indrelid AND a.attnum = k) AS cols
+            FROM pg_index i
+            WHERE i.indrelid = :oid AND i.indisunique AND i.indpred IS NULL;"""
+        indexes: List[List[Any]] = sql_query(con, query, {'oid': oid}, return_with_keys=False)
+        if not indexes:
+            return False
+        UNIQUE_KEYS[cache_key] = [set(row[0]) for row in indexes]
+    return set(cols) in UNIQUE_KEYS[cache_key]
+
+
+def on_conflict_clause(pk_cols: List[str], columns: List[str], update=False) -> str:
+    """ON CONFLICT clause for an upsert on pk_cols: skip rows whose key exists, or if update, overwrite the others"""
+    target: str = ', '.join([f'"{x}"' for x in pk_cols])
+    set_str: str = ', '.join([f'"{x}" = EXCLUDED."{x}"' for x in columns if x not in pk_cols])
+    if update and set_str:
+        return f'ON CONFLICT ({target}) DO UPDATE SET {set_str}'
+    return f'ON CONFLICT ({target}) DO NOTHING'
+
+
+def dedupe_by_key(rows: List[Dict], pk_cols: List[str]) -> List[Dict]:
+    """Drop rows w/ the same key as a later row. ON CONFLICT DO UPDATE can't affect a row twice in one statement."""
+    return list({tuple(row[k] for k in pk_cols): row for row in rows}.values())
+
+
+def upsert_from_dicts(con: Connection, table: str, rows: List[Dict], update=False):
+    """Insert rows into table, skipping, or if update, updating, those whose primary key (from PKEYS) already exists
+
+    Runs one INSERT ... ON CONFLICT, or for batches of COPY_THRESHOLD_ROWS rows or more, a COPY into
+    a staging table and one INSERT ... SELECT ... ON CONFLICT; see copy_from_dicts(). Tables w/out a unique constraint
+    on their key can't be updated this way; for those, existing keys are looked up and skipped instead."""
+    pk_cols: List[str] = pkey_cols(table)
+    if not pk_cols:
+        raise ValueError(f'No primary key for {table} in PKEYS, so can\'t tell which rows already exist.')
+    if not rows:
+        return
+    unique: bool = has_unique_key(con, table, pk_cols)
+    if update and not unique:
+        raise ValueError(f'{table} has no unique constraint on {pk_cols}, so its rows can\'t be upserted.')
+    rows = dedupe_by_key(rows, pk_cols) if update else rows
+    if len(rows) >= COPY_THRESHOLD_ROWS:
+        return copy_from_dicts(con, table, rows, update=update)
+    rows = fix_jagged_rows(rows)
+    conflict: str = on_conflict_clause(pk_cols, list(rows[0].keys()), update) if unique else ''
+    if not unique:
+        if len(pk_cols) == 1:
+            already_in_db: List[Dict] = get_objs_by_id(con, table, pk_cols[0], [row[pk_cols[0]] for row in rows])
+        else:
+            already_in_db: List[Dict] = get_objs_by_composite_key(con, table, pk_cols, rows)
+        already_in_db_keys: Set[Tuple] = set([tuple(row[k] for k in pk_cols) for row in already_in_db])
+        rows = [row for row in rows if tuple(row[k] for k in pk_cols) not in already_in_db_keys]
+        if not rows:
+            return
+    # todo: fully use parameterized queries to prevent SQL injection
+    key_vals: Dict[str, Any] = key_vals_for_sqlalchemy_query(rows)
+    values: str = value_str_for_sqlalchemy_query(rows)
+    statement = f"""
+        INSERT INTO {table} ({', '.join([f'"{x}"' for x in rows[0].keys()])})
+        VALUES {values}
+        {conflict}"""
+    run_sql(con, statement, key_vals)
+
+
+def copy_field(value: Any) -> str:
+    """Format a value as a field for COPY ... (FORMAT csv). None is unquoted and empty, which COPY reads as NULL.
+    Everything else is quoted, so empty strings stay empty strings."""
+    if value is None:
+        return ''
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    return '"' + str(value).replace('"', '""') + '"'
+
+
+def copy_chunks(rows: List[Dict], columns: List[str], chunk_size: int = COPY_CHUNK_ROWS):
+    """Yield rows as CSV text for COPY, chunk_size rows at a time, so that memory use is bounded"""
+    for chunk in chunk_list(rows, chunk_size):
+        yield io.StringIO(''.join([','.join([copy_field(row.get(col)) for col in columns]) + '\n' for row in chunk]))
+
+
+def copy_rows(con: Connection, table: str, rows: List[Dict], columns: List[str], chunk_size: int = COPY_CHUNK_ROWS):
+    """Stream rows into table via COPY FROM STDIN, in chunks"""
+    cols: str = ', '.join([f'"{x}"' for x in columns])
+    cursor = con.connection.cursor()
+    try:
+        for buffer in copy_chunks(rows, columns, chunk_size):
+            cursor.copy_expert(f'COPY {table} ({cols}) FROM STDIN WITH (FORMAT csv)', buffer)
+    finally:
+        cursor.close()
+
+
+@contextmanager
+def staging_table(con: Connection, table: str, columns: List[str]):
+    """Empty temporary table w/ columns of table, and their types, for COPYing rows into. Yields its name."""
+    stage = 'copy_stage_' + re.sub(r'\W', '_', table)
+    cols: str = ', '.join([f'"{x}"' for x in columns])
+    run_sql(con, f'DROP TABLE IF EXISTS pg_temp.{stage};')
+    # Temp tables live as long as the session, and pooled connections are reused, so drop it when done
+    run_sql(con, f'CREATE TEMP TABLE {stage} AS SELECT {cols} FROM {table} WITH NO DATA;')
+    try:
+        yield stage
+    finally:
+        run_sql(con, f'DROP TABLE IF EXISTS pg_temp.{stage};')
+
+
+def copy_from_dicts(
+    con: Connection, table: str, rows: List[Dict], skip_if_already_exists=True, chunk_size: int = COPY_CHUNK_ROWS,
+    update=False
+):
+    """Bulk insert rows into table from a list of dictionaries, via COPY
+
+    If skip_if_already_exists and the table has a primary key, rows are first copied into a temporary staging table, and
+    then inserted in a single INSERT ... SELECT, skipping those whose keys are already in the table, or if update,
+    updating them. That's an ON CONFLICT if the table has a unique constraint on the key, else a NOT EXISTS."""
+    if not rows:
+        return
+    columns: List[str] = list(dict.fromkeys([k for row in rows for k in row.keys()]))
+    pk_cols: List[str] = pkey_cols(table) if skip_if_already_exists or update else []
+    if not pk_cols:
+        copy_rows(con, table, rows, columns, chunk_size)
+        return
+    if has_unique_key(con, table, pk_cols):
+        condition: str = on_conflict_clause(pk_cols, columns, update)
+    elif update:
+        raise ValueError(f'{table} has no unique constraint on {pk_cols}, so its rows can\'t be upserted.')
+    else:
+        join: str = ' AND '.join([f't."{k}" = s."{k}"' for k in pk_cols])
+        condition: str = f'WHERE NOT EXISTS (SELECT 1 FROM {table} t WHERE {join})'
+    with staging_table(con, table, columns) as stage:
+        copy_rows(con, stage, rows, columns, chunk_size)
+        run_sql(con, f"""
+            INSERT INTO {table} ({', '.join([f'"{x}"' for x in columns])})
+            SELECT {', '.join([f's."{x}"' for x in columns])}
+            FROM {stage} s
+            {condition};""")
 
 
 def insert_from_dict(con: Connection, table: str, d: Union[Dict, List[Dict]], skip_if_already_exists=True):
     """Insert row into table from a dictionary"""
     if isinstance(d, list):
         return insert_from_dicts(con, table, d, skip_if_already_exists)
-    if skip_if_already_exists:  # todo: simplify logic as in insert_from_dicts()
-        pk: str = pkey(table)
-        if pk:
-            already_in_db = []
-            if isinstance(pk, str):  # normal, single primary key
-                already_in_db: List[List] = get_obj_by_id(con, table, pk, d[pk])
-            elif isinstance(pk, list):  # composite key
-                already_in_db: List[RowMapping] = get_obj_by_composite_key(con, table, pk, d)
-            if already_in_db:
-                return
+    if skip_if_already_exists and pkey(table):
+        return upsert_from_dicts(con, table, [d])
     query = f"""
     INSERT INTO {table} ({', '.join([f'"{x}"' for x in d.keys()])})
     VALUES ({', '.join([':' + str(k) for k in d.keys()])})"""
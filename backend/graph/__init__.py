@@ -0,0 +1 @@
+"""Relationship graph engine"""
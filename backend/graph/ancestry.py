@@ -0,0 +1,148 @@
+"""Lowest common ancestors, and the ancestors that connect disconnected concepts
+
+Concept sets often contain several unconnected subtrees. To show how they relate, the graph can be filled in with the
+ancestors that connect their roots to a common ancestor. Doing that with per-node ancestor scans was too slow, so it's
+done on a spanning forest of the graph, with precomputed tables:
+  - depth: Each node's minimum number of edges from a root, as in the `concept_depth` table of ddl-16.
+  - Tree parent: A parent one level less deep. Following tree parents gives a shortest path up to a root, so the
+    forest is a shortest-path tree of the DAG.
+  - Binary lifting table: up[k][v] is v's 2^k-th tree ancestor (roots are their own parents). Any ancestor of v along
+    its tree path is then found in log(depth) steps.
+The lowest common ancestor (LCA) of a set of nodes in the same tree is found by lifting them to the same depth and then
+lifting them all together, halving the step each time, while they're still different.
+
+Since the forest is a subset of the DAG, its LCA is a common ancestor of the nodes, but not always the lowest one in the
+DAG. Nodes in different trees of the forest have no LCA.
+"""
+from typing import Dict, List, Union
+
+import numpy as np
+
+from backend.graph.compact_graph import INDEX_DTYPE, CompactGraph, IdsLike, gather
+
+ANCESTRY_ARRAYS = ('anc_depth', 'anc_up')
+
+
+class AncestorIndex:
+    """Depths and binary lifting table over a shortest-path spanning forest of a CompactGraph's node indexes. See
+    module docstring.
+
+    :param depth: Depth of each node.
+    :param up: Array of shape (n_levels, n_nodes). up[k][v] is v's 2^k-th tree ancestor, or its root."""
+
+    def __init__(self, depth: np.ndarray, up: np.ndarray):
+        self.depth = depth
+        self.up = up
+
+    @classmethod
+    def build(cls, g: CompactGraph) -> 'AncestorIndex':
+        """Build index by breadth-first search from the roots. Nodes only reachable through cycles become roots."""
+        n = len(g)
+        depth = np.full(n, -1, dtype=INDEX_DTYPE)
+        parent = np.arange(n, dtype=INDEX_DTYPE)
+        frontier = np.flatnonzero(np.diff(g.rev_offsets) == 0).astype(INDEX_DTYPE)
+        depth[frontier] = 0
+        while len(frontier):
+            children = gather(g.fwd_offsets, g.fwd_targets, frontier)
+            parents = np.repeat(frontier, g.fwd_offsets[frontier + 1] - g.fwd_offsets[frontier])
+            new = depth[children] < 0
+            # Parents are in ascending order, so each child's tree parent is its lowest-numbered parent at this level
+            children, first = np.unique(children[new], return_index=True)
+            parent[children] = parents[new][first]
+            depth[children] = depth[frontier[0]] + 1
+            frontier = children.astype(INDEX_DTYPE)
+            if not len(frontier) and (depth < 0).any():
+                frontier = np.flatnonzero(depth < 0).astype(INDEX_DTYPE)
+                depth[frontier] = 0
+
+        n_levels = max(1, int(depth.max(initial=0)).bit_length())
+        up = np.empty((n_levels, n), dtype=INDEX_DTYPE)
+        up[0] = parent
+        for k in range(1, n_levels):
+            up[k] = up[k - 1][up[k - 1]]
+        return cls(depth, up)
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> 'AncestorIndex':
+        """From arrays as returned by arrays()"""
+        depth, up = arrays['anc_depth'], arrays['anc_up']
+        return cls(depth, up.reshape(len(up) // max(len(depth), 1), len(depth)))
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """Arrays, by name, for saving to a snapshot. The lifting table is flattened."""
+        return {'anc_depth': self.depth, 'anc_up': self.up.ravel()}
+
+    def lift(self, idx: np.ndarray, steps: np.ndarray) -> np.ndarray:
+        """Tree ancestor `steps` levels above each of idx. Steps must be no more than the nodes' depths."""
+        idx = np.asarray(idx, dtype=INDEX_DTYPE)
+        for k in range(len(self.up)):
+            idx = np.where((steps >> k) & 1 == 1, self.up[k][idx], idx)
+        return idx
+
+    def root(self, idx: np.ndarray) -> np.ndarray:
+        """Root of the tree of each of idx"""
+        idx = np.asarray(idx, dtype=INDEX_DTYPE)
+        return self.lift(idx, self.depth[idx]) if len(idx) else idx
+
+    def lowest_common_ancestor(self, idx: np.ndarray) -> int:
+        """LCA of the nodes of idx in the spanning forest, or -1 if they're in different trees. The LCA of a single node
+        is itself."""
+        nodes = np.unique(idx).astype(INDEX_DTYPE)
+        if not len(nodes):
+            return -1
+        if len(np.unique(self.root(nodes))) > 1:
+            return -1
+        depth = self.depth[nodes]
+        nodes = np.unique(self.lift(nodes, depth - depth.min()))
+        if len(nodes) == 1:
+            return int(nodes[0])
+        for k in reversed(range(len(self.up))):
+            lifted = np.unique(self.up[k][nodes])
+            if len(lifted) > 1:
+                nodes = lifted
+        return int(self.up[0][nodes[0]])
+
+    def connecting_nodes(self, idx: np.ndarray) -> np.ndarray:
+        """Nodes on the tree paths from each of idx up to the LCA of the nodes of idx in the same tree, including the
+        LCAs but not idx themselves. Nodes alone in their tree are left unconnected.
+
+        :return: Sorted node indexes."""
+        nodes = np.unique(idx).astype(INDEX_DTYPE)
+        roots = self.root(nodes)
+        tree_roots, tree_of, tree_sizes = np.unique(roots, return_inverse=True, return_counts=True)
+        lca = np.array([
+            self.lowest_common_ancestor(nodes[tree_of == i]) if tree_sizes[i] > 1 else -1
+            for i in range(len(tree_roots))], dtype=INDEX_DTYPE)
+        target = lca[tree_of]
+        connect = target >= 0
+        nodes, target = nodes[connect], target[connect]
+        steps = self.depth[nodes] - self.depth[target]
+        path: List[np.ndarray] = []
+        while len(nodes):
+            nodes, steps = self.up[0][nodes], steps - 1
+            path.append(nodes)
+            nodes, steps = nodes[steps > 0], steps[steps > 0]
+        result = np.unique(np.concatenate(path)) if path else np.empty(0, dtype=INDEX_DTYPE)
+        return np.setdiff1d(result, idx).astype(INDEX_DTYPE)
+
+
+def get_ancestor_index(g: CompactGraph) -> AncestorIndex:
+    """The graph's ancestor index, building it first if the graph doesn't have one"""
+    if g.ancestry is None:
+        g.ancestry = AncestorIndex.build(g)
+    return g.ancestry
+
+
+def lowest_common_ancestor(g: CompactGraph, ids: IdsLike) -> Union[int, None]:
+    """concept_id of the LCA of concept_ids in the graph's spanning forest. None if there's none, or none of the ids
+    are in the graph."""
+    idx = g.index_of(ids)
+    lca = get_ancestor_index(g).lowest_common_ancestor(idx[idx >= 0])
+    return int(g.node_ids[lca]) if lca >= 0 else None
+
+
+def connecting_ancestors(g: CompactGraph, ids: IdsLike) -> np.ndarray:
+    """concept_ids of the ancestors that connect concept_ids to their LCA, per tree of the graph's spanning forest.
+    See AncestorIndex.connecting_nodes()."""
+    idx = g.index_of(ids)
+    return g.node_ids[get_ancestor_index(g).connecting_nodes(idx[idx >= 0])]
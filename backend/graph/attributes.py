@@ -0,0 +1,151 @@
+"""Per-concept attribute columns, stored alongside the relationship graph
+
+`concept_graph()` needs each concept's vocabulary and standard_concept only to decide what to hide. Rather than query
+the DB for them on every request, they're loaded from `concepts_with_counts` along with the graph, as dictionary-encoded
+columns: each value is stored as a small int code, indexing into a list of the distinct values. Code 0 means NULL, or
+that the concept is unknown. Lookups by concept_id are a binary search over a sorted id array, as in CompactGraph.
+
+Covers all concepts, not just those with edges in the graph, since concept sets can contain concepts with no
+hierarchy relationships.
+"""
+from typing import Any, Dict, List, Union
+
+import numpy as np
+from sqlalchemy.engine.base import Connection
+
+from backend.graph.compact_graph import INDEX_DTYPE, IdsLike, as_id_array
+from backend.graph.ingest import copy_bigint_columns
+
+ATTRIBUTE_COLUMNS = ('vocabulary_id', 'standard_concept', 'domain_id', 'concept_class_id')
+ATTRIBUTE_ARRAY_PREFIX = 'attr_'
+
+
+def code_dtype(n_values: int) -> np.dtype:
+    """Smallest unsigned int dtype for codes 0 (NULL) to n_values"""
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if n_values <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    raise ValueError(f'Too many distinct values to encode: {n_values}')
+
+
+def sql_text_array(values: List[str]) -> str:
+    """Postgres text[] literal"""
+    quoted = ["'" + v.replace("'", "''") + "'" for v in values]
+    return f"ARRAY[{', '.join(quoted)}]::text[]"
+
+
+class NodeAttributes:
+    """Dictionary-encoded attribute columns for a sorted array of concept_ids
+
+    :param concept_ids: Sorted concept_ids.
+    :param codes: Attribute name -> array of codes, parallel to concept_ids. Code i > 0 means dictionaries[name][i - 1].
+    :param dictionaries: Attribute name -> list of distinct values."""
+
+    def __init__(self, concept_ids: np.ndarray, codes: Dict[str, np.ndarray], dictionaries: Dict[str, List[str]]):
+        self.concept_ids = concept_ids
+        self.codes = codes
+        self.dictionaries = dictionaries
+        self._code_lookup = {name: {v: i + 1 for i, v in enumerate(values)} for name, values in dictionaries.items()}
+
+    @classmethod
+    def from_values(cls, concept_ids: IdsLike, values: Dict[str, List[Union[str, None]]]) -> 'NodeAttributes':
+        """From parallel lists of concept_ids and attribute values, e.g. from a DataFrame"""
+        concept_ids = as_id_array(concept_ids)
+        order = np.argsort(concept_ids, kind='stable')
+        codes, dictionaries = {}, {}
+        for name, column in values.items():
+            dictionaries[name] = sorted({v for v in column if v is not None})
+            lookup = {v: i + 1 for i, v in enumerate(dictionaries[name])}
+            column_codes = np.array([lookup.get(v, 0) for v in column], dtype=code_dtype(len(lookup)))
+            codes[name] = column_codes[order]
+        return cls(concept_ids[order], codes, dictionaries)
+
+    @classmethod
+    def from_db(cls, con: Connection, table: str, columns=ATTRIBUTE_COLUMNS) -> 'NodeAttributes':
+        """Load from a table with concept_id and the attribute columns, e.g. concepts_with_counts
+
+        The distinct values of each column are queried first, and the columns are then streamed via binary COPY as
+        codes, so no per-row Python objects are created."""
+        dictionaries: Dict[str, List[str]] = {}
+        for name in columns:
+            cursor = con.connection.cursor()
+            try:
+                cursor.execute(f'SELECT DISTINCT {name}::text FROM {table} WHERE {name} IS NOT NULL ORDER BY 1')
+                dictionaries[name] = [row[0] for row in cursor.fetchall()]
+            finally:
+                cursor.close()
+        # Values added between the two queries get code 0, as if NULL
+        code_exprs = [
+            f'COALESCE(array_position({sql_text_array(dictionaries[name])}, {name}::text), 0)::bigint'
+            if dictionaries[name] else '0::bigint' for name in columns]
+        arrays = copy_bigint_columns(con, f"""
+            SELECT DISTINCT ON (concept_id) concept_id::bigint, {', '.join(code_exprs)}
+            FROM {table}
+            WHERE concept_id IS NOT NULL
+            ORDER BY concept_id""", 1 + len(columns))
+        codes = {
+            name: arr.astype(code_dtype(len(dictionaries[name]))) for name, arr in zip(columns, arrays[1:])}
+        return cls(arrays[0], codes, dictionaries)
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], dictionaries: Dict[str, List[str]]) -> 'NodeAttributes':
+        """From arrays as returned by arrays(), and dictionaries"""
+        return cls(
+            arrays[ATTRIBUTE_ARRAY_PREFIX + 'concept_ids'],
+            {name: arrays[ATTRIBUTE_ARRAY_PREFIX + name] for name in dictionaries}, dictionaries)
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """Arrays, by name, for saving to a snapshot. Save `dictionaries` too."""
+        return {
+            ATTRIBUTE_ARRAY_PREFIX + 'concept_ids': self.concept_ids,
+            **{ATTRIBUTE_ARRAY_PREFIX + name: codes for name, codes in self.codes.items()}}
+
+    def __len__(self) -> int:
+        return len(self.concept_ids)
+
+    def index_of(self, ids: IdsLike) -> np.ndarray:
+        """Map concept_ids to row indexes. Unknown ids map to -1."""
+        ids = as_id_array(ids)
+        if not len(self.concept_ids):
+            return np.full(len(ids), -1, dtype=INDEX_DTYPE)
+        idx = np.searchsorted(self.concept_ids, ids)
+        idx[idx >= len(self.concept_ids)] = 0
+        return np.where(self.concept_ids[idx] == ids, idx, -1).astype(INDEX_DTYPE)
+
+    def contains(self, ids: IdsLike) -> np.ndarray:
+        """Boolean mask of which of `ids` are known"""
+        return self.index_of(ids) >= 0
+
+    def get_codes(self, name: str, ids: IdsLike) -> np.ndarray:
+        """Codes of attribute `name` for each of ids. 0 for NULL or unknown ids."""
+        idx = self.index_of(ids)
+        codes = np.zeros(len(idx), dtype=self.codes[name].dtype)
+        codes[idx >= 0] = self.codes[name][idx[idx >= 0]]
+        return codes
+
+    def code_of(self, name: str, value: Union[str, None]) -> int:
+        """Code of a value of attribute `name`; 0 for None, -1 if not a known value"""
+        return 0 if value is None else self._code_lookup[name].get(value, -1)
+
+    def decode(self, name: str, codes: np.ndarray) -> List[Union[str, None]]:
+        """Values for codes of attribute `name`"""
+        values = [None] + list(self.dictionaries[name])
+        return [values[c] for c in codes.tolist()]
+
+    def is_in(self, name: str, values: List[Union[str, None]], ids: IdsLike) -> np.ndarray:
+        """Boolean mask of which of `ids` have one of `values` for attribute `name`"""
+        wanted = [c for c in (self.code_of(name, v) for v in values) if c >= 0]
+        return np.isin(self.get_codes(name, ids), wanted)
+
+    def records(self, ids: IdsLike, names: List[str] = None) -> List[Dict[str, Any]]:
+        """Known ids' attributes as dicts with concept_id and each attribute, like rows of concepts_with_counts"""
+        ids = as_id_array(ids)
+        ids = ids[self.contains(ids)]
+        names = names or list(self.codes)
+        columns = {name: self.decode(name, self.get_codes(name, ids)) for name in names}
+        return [
+            {'concept_id': cid, **{name: columns[name][i] for name in names}} for i, cid in enumerate(ids.tolist())]
+
+    def nbytes(self) -> int:
+        """Total size of the arrays, in bytes"""
+        return sum(a.nbytes for a in self.arrays().values())
@@ -0,0 +1,287 @@
+"""Compact relationship graph
+
+The OMOP hierarchy (the `concept_graph` table) has millions of edges. Holding it as a networkx DiGraph costs gigabytes of
+dict-of-dicts per worker. CompactGraph instead holds it as flat numpy arrays:
+- node_ids: Sorted concept_ids. The position of a concept_id in this array is its node index. Lookups from concept_id
+  to index are done via binary search (np.searchsorted), so no dict is needed.
+- CSR (forward / parent -> child): fwd_offsets[i]:fwd_offsets[i + 1] slices fwd_targets to get the children of node i.
+- CSC (reverse / child -> parent): rev_offsets[i]:rev_offsets[i + 1] slices rev_sources to get the parents of node i.
+Neighbor arrays hold int32 node indexes, not concept_ids.
+"""
+from typing import Iterable, List, Set, Union
+
+import numpy as np
+
+ID_DTYPE = np.int64
+INDEX_DTYPE = np.int32
+OFFSET_DTYPE = np.int64
+IdsLike = Union[np.ndarray, List[int], Set[int], Iterable[int]]
+
+
+def as_id_array(ids: IdsLike) -> np.ndarray:
+    """Convert any collection of concept_ids into a 1d int64 array"""
+    if isinstance(ids, np.ndarray):
+        return ids.astype(ID_DTYPE, copy=False).ravel()
+    if not isinstance(ids, (list, tuple)):
+        ids = list(ids)
+    return np.asarray(ids, dtype=ID_DTYPE).ravel()
+
+
+def build_offsets(keys: np.ndarray, n: int) -> np.ndarray:
+    """Build CSR offsets from a sorted array of row indexes"""
+    offsets = np.zeros(n + 1, dtype=OFFSET_DTYPE)
+    np.cumsum(np.bincount(keys, minlength=n), out=offsets[1:])
+    return offsets
+
+
+def expand_ranges(starts: np.ndarray, lengths: np.ndarray) -> np.ndarray:
+    """Concatenate arange(start, start + length) for each start, length pair, without a Python loop"""
+    total = int(lengths.sum())
+    if not total:
+        return np.empty(0, dtype=OFFSET_DTYPE)
+    # position of each output element within its own range, plus the start of that range
+    range_starts_in_output = np.cumsum(lengths) - lengths
+    positions = np.arange(total, dtype=OFFSET_DTYPE) - np.repeat(range_starts_in_output, lengths)
+    return np.repeat(starts, lengths).astype(OFFSET_DTYPE, copy=False) + positions
+
+
+def gather(offsets: np.ndarray, neighbors: np.ndarray, idx: np.ndarray) -> np.ndarray:
+    """Concatenate neighbors[offsets[i]:offsets[i + 1]] for every i in idx, without a Python loop"""
+    starts = offsets[idx]
+    return neighbors[expand_ranges(starts, offsets[idx + 1] - starts)]
+
+
+class CompactGraph:
+    """Directed graph over concept_ids, stored as int32 CSR/CSC arrays.
+
+    Mirrors the subset of the networkx DiGraph API that TermHub uses, so it can replace the networkx relationship graph."""
+
+    def __init__(
+        self, node_ids: np.ndarray, fwd_offsets: np.ndarray, fwd_targets: np.ndarray, rev_offsets: np.ndarray,
+        rev_sources: np.ndarray, reachability=None, attributes=None, ancestry=None, components=None
+    ):
+        self.node_ids = node_ids
+        self.fwd_offsets = fwd_offsets
+        self.fwd_targets = fwd_targets
+        self.rev_offsets = rev_offsets
+        self.rev_sources = rev_sources
+        # Optional ReachabilityIndex, for fast transitive queries. Graphs derived from this one don't inherit it.
+        self.reachability = reachability
+        # Optional NodeAttributes, e.g. vocabulary_id, for all concepts, not only those in the graph
+        self.attributes = attributes
+        # Optional AncestorIndex, for lowest common ancestors. Graphs derived from this one don't inherit it.
+        self.ancestry = ancestry
+        # Optional ComponentIndex, for weakly connected components. Graphs derived from this one don't inherit it.
+        self.components = components
+        # Content hash of the snapshot the graph was loaded from, if it was. Set by load_graph_snapshot().
+        self.content_hash: Union[str, None] = None
+
+    @classmethod
+    def from_edges(cls, sources: IdsLike, targets: IdsLike) -> 'CompactGraph':
+        """Build graph from parallel arrays of source (parent) and target (child) concept_ids.
+
+        Duplicate edges are dropped, as with networkx.DiGraph.add_edges_from()."""
+        sources, targets = as_id_array(sources), as_id_array(targets)
+        if len(sources) != len(targets):
+            raise ValueError(f'sources and targets differ in length: {len(sources)} vs {len(targets)}')
+        node_ids: np.ndarray = np.unique(np.concatenate([sources, targets]))
+        n = len(node_ids)
+        src_idx = np.searchsorted(node_ids, sources).astype(INDEX_DTYPE)
+        tgt_idx = np.searchsorted(node_ids, targets).astype(INDEX_DTYPE)
+        # Sort by (source, target) and dedupe in one pass
+        keys = np.unique(src_idx.astype(np.int64) * max(n, 1) + tgt_idx)
+        src_idx = (keys // max(n, 1)).astype(INDEX_DTYPE)
+        tgt_idx = (keys % max(n, 1)).astype(INDEX_DTYPE)
+        # Forward (CSR): already sorted by source
+        fwd_offsets = build_offsets(src_idx, n)
+        # Reverse (CSC): stable sort by target keeps each node's parents sorted
+        order = np.argsort(tgt_idx, kind='stable')
+        rev_offsets = build_offsets(tgt_idx[order], n)
+        return cls(node_ids, fwd_offsets, tgt_idx, rev_offsets, src_idx[order])
+
+    # Basic properties -------------------------------------------------------------------------------------------------
+    def __len__(self) -> int:
+        return len(self.node_ids)
+
+    def __contains__(self, concept_id: int) -> bool:
+        return self.has_node(concept_id)
+
+    @property
+    def nodes(self) -> np.ndarray:
+        """All concept_ids in the graph"""
+        return self.node_ids
+
+    @property
+    def edges(self) -> np.ndarray:
+        """All edges as an (n_edges, 2) array of (source, target) concept_ids"""
+        src_idx = np.repeat(np.arange(len(self), dtype=INDEX_DTYPE), np.diff(self.fwd_offsets))
+        return np.column_stack([self.node_ids[src_idx], self.node_ids[self.fwd_targets]])
+
+    def number_of_edges(self) -> int:
+        """Number of edges"""
+        return len(self.fwd_targets)
+
+    def out_degree(self, ids: IdsLike = None) -> np.ndarray:
+        """Number of children of each of `ids` (or of every node, if not passed). Unknown ids have degree 0."""
+        if ids is None:
+            return np.diff(self.fwd_offsets)
+        idx = self.index_of(ids)
+        found = idx >= 0
+        degrees = np.zeros(len(idx), dtype=OFFSET_DTYPE)
+        degrees[found] = self.fwd_offsets[idx[found] + 1] - self.fwd_offsets[idx[found]]
+        return degrees
+
+    # Lookups ----------------------------------------------------------------------------------------------------------
+    def index_of(self, ids: IdsLike) -> np.ndarray:
+        """Map concept_ids to node indexes. Ids not in the graph map to -1."""
+        ids = as_id_array(ids)
+        if not len(self.node_ids):
+            return np.full(len(ids), -1, dtype=INDEX_DTYPE)
+        idx = np.searchsorted(self.node_ids, ids)
+        idx[idx >= len(self.node_ids)] = 0
+        found = self.node_ids[idx] == ids
+        return np.where(found, idx, -1).astype(INDEX_DTYPE)
+
+    def has_node(self, concept_id: int) -> bool:
+        """Is concept_id in the graph?"""
+        return bool(self.index_of([concept_id])[0] >= 0)
+
+    def contains(self, ids: IdsLike) -> np.ndarray:
+        """Boolean mask of which of `ids` are in the graph"""
+        return self.index_of(ids) >= 0
+
+    # Traversal --------------------------------------------------------------------------------------------------------
+    def _neighbors(self, offsets: np.ndarray, neighbors: np.ndarray, ids: IdsLike) -> np.ndarray:
+        """Union of neighbors of ids, as sorted unique concept_ids"""
+        idx = self.index_of(ids)
+        idx = idx[idx >= 0]
+        return self.node_ids[np.unique(gather(offsets, neighbors, idx))]
+
+    def successors(self, concept_id: int) -> np.ndarray:
+        """Children of a concept"""
+        return self._neighbors(self.fwd_offsets, self.fwd_targets, [concept_id])
+
+    def predecessors(self, concept_id: int) -> np.ndarray:
+        """Parents of a concept"""
+        return self._neighbors(self.rev_offsets, self.rev_sources, [concept_id])
+
+    def successors_of(self, ids: IdsLike) -> np.ndarray:
+        """Union of the children of several concepts"""
+        return self._neighbors(self.fwd_offsets, self.fwd_targets, ids)
+
+    def predecessors_of(self, ids: IdsLike) -> np.ndarray:
+        """Union of the parents of several concepts"""
+        return self._neighbors(self.rev_offsets, self.rev_sources, ids)
+
+    def _reachable(self, offsets: np.ndarray, neighbors: np.ndarray, ids: IdsLike, depth: int = None) -> np.ndarray:
+        """Level-synchronous BFS. Returns concept_ids reachable from ids in 1..depth steps (all steps if depth None)."""
+        idx = self.index_of(ids)
+        frontier = np.unique(idx[idx >= 0])
+        seen = np.zeros(len(self), dtype=bool)
+        level = 0
+        while len(frontier) and (depth is None or level < depth):
+            nxt = gather(offsets, neighbors, frontier)
+            nxt = np.unique(nxt[~seen[nxt]])
+            seen[nxt] = True
+            frontier = nxt
+            level += 1
+        return self.node_ids[seen]
+
+    def descendants(self, ids: IdsLike, depth: int = None) -> np.ndarray:
+        """Descendants of ids, to `depth` levels (all levels if None). Does not include ids themselves unless reachable
+        from another of the ids.
+
+        Uses the reachability index, if there is one, for all levels. Depth-limited queries are a BFS, whose cost is
+        proportional to the edges within `depth` levels."""
+        if depth is None and self.reachability is not None:
+            idx = self.index_of(ids)
+            return self.node_ids[self.reachability.descendants(idx[idx >= 0])]
+        return self._reachable(self.fwd_offsets, self.fwd_targets, ids, depth)
+
+    def ancestors(self, ids: IdsLike, depth: int = None) -> np.ndarray:
+        """Ancestors of ids, to `depth` levels (all levels if None)"""
+        return self._reachable(self.rev_offsets, self.rev_sources, ids, depth)
+
+    def is_ancestor(self, ancestor: int, descendant: int) -> bool:
+        """Is there a path from concept `ancestor` to concept `descendant`?"""
+        idx = self.index_of([ancestor, descendant])
+        if (idx < 0).any():
+            return False
+        if self.reachability is not None:
+            return self.reachability.is_ancestor(int(idx[0]), int(idx[1]))
+        return bool(np.isin(descendant, self.descendants([ancestor])))
+
+    # Subgraphs --------------------------------------------------------------------------------------------------------
+    def _induced(self, ids: IdsLike):
+        """Node indexes of the ids in the graph, sorted, and the (source, target) node indexes of the edges among them.
+
+        Membership is a bitmap over all nodes, so filtering each node's CSR slice of children is a single lookup per
+        edge, and edges come out in CSR order, i.e. sorted by source, then target."""
+        idx = self.index_of(ids)
+        member = np.zeros(len(self), dtype=bool)
+        member[idx[idx >= 0]] = True
+        idx = np.flatnonzero(member).astype(INDEX_DTYPE)
+        src_idx = np.repeat(idx, self.fwd_offsets[idx + 1] - self.fwd_offsets[idx])
+        tgt_idx = gather(self.fwd_offsets, self.fwd_targets, idx)
+        keep = member[tgt_idx]
+        return idx, src_idx[keep], tgt_idx[keep]
+
+    def induced_edges(self, ids: IdsLike) -> np.ndarray:
+        """Edges between nodes of `ids`, as an (n_edges, 2) array of (source, target) concept_ids. Same as
+        subgraph(ids).edges, without building the subgraph."""
+        _, src_idx, tgt_idx = self._induced(ids)
+        return np.column_stack([self.node_ids[src_idx], self.node_ids[tgt_idx]])
+
+    def subgraph(self, ids: IdsLike) -> 'CompactGraph':
+        """Induced subgraph: the nodes of `ids` that are in the graph, and all edges between them.
+
+        Unlike networkx, this returns an independent graph, not a view."""
+        idx, src_idx, tgt_idx = self._induced(ids)
+        # Renumber into the subgraph. idx is sorted, so this keeps edges sorted, and nodes w/ no edges inside the
+        # subgraph are still part of it, as with networkx.
+        n = len(idx)
+        src_idx = np.searchsorted(idx, src_idx).astype(INDEX_DTYPE)
+        tgt_idx = np.searchsorted(idx, tgt_idx).astype(INDEX_DTYPE)
+        order = np.argsort(tgt_idx, kind='stable')
+        return CompactGraph(
+            self.node_ids[idx], build_offsets(src_idx, n), tgt_idx, build_offsets(tgt_idx[order], n), src_idx[order])
+
+    # Updates ----------------------------------------------------------------------------------------------------------
+    def apply_delta(
+        self, added_sources: IdsLike, added_targets: IdsLike, removed_sources: IdsLike, removed_targets: IdsLike
+    ) -> 'CompactGraph':
+        """New graph with edges added and removed, equal to rebuilding from the updated edge list.
+
+        Removing an edge that isn't in the graph is a no-op, and nodes left with no edges are dropped, as they would be
+        from a rebuild."""
+        removed_idx_src, removed_idx_tgt = self.index_of(removed_sources), self.index_of(removed_targets)
+        found = (removed_idx_src >= 0) & (removed_idx_tgt >= 0)
+        n = max(len(self), 1)
+        removed_keys = np.unique(removed_idx_src[found].astype(np.int64) * n + removed_idx_tgt[found])
+        src_idx = np.repeat(np.arange(len(self), dtype=INDEX_DTYPE), np.diff(self.fwd_offsets))
+        # edge keys are sorted, by construction in from_edges()
+        keep = ~np.isin(src_idx.astype(np.int64) * n + self.fwd_targets, removed_keys, assume_unique=True)
+        return CompactGraph.from_edges(
+            np.concatenate([self.node_ids[src_idx[keep]], as_id_array(added_sources)]),
+            np.concatenate([self.node_ids[self.fwd_targets[keep]], as_id_array(added_targets)]))
+
+    def with_nodes(self, ids: IdsLike) -> 'CompactGraph':
+        """Copy of graph with additional, possibly isolated, nodes"""
+        node_ids = np.union1d(self.node_ids, as_id_array(ids))
+        n = len(node_ids)
+        remap = np.searchsorted(node_ids, self.node_ids).astype(INDEX_DTYPE)
+        fwd_degree, rev_degree = np.zeros(n, dtype=OFFSET_DTYPE), np.zeros(n, dtype=OFFSET_DTYPE)
+        fwd_degree[remap] = np.diff(self.fwd_offsets)
+        rev_degree[remap] = np.diff(self.rev_offsets)
+        fwd_offsets, rev_offsets = np.zeros(n + 1, dtype=OFFSET_DTYPE), np.zeros(n + 1, dtype=OFFSET_DTYPE)
+        np.cumsum(fwd_degree, out=fwd_offsets[1:])
+        np.cumsum(rev_degree, out=rev_offsets[1:])
+        return CompactGraph(node_ids, fwd_offsets, remap[self.fwd_targets], rev_offsets, remap[self.rev_sources])
+
+    def nbytes(self) -> int:
+        """Total size of the graph's arrays, in bytes"""
+        return sum(a.nbytes for a in (
+            self.node_ids, self.fwd_offsets, self.fwd_targets, self.rev_offsets, self.rev_sources))
+
+    def __repr__(self) -> str:
+        return f'CompactGraph(nodes={len(self):,}, edges={self.number_of_edges():,})'
@@ -0,0 +1,119 @@
+"""Weakly connected components of the relationship graph, and the roots of each
+
+Two concepts are in the same weakly connected component if they're linked by a chain of edges in either direction, i.e.
+if they're part of the same hierarchy. With component labels and each component's roots precomputed and stored in the
+snapshot, questions like "do these concept sets share any hierarchy" or "which roots does this selection hang from" are
+array lookups rather than traversals of an undirected copy of the graph.
+
+Components are labeled by min-label propagation with pointer jumping: each component's label converges to its lowest
+node index, in a number of vectorized rounds that's logarithmic in the component size for typical graphs. Labels are
+then renumbered 0..n_components - 1.
+"""
+from typing import Dict
+
+import numpy as np
+
+from backend.graph.compact_graph import INDEX_DTYPE, CompactGraph, IdsLike, as_id_array, build_offsets, expand_ranges
+
+COMPONENT_ARRAYS = ('comp_labels', 'comp_root_offsets', 'comp_roots')
+
+
+def component_labels(g: CompactGraph) -> np.ndarray:
+    """Weakly connected component label of each node: the lowest node index in its component"""
+    label = np.arange(len(g), dtype=INDEX_DTYPE)
+    src = np.repeat(np.arange(len(g), dtype=INDEX_DTYPE), np.diff(g.fwd_offsets))
+    tgt = g.fwd_targets
+    while True:
+        # Hook: point each edge's higher root at the lower one, taking the lowest where a root gets several
+        lo, hi = np.minimum(label[src], label[tgt]), np.maximum(label[src], label[tgt])
+        differ = lo != hi
+        if not differ.any():
+            return label
+        lo, hi = lo[differ], hi[differ]
+        order = np.lexsort((lo, hi))
+        lo, hi = lo[order], hi[order]
+        first = np.ones(len(hi), dtype=bool)
+        first[1:] = hi[1:] != hi[:-1]
+        label[hi[first]] = np.minimum(label[hi[first]], lo[first])
+        # Pointer jumping: point every node straight at its root
+        while True:
+            jumped = label[label]
+            if (jumped == label).all():
+                break
+            label = jumped
+        # Only edges that still span two labels need another round
+        src, tgt = src[differ], tgt[differ]
+
+
+class ComponentIndex:
+    """Component of each node of a CompactGraph, and the roots (nodes w/ no parents) of each component
+
+    :param labels: Component of each node, 0..n_components - 1, numbered in order of their lowest node index.
+    :param root_offsets: root_offsets[c]:root_offsets[c + 1] slices roots to get the roots of component c.
+    :param roots: Node indexes of roots, by component. Components that are all cycle have none."""
+
+    def __init__(self, labels: np.ndarray, root_offsets: np.ndarray, roots: np.ndarray):
+        self.labels = labels
+        self.root_offsets = root_offsets
+        self.roots = roots
+
+    @classmethod
+    def build(cls, g: CompactGraph) -> 'ComponentIndex':
+        """Build index"""
+        _, labels = np.unique(component_labels(g), return_inverse=True)
+        labels = labels.astype(INDEX_DTYPE)
+        n_components = int(labels.max()) + 1 if len(labels) else 0
+        roots = np.flatnonzero(np.diff(g.rev_offsets) == 0).astype(INDEX_DTYPE)
+        roots = roots[np.argsort(labels[roots], kind='stable')]
+        return cls(labels, build_offsets(labels[roots], n_components), roots)
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> 'ComponentIndex':
+        """From arrays as returned by arrays()"""
+        return cls(*[arrays[name] for name in COMPONENT_ARRAYS])
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """Arrays, by name, for saving to a snapshot"""
+        return dict(zip(COMPONENT_ARRAYS, (self.labels, self.root_offsets, self.roots)))
+
+    def n_components(self) -> int:
+        """Number of components"""
+        return len(self.root_offsets) - 1
+
+    def component_roots(self, components: np.ndarray) -> np.ndarray:
+        """Node indexes of the roots of components"""
+        components = np.unique(components)
+        starts = self.root_offsets[components]
+        return self.roots[expand_ranges(starts, self.root_offsets[components + 1] - starts)]
+
+
+def get_component_index(g: CompactGraph) -> ComponentIndex:
+    """The graph's component index, building it first if the graph doesn't have one"""
+    if g.components is None:
+        g.components = ComponentIndex.build(g)
+    return g.components
+
+
+def component_ids(g: CompactGraph, ids: IdsLike) -> np.ndarray:
+    """Component of each of concept_ids; -1 for those not in the graph"""
+    idx = g.index_of(ids)
+    labels = np.full(len(idx), -1, dtype=INDEX_DTYPE)
+    labels[idx >= 0] = get_component_index(g).labels[idx[idx >= 0]]
+    return labels
+
+
+def share_component(g: CompactGraph, ids_a: IdsLike, ids_b: IdsLike) -> bool:
+    """Are any concepts of ids_a in the same hierarchy (component) as any of ids_b?"""
+    a, b = component_ids(g, ids_a), component_ids(g, ids_b)
+    return bool(np.isin(a[a >= 0], b[b >= 0]).any())
+
+
+def component_roots(g: CompactGraph, ids: IdsLike) -> np.ndarray:
+    """Sorted concept_ids of the roots of the hierarchies (components) that concept_ids are part of"""
+    components = component_ids(g, ids)
+    return np.sort(g.node_ids[get_component_index(g).component_roots(components[components >= 0])])
+
+
+def in_components(g: CompactGraph, ids: IdsLike, components: IdsLike) -> np.ndarray:
+    """Boolean mask of which of concept_ids are in one of the components"""
+    return np.isin(component_ids(g, ids), as_id_array(components))
@@ -0,0 +1,87 @@
+"""Vectorized hiding of concepts by vocabulary and standard_concept
+
+`concept_graph()` hides concepts of some vocabularies, and optionally non-standard concepts. Rather than scan a list of
+concept dicts once per hidden vocab, concepts are passed as parallel arrays:
+  - ids: concept_ids
+  - vocabs: Vocabulary code of each concept, indexing into a list of vocabulary names. Code 0 is NULL, as in
+    NodeAttributes, so codes from the graph's node attributes can be used as is.
+  - standard: Whether each concept's standard_concept is 'S'
+and all masks and per-vocab groups are computed in one pass.
+"""
+from typing import Any, Dict, List, Mapping, Sequence, Set, Tuple, Union
+
+import numpy as np
+
+from backend.graph.attributes import NodeAttributes
+from backend.graph.compact_graph import ID_DTYPE, IdsLike, as_id_array
+
+ConceptArrays = Tuple[np.ndarray, np.ndarray, np.ndarray, List[Union[str, None]]]
+
+
+def encode_concepts(
+    concepts: Sequence[Mapping[str, Any]], vocab_names: List[Union[str, None]] = None
+) -> ConceptArrays:
+    """Concept records, with concept_id, vocabulary_id, and standard_concept, as parallel arrays
+
+    :param vocab_names: Existing vocabulary names to encode with, e.g. to combine with arrays from node attributes.
+     Vocabularies not in it are appended.
+    :return: (ids, vocabs, standard, vocab_names)"""
+    vocab_names = list(vocab_names) if vocab_names else [None]
+    lookup = {v: i for i, v in enumerate(vocab_names)}
+    for c in concepts:
+        if c['vocabulary_id'] not in lookup:
+            lookup[c['vocabulary_id']] = len(vocab_names)
+            vocab_names.append(c['vocabulary_id'])
+    n = len(concepts)
+    ids = np.fromiter((c['concept_id'] for c in concepts), dtype=ID_DTYPE, count=n)
+    vocabs = np.fromiter((lookup[c['vocabulary_id']] for c in concepts), dtype=np.int32, count=n)
+    standard = np.fromiter((c['standard_concept'] == 'S' for c in concepts), dtype=bool, count=n)
+    return ids, vocabs, standard, vocab_names
+
+
+def attribute_arrays(attributes: NodeAttributes, ids: IdsLike) -> ConceptArrays:
+    """Parallel arrays for those of ids that the node attributes cover, in the same order"""
+    ids = as_id_array(ids)
+    ids = ids[attributes.contains(ids)]
+    return (
+        ids, attributes.get_codes('vocabulary_id', ids), attributes.is_in('standard_concept', ['S'], ids),
+        [None] + list(attributes.dictionaries['vocabulary_id']))
+
+
+def concat_concept_arrays(a: ConceptArrays, b: ConceptArrays) -> ConceptArrays:
+    """Concatenate parallel arrays. b's vocab_names must start with a's, as when b is encoded with a's names."""
+    if b[3][:len(a[3])] != a[3]:
+        raise ValueError('Vocabulary codes of the arrays to concatenate do not match')
+    return (
+        np.concatenate([a[0], b[0]]), np.concatenate([a[1].astype(np.int32), b[1].astype(np.int32)]),
+        np.concatenate([a[2], b[2]]), b[3])
+
+
+def filter_concept_arrays(
+    ids: np.ndarray, vocabs: np.ndarray, standard: np.ndarray, vocab_names: List[Union[str, None]],
+    hide_vocabs: List[str], hide_nonstandard_concepts=False
+) -> Tuple[np.ndarray, Dict[str, Set[int]], Set[int]]:
+    """Find concepts to hide by vocabulary, and non-standard concepts if hide_nonstandard_concepts
+
+    :return: (keep, hidden_by_voc, nonstandard_concepts_hidden). keep: Boolean mask of the concepts that aren't
+     hidden; ids[keep] are the filtered concept_ids. hidden_by_voc: Map of vocab to set of concept ids, for the vocabs
+     of hide_vocabs that any concepts have, in hide_vocabs order."""
+    codes = {v: i for i, v in enumerate(vocab_names)}
+    hide_codes = np.array([codes[v] for v in hide_vocabs if v in codes], dtype=np.int32)
+    vocab_hidden = np.isin(vocabs, hide_codes)
+
+    # Group hidden ids by vocab: sort by code, then split where the code changes
+    hidden_ids, hidden_codes = ids[vocab_hidden], vocabs[vocab_hidden]
+    order = np.argsort(hidden_codes, kind='stable')
+    group_codes, starts = np.unique(hidden_codes[order], return_index=True)
+    groups = np.split(hidden_ids[order], starts[1:])
+    by_code = {int(code): set(group.tolist()) for code, group in zip(group_codes, groups)}
+    hidden_by_voc: Dict[str, Set[int]] = {
+        vocab: by_code[codes[vocab]] for vocab in hide_vocabs if vocab in codes and codes[vocab] in by_code}
+
+    nonstandard_hidden = ~standard if hide_nonstandard_concepts else np.zeros(len(ids), dtype=bool)
+    nonstandard_concepts_hidden: Set[int] = set(ids[nonstandard_hidden].tolist())
+
+    # Hide by id, so that if an id appears more than once, all of its entries are hidden
+    keep = ~np.isin(ids, ids[vocab_hidden | nonstandard_hidden])
+    return keep, hidden_by_voc, nonstandard_concepts_hidden
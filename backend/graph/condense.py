@@ -0,0 +1,78 @@
+"""Condensation of super nodes: concepts with more children than the frontend can usefully render
+
+A super node's children that are leaves of the graph and have no other parent in it (so that hiding them loses no
+other structure) are collapsed into one placeholder child. Its id is the negative of the super node's concept_id, which
+can't collide with a real concept_id. Once packed w/ pack_collapsed(), the collapsed children can be fetched a page at a
+time w/ collapsed_page().
+"""
+from typing import Dict, Tuple
+
+import numpy as np
+
+from backend.graph.compact_graph import INDEX_DTYPE, CompactGraph
+
+
+def placeholder_id(super_node: int) -> int:
+    """concept_id of the placeholder that a super node's children are collapsed into"""
+    return -super_node
+
+
+def find_collapsible(sg: CompactGraph, threshold: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Edges from super nodes (out-degree > threshold) to children that can be collapsed: leaves with no other parent.
+
+    :return: (super_idx, child_idx) node index arrays, sorted by super node, then child."""
+    out_degree, in_degree = np.diff(sg.fwd_offsets), np.diff(sg.rev_offsets)
+    src_idx = np.repeat(np.arange(len(sg), dtype=INDEX_DTYPE), out_degree)
+    collapsible = (out_degree[src_idx] > threshold) & (in_degree[sg.fwd_targets] == 1) & \
+        (out_degree[sg.fwd_targets] == 0)
+    return src_idx[collapsible], sg.fwd_targets[collapsible]
+
+
+def condense_super_nodes(sg: CompactGraph, threshold: int) -> Tuple[CompactGraph, Dict[int, np.ndarray]]:
+    """Collapse the collapsible children of each node with more than `threshold` children into a placeholder node
+
+    :return: (condensed graph, map of super node concept_id to the sorted concept_ids collapsed under it)"""
+    super_idx, child_idx = find_collapsible(sg, threshold)
+    if not len(child_idx):
+        return sg, {}
+    supers, starts = np.unique(super_idx, return_index=True)
+    collapsed: Dict[int, np.ndarray] = {
+        int(sg.node_ids[s]): sg.node_ids[children]
+        for s, children in zip(supers.tolist(), np.split(child_idx, starts[1:]))}
+
+    keep = np.ones(len(sg), dtype=bool)
+    keep[child_idx] = False
+    edges = sg.induced_edges(sg.node_ids[keep])
+    super_ids = sg.node_ids[supers]
+    condensed = CompactGraph.from_edges(
+        np.concatenate([edges[:, 0], super_ids]), np.concatenate([edges[:, 1], -super_ids]))
+    # Nodes w/ no edges left are still part of the graph
+    return condensed.with_nodes(sg.node_ids[keep]), collapsed
+
+
+def pack_collapsed(collapsed: Dict[int, np.ndarray]) -> bytes:
+    """Pack condense_super_nodes()'s map of super node to collapsed children as bytes, for caching. Pages of one super
+    node's children can be read from them w/ collapsed_page(), w/out unpacking the rest.
+
+    Layout, as int64s: number of super nodes n, the n sorted super nodes, their n + 1 offsets into the children, then
+    the children."""
+    supers = np.array(sorted(collapsed), dtype=np.int64)
+    counts = np.array([len(collapsed[s]) for s in supers.tolist()], dtype=np.int64)
+    offsets = np.concatenate([[0], np.cumsum(counts)])
+    children = [collapsed[s] for s in supers.tolist()]
+    return np.concatenate([[len(supers)], supers, offsets, *children]).astype(np.int64).tobytes()
+
+
+def collapsed_page(packed: bytes, super_node: int, offset: int, limit: int) -> Tuple[int, np.ndarray]:
+    """A page of the children collapsed under super_node, from pack_collapsed() bytes
+
+    :return: (total number of children collapsed under super_node, the page of them)"""
+    arr = np.frombuffer(packed, dtype=np.int64)
+    n = int(arr[0])
+    supers, offsets, children = arr[1:n + 1], arr[n + 1:2 * n + 2], arr[2 * n + 2:]
+    i = int(np.searchsorted(supers, super_node))
+    if i == n or supers[i] != super_node:
+        return 0, np.empty(0, dtype=np.int64)
+    start, end = int(offsets[i]), int(offsets[i + 1])
+    page_start = start + max(offset, 0)
+    return end - start, children[page_start:max(min(page_start + limit, end), page_start)]
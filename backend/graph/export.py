@@ -0,0 +1,131 @@
+"""Streaming export of graph edges, and compact encoding of graph responses
+
+Serializing millions of edges at once means materializing millions of Python lists and one giant JSON string. Instead,
+edges are read from the CSR arrays a chunk at a time and each chunk is serialized and sent before the next is read, so
+server memory is bounded by the chunk size rather than by the size of the graph.
+
+Formats (EDGE_FORMATS):
+  - json: A single JSON array of [source, target] pairs, as /wholegraph has always returned.
+  - ndjson: One [source, target] JSON array per line.
+  - binary: Little-endian (source, target) pairs, with no header. int32 if all concept_ids fit, else int64; the dtype
+    is given in the X-Edge-Dtype response header.
+  - arrow: Arrow IPC stream of record batches with `source` and `target` columns.
+"""
+import io
+import json
+from typing import Any, Dict, Iterator, List, Set, Tuple
+
+import numpy as np
+import pyarrow as pa
+
+from backend.graph.compact_graph import INDEX_DTYPE, CompactGraph, as_id_array
+
+DEFAULT_CHUNK_EDGES = 1 << 16
+EDGE_FORMATS: Dict[str, str] = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+    'binary': 'application/octet-stream',
+    'arrow': 'application/vnd.apache.arrow.stream',
+}
+
+
+def edge_dtype(g: CompactGraph) -> np.dtype:
+    """Smallest little-endian int dtype, int32 or int64, that holds all of the graph's concept_ids"""
+    info = np.iinfo(np.int32)
+    if not len(g) or (g.node_ids[0] >= info.min and g.node_ids[-1] <= info.max):
+        return np.dtype('<i4')
+    return np.dtype('<i8')
+
+
+def iter_edge_chunks(
+    g: CompactGraph, chunk_edges: int = DEFAULT_CHUNK_EDGES
+) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+    """Yield (sources, targets) concept_id arrays of up to chunk_edges edges each, in CSR order"""
+    for start in range(0, g.number_of_edges(), chunk_edges):
+        positions = np.arange(start, min(start + chunk_edges, g.number_of_edges()))
+        src_idx = np.searchsorted(g.fwd_offsets, positions, side='right') - 1
+        yield g.node_ids[src_idx], g.node_ids[g.fwd_targets[positions]]
+
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file that holds what's written to it until taken, so an Arrow stream can be sent as it's written"""
+
+    def __init__(self):
+        super().__init__()
+        self.parts = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, b) -> int:
+        self.parts.append(bytes(b))
+        return len(b)
+
+    def take(self) -> bytes:
+        """Bytes written since last taken"""
+        out, self.parts = b''.join(self.parts), []
+        return out
+
+
+def _json_pairs(sources: np.ndarray, targets: np.ndarray) -> str:
+    """Edges as comma separated JSON arrays, without enclosing brackets"""
+    return json.dumps(np.column_stack([sources, targets]).tolist(), separators=(',', ':'))[1:-1]
+
+
+def stream_edges(g: CompactGraph, fmt: str = 'json', chunk_edges: int = DEFAULT_CHUNK_EDGES) -> Iterator[bytes]:
+    """Serialize the graph's edges, a chunk at a time, in one of EDGE_FORMATS"""
+    if fmt not in EDGE_FORMATS:
+        raise ValueError(f'Unknown edge format: {fmt}. Options: {", ".join(EDGE_FORMATS)}')
+    chunks = iter_edge_chunks(g, chunk_edges)
+    if fmt == 'json':
+        yield b'['
+        for i, (sources, targets) in enumerate(chunks):
+            yield ((',' if i else '') + _json_pairs(sources, targets)).encode('utf-8')
+        yield b']'
+    elif fmt == 'ndjson':
+        for sources, targets in chunks:
+            # Pairs only contain ints, so '],[' only occurs between pairs
+            yield (_json_pairs(sources, targets).replace('],[', ']\n[') + '\n').encode('utf-8')
+    elif fmt == 'binary':
+        dtype = edge_dtype(g)
+        for sources, targets in chunks:
+            yield np.column_stack([sources, targets]).astype(dtype).tobytes()
+    elif fmt == 'arrow':
+        arrow_type = pa.int32() if edge_dtype(g).itemsize == 4 else pa.int64()
+        schema = pa.schema([('source', arrow_type), ('target', arrow_type)])
+        sink = _ChunkSink()
+        with pa.ipc.new_stream(pa.PythonFile(sink, mode='w'), schema) as writer:
+            for sources, targets in chunks:
+                writer.write_batch(pa.record_batch([
+                    pa.array(sources, type=arrow_type), pa.array(targets, type=arrow_type)], schema=schema))
+                yield sink.take()
+        yield sink.take()  # end of stream marker
+
+
+def delta_encode(ids) -> List[int]:
+    """Sort ids and replace each with its difference from the previous one. Decode with cumsum."""
+    ids = np.sort(as_id_array(ids))
+    return np.diff(ids, prepend=0).tolist() if len(ids) else []
+
+
+def compact_concept_graph(
+    sg: CompactGraph, concept_ids: Set[int], missing_from_graph: Set[int], hidden_by_vocab: Dict[str, Set[int]],
+    nonstandard_concepts_hidden: Set[int]
+) -> Dict[str, Any]:
+    """/concept-graph response content in the compact wire format
+
+    - nodes: The subgraph's concept_ids, delta-encoded.
+    - edges: Flat list [source_0, target_0, source_1, target_1, ...] of indexes into the decoded nodes.
+    - concept_ids, missing_from_graph, nonstandard_concepts_hidden, and the values of hidden_by_vocab: Delta-encoded.
+    Concept ids are 7+ digits, but neighboring sorted ids usually differ by much less, so the JSON is several times
+    smaller than with [source, target] id pairs, and there are no nested lists to build or encode."""
+    src_idx = np.repeat(np.arange(len(sg), dtype=INDEX_DTYPE), np.diff(sg.fwd_offsets))
+    return {
+        'format': 'compact',
+        'nodes': delta_encode(sg.nodes),
+        'edges': np.column_stack([src_idx, sg.fwd_targets]).ravel().tolist(),
+        'concept_ids': delta_encode(concept_ids),
+        'missing_from_graph': delta_encode(missing_from_graph),
+        'hidden_by_vocab': {vocab: delta_encode(ids) for vocab, ids in hidden_by_vocab.items()},
+        'nonstandard_concepts_hidden': delta_encode(nonstandard_concepts_hidden),
+    }
@@ -0,0 +1,151 @@
+"""Bulk ingest of graph data from Postgres
+
+Selecting `concept_graph` through SQLAlchemy creates a Row object, and then a tuple, per edge, which for millions of
+edges takes minutes. Instead, `COPY ... TO STDOUT (FORMAT binary)` streams the table in Postgres' binary COPY format,
+which is parsed in large chunks directly into numpy arrays, with no per-row Python objects.
+
+All columns are cast to bigint and NULLs are filtered out or coalesced in the COPY query, so every tuple has the same
+size, and a chunk of tuples can be read as a single numpy structured array:
+  - int16: field count
+  - for each field: int32: field length (always 8), int64: value
+All values are big-endian. https://www.postgresql.org/docs/current/sql-copy.html#id-1.9.3.55.9.4
+"""
+from typing import Callable, List, Tuple
+
+import numpy as np
+from sqlalchemy.engine.base import Connection
+
+from backend.graph.compact_graph import ID_DTYPE
+
+COPY_SIGNATURE = b'PGCOPY\n\xff\r\n\0'
+COPY_HEADER_FIXED_LEN = len(COPY_SIGNATURE) + 8  # signature, int32 flags, int32 header extension length
+COPY_TRAILER = b'\xff\xff'
+DEFAULT_CHUNK_BYTES = 64 * 1024 * 1024
+
+
+class CopyFormatError(Exception):
+    """Raised when COPY output isn't in the expected binary format"""
+    pass
+
+
+def record_dtype(n_columns: int) -> np.dtype:
+    """Structured dtype of a binary COPY tuple of n_columns non-null bigints"""
+    fields = [('n_fields', '>i2')]
+    for i in range(n_columns):
+        fields += [(f'len_{i}', '>i4'), (f'col_{i}', '>i8')]
+    return np.dtype(fields)
+
+
+class BinaryCopyParser:
+    """File-like sink for psycopg2's `cursor.copy_expert()` that parses binary COPY output of tuples of bigints.
+
+    psycopg2 calls write() with blocks of arbitrary size. Bytes are buffered until at least `chunk_bytes` have arrived,
+    and then all complete tuples in the buffer are converted to arrays at once.
+
+    :param n_columns: Number of bigint columns in each tuple.
+    :param progress: Optional callback, passed the number of rows parsed so far after each chunk."""
+
+    def __init__(
+        self, n_columns: int = 2, chunk_bytes: int = DEFAULT_CHUNK_BYTES, progress: Callable[[int], None] = None
+    ):
+        self.n_columns = n_columns
+        self.dtype = record_dtype(n_columns)
+        self.chunk_bytes = chunk_bytes
+        self.progress = progress
+        self.buffer = bytearray()
+        self.header_done = False
+        self.finished = False
+        self.n_rows = 0
+        self.chunks: List[List[np.ndarray]] = [[] for _ in range(n_columns)]
+
+    def write(self, data: bytes) -> int:
+        """Receive a block of COPY output"""
+        self.buffer += data
+        if len(self.buffer) >= self.chunk_bytes:
+            self._parse_buffer()
+        return len(data)
+
+    def _parse_header(self) -> bool:
+        """Consume the file header. Returns False if the buffer doesn't hold all of it yet."""
+        if len(self.buffer) < COPY_HEADER_FIXED_LEN:
+            return False
+        if bytes(self.buffer[:len(COPY_SIGNATURE)]) != COPY_SIGNATURE:
+            raise CopyFormatError('COPY output does not start with the binary COPY signature')
+        extension_len = int.from_bytes(self.buffer[COPY_HEADER_FIXED_LEN - 4:COPY_HEADER_FIXED_LEN], 'big')
+        if len(self.buffer) < COPY_HEADER_FIXED_LEN + extension_len:
+            return False
+        del self.buffer[:COPY_HEADER_FIXED_LEN + extension_len]
+        self.header_done = True
+        return True
+
+    def _parse_buffer(self):
+        """Convert all complete tuples in the buffer to arrays"""
+        if self.finished or (not self.header_done and not self._parse_header()):
+            return
+        n = len(self.buffer) // self.dtype.itemsize
+        if not n:
+            return
+        records = np.frombuffer(self.buffer, dtype=self.dtype, count=n)
+        # The trailer (int16 -1) is shorter than a record, so can only be misread as the start of the final one
+        trailer_at = np.flatnonzero(records['n_fields'] == -1)
+        if len(trailer_at):
+            records = records[:trailer_at[0]]
+            self.finished = True
+        if len(records) and ((records['n_fields'] != self.n_columns).any() or any(
+                (records[f'len_{i}'] != 8).any() for i in range(self.n_columns))):
+            raise CopyFormatError(f'COPY output contains tuples that are not {self.n_columns} non-null bigint fields')
+        for i in range(self.n_columns):
+            self.chunks[i].append(records[f'col_{i}'].astype(ID_DTYPE))
+        self.n_rows += len(records)
+        consumed = len(records) * self.dtype.itemsize + (len(COPY_TRAILER) if self.finished else 0)
+        del records  # release the view on self.buffer, so it can be resized
+        del self.buffer[:consumed]
+        if self.progress:
+            self.progress(self.n_rows)
+
+    def result(self) -> Tuple[np.ndarray, ...]:
+        """Parse anything left in the buffer and return one int64 array per column"""
+        self._parse_buffer()
+        if not self.header_done:
+            raise CopyFormatError('COPY output ended before the end of the file header')
+        if not self.finished and len(self.buffer) >= len(COPY_TRAILER) \
+                and bytes(self.buffer[:len(COPY_TRAILER)]) == COPY_TRAILER:
+            del self.buffer[:len(COPY_TRAILER)]
+            self.finished = True
+        if not self.finished or self.buffer:
+            raise CopyFormatError('COPY output is truncated or has trailing data')
+        return tuple(
+            np.concatenate(chunks) if chunks else np.empty(0, dtype=ID_DTYPE) for chunks in self.chunks)
+
+
+def copy_bigint_columns(
+    con: Connection, select: str, n_columns: int, chunk_bytes: int = DEFAULT_CHUNK_BYTES,
+    progress: Callable[[int], None] = None
+) -> Tuple[np.ndarray, ...]:
+    """Stream the result of a query via binary COPY.
+
+    :param select: SELECT statement whose n_columns columns are all non-null bigints.
+    :return: One int64 array per column."""
+    parser = BinaryCopyParser(n_columns, chunk_bytes, progress)
+    cursor = con.connection.cursor()
+    try:
+        cursor.copy_expert(f'COPY ({select}) TO STDOUT (FORMAT binary)', parser)
+    finally:
+        cursor.close()
+    return parser.result()
+
+
+def copy_edges(
+    con: Connection, table: str, source_col='source_id', target_col='target_id', where: str = None,
+    chunk_bytes: int = DEFAULT_CHUNK_BYTES, progress: Callable[[int], None] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Stream all edges of a table via binary COPY.
+
+    :param table: Table name, optionally schema-qualified.
+    :param where: Optional SQL condition to select a subset of rows.
+    :return: (sources, targets) as parallel int64 arrays."""
+    select = f"""
+        SELECT {source_col}::bigint, {target_col}::bigint
+        FROM {table}
+        WHERE {source_col} IS NOT NULL AND {target_col} IS NOT NULL{f' AND ({where})' if where else ''}"""
+    return copy_bigint_columns(con, select, 2, chunk_bytes, progress)
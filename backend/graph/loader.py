@@ -0,0 +1,208 @@
+"""Background loading of the relationship graph
+
+Loading (or, if the snapshot is outdated, rebuilding) the graph happens in a daemon thread, so that the app can start
+serving routes that don't need the graph right away. Graph routes check `GraphLoader.ready` and respond with 503 until
+the graph is available.
+
+Once loaded, the graph can be hot-swapped when its source data changes, e.g. after a vocab refresh, without restarting
+workers. If given a `version_func`, a watcher thread polls it every `watch_seconds`; when the version differs from the
+one the current graph was loaded at, the new graph is loaded in the background and then swapped in by replacing a single
+reference. Routes get the graph once per request, so requests in flight finish on the old graph, which (along with its
+memory map) is freed when the last of them drops its reference. If reloading fails, the old graph stays in use, and the
+reload is retried at the next poll.
+"""
+import threading
+import traceback
+from datetime import datetime
+from typing import Any, Callable, Dict, Hashable, List, Union
+
+from backend.graph.compact_graph import CompactGraph
+
+
+class GraphNotReadyError(Exception):
+    """Raised when the relationship graph is requested before it has finished loading"""
+    pass
+
+
+class GraphLoader:
+    """Loads the relationship graph in a background thread, reports progress, and optionally reloads it when its source
+    data changes
+
+    :param load_func: Called as load_func(progress=callback) and must return the graph. `callback(msg)` may be called
+     any number of times to report progress.
+    :param version_func: Returns the current version of the data the graph is loaded from. Needed for reloading.
+    :param watch_seconds: How often the watcher thread checks version_func. If falsy, there's no watcher, though
+     check_for_update() can still be called directly.
+    :param on_swap: Called after a reloaded graph has been swapped in, e.g. to clear caches of responses.
+    :param loaded_version_func: Called w/ the loaded graph and the version read before loading it, returns the version
+     to record for the graph. For when loading can itself change the version, e.g. by writing a new snapshot."""
+    states = ('not started', 'loading', 'ready', 'failed')
+
+    def __init__(
+        self, load_func: Callable[..., CompactGraph], max_progress_msgs: int = 20,
+        version_func: Callable[[], Hashable] = None, watch_seconds: float = None, on_swap: Callable[[], None] = None,
+        loaded_version_func: Callable[[CompactGraph, Hashable], Hashable] = None
+    ):
+        self.load_func = load_func
+        self.max_progress_msgs = max_progress_msgs
+        self.version_func = version_func
+        self.watch_seconds = watch_seconds
+        self.on_swap = on_swap
+        self.loaded_version_func = loaded_version_func
+        self.state = 'not started'
+        self.progress: List[Dict[str, str]] = []
+        self.error: Union[str, None] = None
+        self.started_at: Union[datetime, None] = None
+        self.finished_at: Union[datetime, None] = None
+        self.version: Hashable = None
+        self.generation = 0
+        self.reloading = False
+        self.reload_error: Union[str, None] = None
+        self.reloaded_at: Union[datetime, None] = None
+        self._graph: Union[CompactGraph, None] = None
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._done = threading.Event()
+        self._stop_watching = threading.Event()
+        self._thread: Union[threading.Thread, None] = None
+        self._watcher: Union[threading.Thread, None] = None
+
+    @property
+    def ready(self) -> bool:
+        """Is the graph loaded?"""
+        return self.state == 'ready'
+
+    def report(self, msg: str):
+        """Record a progress message"""
+        self.progress.append({'time': datetime.now().isoformat(), 'msg': msg})
+        del self.progress[:-self.max_progress_msgs]
+
+    def _current_version(self) -> Hashable:
+        """Version of the source data, or None if there's no version_func"""
+        return self.version_func() if self.version_func else None
+
+    def _loaded_version(self, graph: CompactGraph, version: Hashable) -> Hashable:
+        """Version to record for a just-loaded graph, given the version read before loading it"""
+        return self.loaded_version_func(graph, version) if self.loaded_version_func else version
+
+    def _run(self):
+        """Thread target"""
+        try:
+            # read before loading: if the data changes mid-load, the next check will see the graph as outdated
+            version = self._current_version()
+            graph = self.load_func(progress=self.report)
+            self._graph = graph
+            self.version, self.generation = self._loaded_version(graph, version), 1
+            self.state = 'ready'
+        except Exception as err:
+            self.error = ''.join(traceback.format_exception(type(err), err, err.__traceback__))
+            self.state = 'failed'
+            print(f'Failed to load relationship graph:\n{self.error}')
+        finally:
+            self.finished_at = datetime.now()
+            self._done.set()
+
+    def start(self, restart_if_failed=True) -> 'GraphLoader':
+        """Start loading in the background, if not already started"""
+        with self._lock:
+            if self.state in ('loading', 'ready') or (self.state == 'failed' and not restart_if_failed):
+                return self
+            self.state, self.error, self.started_at, self.finished_at = 'loading', None, datetime.now(), None
+            self._done.clear()
+            self._thread = threading.Thread(target=self._run, name='graph-loader', daemon=True)
+            self._thread.start()
+            if self.version_func and self.watch_seconds and self._watcher is None:
+                self._stop_watching.clear()
+                self._watcher = threading.Thread(target=self._watch, name='graph-watcher', daemon=True)
+                self._watcher.start()
+        return self
+
+    def _watch(self):
+        """Watcher thread target"""
+        while not self._stop_watching.wait(self.watch_seconds):
+            try:
+                self.check_for_update()
+            except Exception as err:
+                # e.g. the DB being briefly unavailable shouldn't stop the watcher
+                self.reload_error = ''.join(traceback.format_exception(type(err), err, err.__traceback__))
+
+    def stop_watching(self):
+        """Stop the watcher thread, if running"""
+        self._stop_watching.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+
+    def check_for_update(self) -> bool:
+        """If the source data has changed since the graph was loaded, reload it and swap it in. Blocks while reloading.
+
+        :return: True if a new graph was swapped in."""
+        if not self.ready or not self.version_func:
+            return False
+        version = self._current_version()
+        if version == self.version:
+            return False
+        return self.reload(version)
+
+    def reload(self, version: Hashable = None) -> bool:
+        """Load the graph again and swap it in, keeping the current one in use until then, and if loading fails. No-op
+        if a reload is already in progress.
+
+        :param version: Version of the source data, if already known.
+        :return: True if a new graph was swapped in."""
+        if not self._reload_lock.acquire(blocking=False):
+            return False
+        try:
+            self.reloading = True
+            version = version if version is not None else self._current_version()
+            self.report(f'reloading; data version changed from {self.version} to {version}')
+            try:
+                graph = self.load_func(progress=self.report)
+            except Exception as err:
+                self.reload_error = ''.join(traceback.format_exception(type(err), err, err.__traceback__))
+                print(f'Failed to reload relationship graph; keeping the current one:\n{self.reload_error}')
+                return False
+            with self._lock:
+                self._graph, self.version = graph, self._loaded_version(graph, version)
+                self.generation += 1
+                self.reload_error, self.reloaded_at = None, datetime.now()
+            if self.on_swap:
+                self.on_swap()
+            return True
+        finally:
+            self.reloading = False
+            self._reload_lock.release()
+
+    def wait(self, timeout: float = None) -> CompactGraph:
+        """Start loading if needed, and block until the graph is available. For scripts and tests."""
+        self.start(restart_if_failed=False)
+        self._done.wait(timeout)
+        return self.get()
+
+    def get(self) -> CompactGraph:
+        """Get the graph, or raise GraphNotReadyError if it isn't loaded. Callers should get it once per request, so
+        that a reload mid-request doesn't mix graphs."""
+        graph = self._graph
+        if graph is None:
+            raise GraphNotReadyError(f'Relationship graph is not ready. Status: {self.state}')
+        return graph
+
+    def status(self) -> Dict[str, Any]:
+        """Loading status, for the /ready route"""
+        graph = self._graph
+        return {
+            'ready': self.ready,
+            'state': self.state,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'seconds_elapsed': round(((self.finished_at or datetime.now()) - self.started_at).total_seconds(), 1)
+                if self.started_at else None,
+            'progress': self.progress,
+            'error': self.error,
+            'generation': self.generation,
+            'reloading': self.reloading,
+            'reloaded_at': self.reloaded_at.isoformat() if self.reloaded_at else None,
+            'reload_error': self.reload_error,
+            'nodes': len(graph) if graph is not None else None,
+            'edges': graph.number_of_edges() if graph is not None else None,
+        }
@@ -0,0 +1,186 @@
+"""Reachability index for the relationship graph
+
+Answers "all descendants of X" and "is A an ancestor of B" without traversing the graph, using interval labeling on a
+spanning forest (a "tree cover", Agrawal, Borgida & Jagadish 1989):
+- Each node gets one tree parent (its first parent), which gives a spanning forest of the DAG.
+- Nodes are numbered in pre-order over that forest, so each node's subtree is the contiguous range
+  [pre[v], pre[v] + subtree_size[v] - 1].
+- Descendants reached through the other (cross) edges of the DAG fall outside that range. So each node stores a sorted
+  list of disjoint pre-order intervals: its own subtree range, merged with its children's interval lists.
+For hierarchies like SNOMED, which are mostly tree-shaped, most nodes have a single interval. Ancestor checks are then a
+binary search, and descendant sets are slices of `by_pre`, in time proportional to the output.
+
+The index is built level by level over a topological sort, with vectorized numpy operations per level.
+"""
+from typing import Dict, List, Union
+
+import numpy as np
+
+from backend.graph.compact_graph import INDEX_DTYPE, OFFSET_DTYPE, CompactGraph, expand_ranges, gather
+
+REACHABILITY_ARRAYS = ('reach_pre', 'reach_by_pre', 'reach_offsets', 'reach_lo', 'reach_hi')
+# Give up, and fall back to traversal, if DAG cross-edges make interval lists longer than this on average
+MAX_INTERVALS_PER_NODE = 16
+
+
+def topological_levels(g: CompactGraph) -> Union[List[np.ndarray], None]:
+    """Kahn's algorithm, one level at a time: level 0 is the roots, level i the nodes whose parents are all in levels
+    before i. Returns None if the graph has a cycle."""
+    indegree = np.diff(g.rev_offsets)
+    frontier = np.flatnonzero(indegree == 0).astype(INDEX_DTYPE)
+    levels: List[np.ndarray] = []
+    n_sorted = 0
+    while len(frontier):
+        levels.append(frontier)
+        n_sorted += len(frontier)
+        children, counts = np.unique(gather(g.fwd_offsets, g.fwd_targets, frontier), return_counts=True)
+        indegree[children] -= counts
+        frontier = children[indegree[children] == 0].astype(INDEX_DTYPE)
+    return levels if n_sorted == len(g) else None
+
+
+def merge_intervals(groups: np.ndarray, lo: np.ndarray, hi: np.ndarray, n: int):
+    """Merge overlapping or adjacent intervals within each group.
+
+    :param groups: Group of each interval, as small non-negative ints.
+    :param n: Upper bound on interval values.
+    :return: (groups, lo, hi) of the merged intervals, sorted by group, then lo."""
+    if not len(lo):
+        return groups, lo, hi
+    order = np.lexsort((lo, groups))
+    groups, lo, hi = groups[order], lo[order], hi[order]
+    # Offset each group's values past those of the groups before it, so a running max doesn't cross groups
+    shift = groups.astype(np.int64) * (n + 1)
+    running_hi = np.maximum.accumulate(hi + shift)
+    starts = np.ones(len(lo), dtype=bool)
+    starts[1:] = (groups[1:] != groups[:-1]) | (lo[1:] + shift[1:] > running_hi[:-1] + 1)
+    start_idx = np.flatnonzero(starts)
+    end_idx = np.append(start_idx[1:] - 1, len(lo) - 1)
+    return groups[start_idx], lo[start_idx], (running_hi[end_idx] - shift[end_idx]).astype(hi.dtype)
+
+
+class ReachabilityIndex:
+    """Interval-labeled reachability index over a CompactGraph's node indexes. See module docstring.
+
+    :param pre: Pre-order number of each node.
+    :param by_pre: Node at each pre-order number; the inverse of `pre`.
+    :param offsets: offsets[i]:offsets[i + 1] slices lo / hi to get the intervals of node i.
+    :param lo: Interval starts, sorted within each node.
+    :param hi: Interval ends, inclusive."""
+
+    def __init__(self, pre: np.ndarray, by_pre: np.ndarray, offsets: np.ndarray, lo: np.ndarray, hi: np.ndarray):
+        self.pre = pre
+        self.by_pre = by_pre
+        self.offsets = offsets
+        self.lo = lo
+        self.hi = hi
+
+    @classmethod
+    def build(
+        cls, g: CompactGraph, max_intervals_per_node: float = MAX_INTERVALS_PER_NODE
+    ) -> Union['ReachabilityIndex', None]:
+        """Build index. Returns None if the graph has a cycle, or has too many cross-edges for the index to be compact,
+        in which case callers should traverse the graph instead."""
+        n = len(g)
+        levels = topological_levels(g)
+        if levels is None:
+            return None
+
+        # Spanning forest: each node's first parent is its tree parent
+        tree_parent = np.full(n, -1, dtype=INDEX_DTYPE)
+        has_parent = np.diff(g.rev_offsets) > 0
+        tree_parent[has_parent] = g.rev_sources[g.rev_offsets[:-1][has_parent]]
+        # Subtree sizes, leaves up. A node's tree children are all in later levels than it.
+        size = np.ones(n, dtype=OFFSET_DTYPE)
+        for level in reversed(levels[1:]):
+            np.add.at(size, tree_parent[level], size[level])
+        # Offset of each node's subtree among its siblings' (or, for roots, among all roots') subtrees
+        order = np.lexsort((np.arange(n), tree_parent))
+        sizes_ordered = size[order]
+        before = np.cumsum(sizes_ordered) - sizes_ordered
+        first_sibling = np.ones(n, dtype=bool)
+        first_sibling[1:] = tree_parent[order][1:] != tree_parent[order][:-1]
+        group_start = np.maximum.accumulate(np.where(first_sibling, np.arange(n), 0))
+        sibling_offset = np.empty(n, dtype=OFFSET_DTYPE)
+        sibling_offset[order] = before - before[group_start]
+        # Pre-order numbers, roots down
+        pre = np.empty(n, dtype=INDEX_DTYPE)
+        if levels:
+            pre[levels[0]] = sibling_offset[levels[0]]
+        for level in levels[1:]:
+            pre[level] = pre[tree_parent[level]] + 1 + sibling_offset[level]
+        by_pre = np.empty(n, dtype=INDEX_DTYPE)
+        by_pre[pre] = np.arange(n, dtype=INDEX_DTYPE)
+
+        # Interval lists, leaves up: own subtree range, merged with every child's list. Lists are appended to a buffer
+        # as they're made, and located by node_start / node_count.
+        max_intervals = int(max_intervals_per_node * max(n, 1))
+        buf_lo, buf_hi = np.empty(n, dtype=INDEX_DTYPE), np.empty(n, dtype=INDEX_DTYPE)
+        used = 0
+        node_start, node_count = np.zeros(n, dtype=OFFSET_DTYPE), np.zeros(n, dtype=OFFSET_DTYPE)
+        for level in reversed(levels):
+            out_degree = g.fwd_offsets[level + 1] - g.fwd_offsets[level]
+            children = gather(g.fwd_offsets, g.fwd_targets, level)
+            child_group = np.repeat(np.arange(len(level)), out_degree)
+            child_intervals = expand_ranges(node_start[children], node_count[children])
+            groups = np.concatenate([np.arange(len(level)), np.repeat(child_group, node_count[children])])
+            lo = np.concatenate([pre[level], buf_lo[child_intervals]])
+            hi = np.concatenate([pre[level] + size[level] - 1, buf_hi[child_intervals]]).astype(INDEX_DTYPE)
+            groups, lo, hi = merge_intervals(groups, lo, hi, n)
+            if used + len(lo) > len(buf_lo):
+                if used + len(lo) > max_intervals:
+                    return None
+                capacity = min(max(2 * len(buf_lo), used + len(lo)), max_intervals)
+                buf_lo, buf_hi = np.resize(buf_lo, capacity), np.resize(buf_hi, capacity)
+            buf_lo[used:used + len(lo)], buf_hi[used:used + len(lo)] = lo, hi
+            counts = np.bincount(groups, minlength=len(level))
+            node_count[level] = counts
+            node_start[level] = used + np.cumsum(counts) - counts
+            used += len(lo)
+
+        # Rearrange into CSR order
+        offsets = np.zeros(n + 1, dtype=OFFSET_DTYPE)
+        np.cumsum(node_count, out=offsets[1:])
+        idx = expand_ranges(node_start, node_count)
+        return cls(pre, by_pre, offsets, buf_lo[idx], buf_hi[idx])
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> 'ReachabilityIndex':
+        """From arrays as returned by arrays()"""
+        return cls(*[arrays[name] for name in REACHABILITY_ARRAYS])
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """Arrays, by name, for saving to a snapshot"""
+        return dict(zip(REACHABILITY_ARRAYS, (self.pre, self.by_pre, self.offsets, self.lo, self.hi)))
+
+    def n_intervals(self) -> int:
+        """Total number of intervals"""
+        return len(self.lo)
+
+    def is_ancestor(self, ancestor: int, descendant: int) -> bool:
+        """Is there a path from node index `ancestor` to node index `descendant`? A node isn't its own ancestor."""
+        if ancestor == descendant:
+            return False
+        start, end = self.offsets[ancestor], self.offsets[ancestor + 1]
+        p = self.pre[descendant]
+        i = start + np.searchsorted(self.lo[start:end], p, side='right') - 1
+        return bool(i >= start and self.hi[i] >= p)
+
+    def descendants(self, idx: np.ndarray) -> np.ndarray:
+        """Node indexes of descendants of idx, sorted. Nodes in idx are included only if they're descendants of other
+        nodes in idx."""
+        idx = np.unique(idx)
+        sel = expand_ranges(self.offsets[idx], self.offsets[idx + 1] - self.offsets[idx])
+        lo, hi = self.lo[sel], self.hi[sel]
+        if not len(lo):
+            return np.empty(0, dtype=INDEX_DTYPE)
+        # Each node's own intervals cover it once. Those of another of idx that it descends from cover it again.
+        sorted_lo, sorted_hi = np.sort(lo), np.sort(hi)
+        points = self.pre[idx]
+        coverage = np.searchsorted(sorted_lo, points, side='right') - np.searchsorted(sorted_hi, points, side='left')
+        _, lo, hi = merge_intervals(np.zeros(len(lo), dtype=INDEX_DTYPE), lo, hi, len(self.pre))
+        result = self.by_pre[expand_ranges(lo, hi.astype(OFFSET_DTYPE) - lo + 1)]
+        not_descendants = idx[coverage < 2]
+        if len(not_descendants):
+            result = result[~np.isin(result, not_descendants)]
+        return np.sort(result)
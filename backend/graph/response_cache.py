@@ -0,0 +1,110 @@
+"""Cache of serialized graph route responses
+
+The frontend requests the same codeset combinations (e.g. the N3C recommended ones) over and over. Each
+`/concept-graph` response needs several DB queries plus graph work, but only changes when the DB is refreshed. So
+responses are cached as the exact bytes that are sent, keyed on the normalized request parameters.
+
+Entries are evicted least-recently-used first, to stay within a memory budget. The whole cache is invalidated when the
+data version changes, e.g. the DB or vocab refresh timestamps. Checking the version can mean DB queries, so it is only
+checked every `version_check_seconds`. Async callers can turn off checking on access, and run check_version() in a
+thread themselves when version_check_due(), so it doesn't block the event loop.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Union
+
+
+class ResponseCache:
+    """Thread-safe LRU cache of response bytes, with a bounded total size
+
+    :param max_bytes: Memory budget for cached responses. Responses bigger than this aren't cached.
+    :param version_func: Returns the current data version. When it changes, all entries are dropped.
+    :param version_check_seconds: Minimum time between calls to version_func.
+    :param check_on_access: If True, get() and put() check the version when due. If False, the caller does, w/
+     check_version()."""
+
+    def __init__(
+        self, max_bytes: int, version_func: Callable[[], Hashable] = None, version_check_seconds: float = 60,
+        check_on_access=True
+    ):
+        self.max_bytes = max_bytes
+        self.version_func = version_func
+        self.version_check_seconds = version_check_seconds
+        self.check_on_access = check_on_access
+        self.version: Hashable = None
+        self.version_checked_at: float = float('-inf')
+        self.entries: 'OrderedDict[Hashable, bytes]' = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def clear(self):
+        """Drop all entries"""
+        with self._lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+    def version_check_due(self) -> bool:
+        """Is it time to check the data version again?"""
+        return bool(self.version_func) and time.monotonic() - self.version_checked_at >= self.version_check_seconds
+
+    def check_version(self, force=False):
+        """Drop all entries if the data version has changed since last checked"""
+        if not self.version_func or (not force and not self.version_check_due()):
+            return
+        version = self.version_func()
+        self.version_checked_at = time.monotonic()
+        if version != self.version:
+            if self.version is not None:
+                self.invalidations += 1
+            self.clear()
+            self.version = version
+
+    def get(self, key: Hashable) -> Union[bytes, None]:
+        """Get cached response, or None"""
+        if self.check_on_access:
+            self.check_version()
+        with self._lock:
+            content = self.entries.get(key)
+            if content is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return content
+
+    def put(self, key: Hashable, content: bytes):
+        """Cache response, evicting least recently used entries as needed"""
+        if self.check_on_access:
+            self.check_version()
+        if len(content) > self.max_bytes:
+            return
+        with self._lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.nbytes -= len(old)
+            while self.entries and self.nbytes + len(content) > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.nbytes -= len(evicted)
+                self.evictions += 1
+            self.entries[key] = content
+            self.nbytes += len(content)
+
+    def stats(self) -> Dict[str, Any]:
+        """Cache statistics"""
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'bytes': self.nbytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 3) if lookups else None,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+            'version': str(self.version) if self.version is not None else None,
+        }
@@ -0,0 +1,208 @@
+"""On-disk snapshot of the relationship graph
+
+The snapshot is a single file of flat, little-endian numpy arrays, preceded by a small header. Workers memory-map it
+read-only, so the OS page cache holds a single copy of the graph no matter how many uvicorn/gunicorn workers are
+running, and loading takes milliseconds rather than the time needed to unpickle / rebuild the graph.
+
+Layout:
+  - 8 bytes: magic, b'THGRAPH\\0'
+  - 4 bytes: format version (uint32, little-endian)
+  - 4 bytes: header length in bytes (uint32, little-endian)
+  - header: UTF-8 JSON. `arrays` maps each array name to its dtype, length, and byte offset in the file.
+    `content_hash` is a BLAKE2b digest of all array bytes. Other keys are free-form metadata, e.g. `vocab_refreshed`,
+    the value of the `last_refreshed_vocab_tables` status variable when the graph was built.
+  - arrays: each starts on an ALIGNMENT byte boundary.
+
+Snapshots are written to a temporary file in the same directory and then renamed over the old one. The rename is
+atomic, so readers see either the old or the new file, never a partial one, and workers that still have the old file
+mapped keep a valid mapping.
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+import tempfile
+from contextlib import contextmanager
+from typing import Any, Dict, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+import numpy as np
+
+from backend.graph.ancestry import ANCESTRY_ARRAYS, AncestorIndex
+from backend.graph.attributes import ATTRIBUTE_ARRAY_PREFIX, NodeAttributes
+from backend.graph.compact_graph import CompactGraph
+from backend.graph.components import COMPONENT_ARRAYS, ComponentIndex
+from backend.graph.reachability import REACHABILITY_ARRAYS, ReachabilityIndex
+
+MAGIC = b'THGRAPH\0'
+FORMAT_VERSION = 2
+ALIGNMENT = 64
+PREAMBLE = struct.Struct('<8sII')
+GRAPH_ARRAYS = ('node_ids', 'fwd_offsets', 'fwd_targets', 'rev_offsets', 'rev_sources')
+
+
+class SnapshotError(Exception):
+    """Raised when a snapshot file is missing, truncated, or of an unknown format"""
+    pass
+
+
+def _align(n: int) -> int:
+    """Round up to the next multiple of ALIGNMENT"""
+    return (n + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _layout(arrays: Dict[str, np.ndarray], meta: Dict[str, Any]) -> Tuple[bytes, Dict[str, Dict]]:
+    """Compute header bytes and array positions. The header size depends on the offsets it contains, so iterate until
+    stable."""
+    data_start = _align(PREAMBLE.size + 256)
+    while True:
+        pos = data_start
+        entries: Dict[str, Dict] = {}
+        for name, arr in arrays.items():
+            entries[name] = {'dtype': arr.dtype.newbyteorder('<').str, 'length': int(arr.size), 'offset': pos}
+            pos = _align(pos + arr.nbytes)
+        header = json.dumps({**meta, 'arrays': entries}).encode('utf-8')
+        if PREAMBLE.size + len(header) <= data_start:
+            return header, entries
+        data_start = _align(PREAMBLE.size + len(header))
+
+
+def content_hash(arrays: Dict[str, np.ndarray]) -> str:
+    """Hash of the names and little-endian bytes of arrays"""
+    digest = hashlib.blake2b(digest_size=32)
+    for name, arr in arrays.items():
+        digest.update(name.encode('utf-8'))
+        digest.update(np.ascontiguousarray(arr.astype(arr.dtype.newbyteorder('<'), copy=False)).data)
+    return digest.hexdigest()
+
+
+def write_arrays(path: str, arrays: Dict[str, np.ndarray], meta: Dict[str, Any] = None):
+    """Atomically write named 1d arrays, plus optional JSON-serializable metadata, to a snapshot file"""
+    arrays = {k: np.ascontiguousarray(v).ravel() for k, v in arrays.items()}
+    header, entries = _layout(arrays, {**(meta or {}), 'content_hash': content_hash(arrays)})
+    fd, tmp_path = tempfile.mkstemp(
+        prefix=os.path.basename(path) + '.', suffix='.tmp', dir=os.path.dirname(path) or '.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header)))
+            f.write(header)
+            for name, arr in arrays.items():
+                f.seek(entries[name]['offset'])
+                f.write(arr.astype(entries[name]['dtype'], copy=False).tobytes())
+            f.truncate(max([e['offset'] + arrays[k].nbytes for k, e in entries.items()], default=f.tell()))
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+@contextmanager
+def snapshot_lock(path: str):
+    """Exclusive, cross-process lock for (re)building the snapshot at path.
+
+    Several workers may find an outdated snapshot at the same time. Only the first to get the lock rebuilds; the others
+    wait and should then re-check the snapshot before rebuilding. No-op where fcntl is unavailable."""
+    if fcntl is None:
+        yield
+        return
+    with open(path + '.lock', 'a') as lock_file:
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def read_header(path: str) -> Dict[str, Any]:
+    """Read a snapshot's header without mapping its arrays"""
+    with open(path, 'rb') as f:
+        preamble = f.read(PREAMBLE.size)
+        if len(preamble) < PREAMBLE.size:
+            raise SnapshotError(f'{path} is too short to be a graph snapshot')
+        magic, version, header_len = PREAMBLE.unpack(preamble)
+        if magic != MAGIC:
+            raise SnapshotError(f'{path} is not a graph snapshot')
+        if version != FORMAT_VERSION:
+            raise SnapshotError(f'{path} has snapshot format version {version}; expected {FORMAT_VERSION}')
+        header = f.read(header_len)
+        if len(header) < header_len:
+            raise SnapshotError(f'{path} is truncated')
+    try:
+        return json.loads(header.decode('utf-8'))
+    except ValueError as err:
+        raise SnapshotError(f'{path} has an unreadable header: {err}')
+
+
+def read_arrays(path: str, verify=False) -> Tuple[Dict[str, np.ndarray], Dict[str, Any]]:
+    """Memory-map a snapshot file read-only.
+
+    :param verify: If True, check the arrays against the header's content hash. This reads every page of the file.
+    :return: (arrays, header). The arrays are read-only views onto the shared mapping; pages are loaded lazily by the
+    OS and shared between every process that maps the same file."""
+    header = read_header(path)
+    with open(path, 'rb') as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    arrays: Dict[str, np.ndarray] = {}
+    for name, entry in header['arrays'].items():
+        dtype = np.dtype(entry['dtype'])
+        if entry['offset'] + entry['length'] * dtype.itemsize > len(mm):
+            raise SnapshotError(f'{path} is truncated: array {name} extends past end of file')
+        if not entry['length']:
+            arrays[name] = np.empty(0, dtype=dtype)
+            continue
+        # np.frombuffer keeps a reference to mm, so the mapping lives as long as any array does
+        arrays[name] = np.frombuffer(mm, dtype=dtype, count=entry['length'], offset=entry['offset'])
+    if verify and content_hash(arrays) != header.get('content_hash'):
+        raise SnapshotError(f'{path} failed checksum verification')
+    return arrays, header
+
+
+def save_graph_snapshot(graph: CompactGraph, path: str, vocab_refreshed: str = None, meta: Dict[str, Any] = None):
+    """Save graph to snapshot file
+
+    :param vocab_refreshed: Value of the `last_refreshed_vocab_tables` status variable that the graph was built from."""
+    arrays = {name: getattr(graph, name) for name in GRAPH_ARRAYS}
+    meta = {'n_nodes': len(graph), 'n_edges': graph.number_of_edges(), 'vocab_refreshed': vocab_refreshed, **(meta or {})}
+    if graph.reachability is not None:
+        arrays.update(graph.reachability.arrays())
+    if graph.ancestry is not None:
+        arrays.update(graph.ancestry.arrays())
+    if graph.components is not None:
+        arrays.update(graph.components.arrays())
+    if graph.attributes is not None:
+        arrays.update(graph.attributes.arrays())
+        meta['attribute_dictionaries'] = graph.attributes.dictionaries
+    write_arrays(path, arrays, meta)
+
+
+def load_graph_snapshot(path: str, verify=False) -> CompactGraph:
+    """Load graph from snapshot file via a read-only memory map, along with its reachability, ancestor, and component
+    indexes and node attributes if it has them"""
+    if not os.path.isfile(path):
+        raise SnapshotError(f'{path} does not exist')
+    arrays, header = read_arrays(path, verify)
+    if header.get('n_edges') not in (None, len(arrays.get('fwd_targets', []))):
+        raise SnapshotError(f'{path}: header edge count {header["n_edges"]} does not match edge arrays')
+    missing = [name for name in GRAPH_ARRAYS if name not in arrays]
+    if missing:
+        raise SnapshotError(f'{path} is missing arrays: {", ".join(missing)}')
+    reachability = ReachabilityIndex.from_arrays(arrays) if all(name in arrays for name in REACHABILITY_ARRAYS) \
+        else None
+    ancestry = AncestorIndex.from_arrays(arrays) if all(name in arrays for name in ANCESTRY_ARRAYS) else None
+    components = ComponentIndex.from_arrays(arrays) if all(name in arrays for name in COMPONENT_ARRAYS) else None
+    attributes = NodeAttributes.from_arrays(arrays, header['attribute_dictionaries']) \
+        if ATTRIBUTE_ARRAY_PREFIX + 'concept_ids' in arrays and 'attribute_dictionaries' in header else None
+    graph = CompactGraph(
+        **{name: arrays[name] for name in GRAPH_ARRAYS}, reachability=reachability, attributes=attributes,
+        ancestry=ancestry, components=components)
+    graph.content_hash = header.get('content_hash')
+    return graph
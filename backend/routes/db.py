@@ -7,19 +7,20 @@ import json
 import urllib.parse
 from datetime import datetime
 from functools import cache, lru_cache
-from typing import Dict, List, Union, Set, Optional
+from typing import Dict, List, Tuple, Union, Set, Optional
 
 import pandas as pd
 from fastapi import APIRouter, Query, Request
 from fastapi.responses import StreamingResponse
-from psycopg2 import sql
 from sqlalchemy import Connection, Row, text
 from sqlalchemy.engine import RowMapping
+from sqlalchemy.sql.elements import TextClause
 from starlette.responses import Response
 
 from backend.api_logger import Api_logger, get_ip_from_request, API_CALL_LOGGING_ON
-from backend.db.queries import get_concepts
-from backend.db.utils import get_db_connection, sql_query, SCHEMA, sql_query_single_col, sql_in, sql_in_safe, run_sql
+from backend.db.queries import get_concepts, get_concepts_async
+from backend.db.utils import get_async_db_connection, get_db_connection, get_engine_stats, sql_query, \
+    sql_query_async, SCHEMA, sql_query_single_col, sql_query_single_col_async, sql_in, sql_in_safe, run_sql
 from backend.utils import return_err_with_trace, commify, recs2dicts, call_github_action
 from enclave_wrangler.config import RESEARCHER_COLS
 from enclave_wrangler.models import convert_rows
@@ -51,19 +52,31 @@ router = APIRouter(
 #       probably don't need precision etc.
 #       switched _container suffix on duplicate col names to container_ prefix
 #       joined OMOPConceptSet in the all_csets ddl to get `rid`
+GET_CSETS_QUERY = """
+  SELECT *
+  FROM all_csets
+  WHERE codeset_id = ANY(:codeset_ids);"""
+
+
 def get_csets(codeset_ids: List[int]) -> List[Dict]:
     """Get information about concept sets the user has selected"""
     with get_db_connection() as con:
-        rows: List = sql_query(
-            con, """
-              SELECT *
-              FROM all_csets
-              WHERE codeset_id = ANY(:codeset_ids);""",
-            {'codeset_ids': codeset_ids})
+        rows: List = sql_query(con, GET_CSETS_QUERY, {'codeset_ids': codeset_ids})
+    return csets_with_researchers(rows)
+
+
+async def get_csets_async(codeset_ids: List[int]) -> List[Dict]:
+    """Async version of get_csets(), for async routes"""
+    async with get_async_db_connection() as con:
+        rows: List = await sql_query_async(con, GET_CSETS_QUERY, {'codeset_ids': codeset_ids})
+    return csets_with_researchers(rows)
+
+
+def csets_with_researchers(rows: List[RowMapping]) -> List[Dict]:
+    """all_csets rows as dicts, with their researcher ids and roles"""
     row_dicts: List[Dict] = [dict(x) for x in rows]
     for row in row_dicts:
         row['researchers'] = get_row_researcher_ids_dict(row)
-
     return row_dicts
 
 
@@ -124,33 +137,43 @@ def get_cset_members_items(
         item: True if its an expression item, else false
         csm: false if not in concept set members
     """
-    if column and columns:
-        raise ValueError('Cannot specify both columns and column')
+    query, params = cset_members_items_query(codeset_ids, columns, column)
+    with get_db_connection() as con:
+        if column:  # with single column, don't return List[Dict] but just List(<column>)
+            return sql_query_single_col(con, query, params)
+        return sql_query(con, query, params, return_with_keys=return_with_keys)
 
-    with (get_db_connection() as con):
-        where = f" WHERE codeset_id = ANY(:codeset_ids)"
-        params = {'codeset_ids': codeset_ids or []}
 
+async def get_cset_members_items_async(
+    codeset_ids: Union[List[int], None] = None,
+    columns: Union[List[str], None] = None,
+    column: Union[str, None] = None,
+    return_with_keys: bool = True,
+) -> Union[List[int], List]:
+    """Async version of get_cset_members_items(), for async routes"""
+    query, params = cset_members_items_query(codeset_ids, columns, column)
+    async with get_async_db_connection() as con:
         if column:
-            columns = [column]
+            return await sql_query_single_col_async(con, query, params)
+        return await sql_query_async(con, query, params, return_with_keys=return_with_keys)
 
-        if columns:
-            select = sql.SQL("SELECT DISTINCT {}" + " FROM cset_members_items").format(
-                sql.SQL(', ').join(map(sql.Identifier, columns)),
-                sql.SQL(', ').join(sql.Placeholder() * len(columns)))
-            # noinspection PyUnresolvedReferences false_positive
-            select = select.as_string(con.connection.connection)
-        else:
-            select = "SELECT * FROM cset_members_items"
-
-        query = text(select + where)
-
-        if column:  # with single column, don't return List[Dict] but just List(<column>)
-            res: List = sql_query_single_col(con, query, params)
-        else:
-            res: List = sql_query(con, query, params, return_with_keys=return_with_keys)
 
-    return res
+def cset_members_items_query(
+    codeset_ids: Union[List[int], None] = None, columns: Union[List[str], None] = None, column: Union[str, None] = None
+) -> Tuple[TextClause, Dict]:
+    """Query and params for get_cset_members_items()"""
+    if column and columns:
+        raise ValueError('Cannot specify both columns and column')
+    if column:
+        columns = [column]
+    if columns:
+        # Quoted as identifiers, as psycopg2.sql.Identifier does, but w/out needing a psycopg2 connection
+        select = 'SELECT DISTINCT ' + ', '.join(['"' + c.replace('"', '""') + '"' for c in columns]) + \
+            ' FROM cset_members_items'
+    else:
+        select = "SELECT * FROM cset_members_items"
+    where = f" WHERE codeset_id = ANY(:codeset_ids)"
+    return text(select + where), {'codeset_ids': codeset_ids or []}
 
 
 @router.get("/get-cset-members-items")
@@ -167,7 +190,7 @@ async def _get_cset_members_items(
     await rpt.start_rpt(request, params={'codeset_ids': requested_codeset_ids})
 
     try:
-        rows = get_cset_members_items(requested_codeset_ids, columns, column, return_with_keys)
+        rows = await get_cset_members_items_async(requested_codeset_ids, columns, column, return_with_keys)
         await rpt.finish(rows=len(rows))
     except Exception as e:
         await rpt.log_error(e)
@@ -227,6 +250,12 @@ def last_refreshed_db():
         results = sql_query_single_col(con, q)
     return results[0]
 
+@router.get('/db-pool-stats')
+def db_pool_stats() -> List[Dict]:
+    """Connection pool status and checkout / wait / overflow counters of this worker's DB engines"""
+    return get_engine_stats()
+
+
 @cache
 @router.get('/omop-id-from-concept-name/{name}')
 def omop_id_from_concept_name(name):
@@ -249,7 +278,7 @@ async def get_concepts_route(request: Request, id: List[str] = Query(...), table
     await rpt.start_rpt(request, params={'concept_ids': id})
 
     try:
-        rows = get_concepts(concept_ids=id, table=table)
+        rows = await get_concepts_async(concept_ids=id, table=table)
         await rpt.finish(rows=len(rows))
     except Exception as e:
         await rpt.log_error(e)
@@ -287,8 +316,8 @@ async def _concept_search(search_str: str, sort_by: str = "-total_cnt|vocabulary
       WHERE concept_name ILIKE :search_str
       ORDER BY {', '.join(sort_cols)} DESC
     """
-    with get_db_connection() as con:
-        concept_ids = sql_query_single_col(con, q, { "search_str": '%' + search_str + '%', })
+    async with get_async_db_connection() as con:
+        concept_ids = await sql_query_single_col_async(con, q, { "search_str": '%' + search_str + '%', })
     return concept_ids
 
 @router.get("/api-call-logging-on")
@@ -354,7 +383,7 @@ async def _get_csets(
     await rpt.start_rpt(request, params={'codeset_ids': requested_codeset_ids})
 
     try:
-        csets = get_csets(requested_codeset_ids)
+        csets = await get_csets_async(requested_codeset_ids)
         await rpt.finish(rows=len(csets))
     except Exception as e:
         await rpt.log_error(e)
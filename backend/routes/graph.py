@@ -1,118 +1,304 @@
 """Graph related functions and routes"""
+import json
 import os, warnings
-import dateutil.parser as dp
-from datetime import datetime
 from pathlib import Path
-from typing import Any, Iterable, List, Set, Tuple, Union, Dict, Optional
+from typing import Any, Callable, List, Set, Tuple, Union, Dict, Optional
 
-import pickle
-import networkx as nx
-from fastapi import APIRouter, Query, Request
-from networkx import DiGraph
-from sqlalchemy import Row, RowMapping
-from sqlalchemy.sql import text
+import numpy as np
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from sqlalchemy import RowMapping
 
-from backend.routes.db import get_cset_members_items
-from backend.db.queries import get_concepts
+from backend.routes.db import get_cset_members_items_async
+from backend.db.queries import get_concepts_async
 from backend.db.utils import check_db_status_var, get_db_connection, SCHEMA
+from backend.graph.ancestry import AncestorIndex, connecting_ancestors, lowest_common_ancestor
+from backend.graph.attributes import NodeAttributes
+from backend.graph.compact_graph import CompactGraph
+from backend.graph.components import ComponentIndex, component_ids, component_roots
+from backend.graph.concept_filter import ConceptArrays, attribute_arrays, concat_concept_arrays, encode_concepts, \
+    filter_concept_arrays
+from backend.graph.condense import collapsed_page, condense_super_nodes, pack_collapsed, placeholder_id
+from backend.graph.export import EDGE_FORMATS, compact_concept_graph, edge_dtype, stream_edges
+from backend.graph.ingest import copy_edges
+from backend.graph.layout import layered_layout
+from backend.graph.loader import GraphLoader
+from backend.graph.reachability import ReachabilityIndex
+from backend.graph.response_cache import ResponseCache
+from backend.graph.snapshot import SnapshotError, load_graph_snapshot, read_header, save_graph_snapshot, snapshot_lock
 from backend.api_logger import Api_logger
 from backend.utils import get_timer, commify
 
 VERBOSE = False
 PROJECT_DIR = Path(os.path.dirname(__file__)).parent.parent
 VOCABS_PATH = os.path.join(PROJECT_DIR, 'termhub-vocab')
-GRAPH_PATH = os.path.join(VOCABS_PATH, 'relationship_graph.pickle')
-GRAPH_UNDIRECTED_PATH = os.path.join(VOCABS_PATH, 'relationship_graph_undirected.pickle')
+GRAPH_PATH = os.path.join(VOCABS_PATH, 'relationship_graph.snapshot')
+GRAPH_RETRY_AFTER_SECONDS = 30
+CONCEPT_GRAPH_FORMATS = ('json', 'compact')
+CONCEPT_GRAPH_CACHE_MB = int(os.getenv('TERMHUB_CONCEPT_GRAPH_CACHE_MB', 256))
+# How often each worker checks for a new vocab / snapshot to hot-swap in. 0 to disable.
+GRAPH_WATCH_SECONDS = float(os.getenv('TERMHUB_GRAPH_WATCH_SECONDS', 60))
 
 router = APIRouter(
     responses={404: {"description": "Not found"}},
 )
 
 
+def graph_not_ready_response() -> JSONResponse:
+    """503 response for graph routes called while the graph is still loading"""
+    return JSONResponse(
+        status_code=503, headers={'Retry-After': str(GRAPH_RETRY_AFTER_SECONDS)},
+        content={'detail': 'Relationship graph is loading. Try again shortly.', **GRAPH_LOADER.status()})
+
+
+@router.get("/ready")
+def ready():
+    """Report whether the relationship graph is loaded, and loading progress if not"""
+    status = GRAPH_LOADER.status()
+    if not status['ready']:
+        return JSONResponse(status_code=503, headers={'Retry-After': str(GRAPH_RETRY_AFTER_SECONDS)}, content=status)
+    return status
+
+
+def get_data_version() -> Tuple[Union[str, None], Union[str, None]]:
+    """DB and vocab refresh timestamps. Graph route responses only change when one of these does."""
+    return check_db_status_var('last_refresh_success'), check_db_status_var('last_refreshed_vocab_tables')
+
+
+def json_bytes(content: Any) -> bytes:
+    """Serialize response content to JSON. Sets become sorted lists."""
+    return json.dumps(content, separators=(',', ':'), default=sorted).encode('utf-8')
+
+
+# get_data_version() queries the DB, so the version is checked off the event loop, by cache_get()
+CONCEPT_GRAPH_CACHE = ResponseCache(CONCEPT_GRAPH_CACHE_MB * 1024 * 1024, get_data_version, check_on_access=False)
+
+
+async def cache_get(key: Tuple) -> Union[bytes, None]:
+    """Get a cached graph route response, first checking the data version in a thread if it's due"""
+    if CONCEPT_GRAPH_CACHE.version_check_due():
+        await run_in_threadpool(CONCEPT_GRAPH_CACHE.check_version)
+    return CONCEPT_GRAPH_CACHE.get(key)
+
+
+def cache_put(key: Tuple, content: bytes, generation: int):
+    """Cache a graph route response, unless the graph has been swapped since generation, which was read before the
+    response was computed. Otherwise a response built from the old graph could be cached just after the swap cleared
+    the cache."""
+    if GRAPH_LOADER.generation == generation:
+        CONCEPT_GRAPH_CACHE.put(key, content)
+
+
+@router.get("/concept-graph/cache-stats")
+def concept_graph_cache_stats() -> Dict[str, Any]:
+    """Hit, miss, and eviction counts etc for the /concept-graph response cache"""
+    return CONCEPT_GRAPH_CACHE.stats()
+
+
+def concept_graph_cache_key(
+    codeset_ids: Union[List[int], None], cids: Union[List[int], None], hide_vocabs: List[str],
+    hide_nonstandard_concepts, all_descendants, connect_roots, super_node_threshold: Union[int, None], kind: str,
+    components=False
+) -> Tuple:
+    """Normalized /concept-graph request parameters, as a cache key. kind: Response format, or e.g. 'layout'."""
+    return (
+        tuple(sorted(set(codeset_ids or []))), tuple(sorted(set(cids or []))), tuple(sorted(set(hide_vocabs))),
+        bool(hide_nonstandard_concepts), bool(all_descendants), kind, bool(connect_roots), super_node_threshold or None,
+        bool(components))
+
+
+def super_nodes_cache_key(
+    codeset_ids: Union[List[int], None], cids: Union[List[int], None], hide_vocabs: List[str],
+    hide_nonstandard_concepts, all_descendants, connect_roots, super_node_threshold: int
+) -> Tuple:
+    """Cache key for the children collapsed under super nodes, which condensed_concept_graph() caches for
+    /concept-graph/expand-super-node. They're the same whatever the response format."""
+    return concept_graph_cache_key(
+        codeset_ids, cids, hide_vocabs, hide_nonstandard_concepts, all_descendants, connect_roots,
+        super_node_threshold, 'super-nodes')
+
+
 @router.get("/concept-graph")
 async def concept_graph_get(
     request: Request, codeset_ids: Optional[List[int]] = Query(None), cids: Optional[List[int]] = Query(None),
-    hide_vocabs = ['RxNorm Extension'], hide_nonstandard_concepts=False, verbose = VERBOSE,
+    hide_vocabs = ['RxNorm Extension'], hide_nonstandard_concepts=False, verbose = VERBOSE, all_descendants=False,
+    format: str = 'json', connect_roots=False, super_node_threshold: Optional[int] = Query(None, ge=1),
+    components=False,
 ) -> Dict[str, Any]:
     """Return concept graph"""
     cids = cids if cids else []
-    return await concept_graph_post(request, codeset_ids, cids, hide_vocabs, hide_nonstandard_concepts, verbose)
+    return await concept_graph_post(
+        request, codeset_ids, cids, hide_vocabs, hide_nonstandard_concepts, verbose, all_descendants, format,
+        connect_roots, super_node_threshold, components)
 
 
 @router.post("/concept-graph")
 async def concept_graph_post(
     request: Request, codeset_ids: List[int], cids: Union[List[int], None] = [],
-    hide_vocabs = ['RxNorm Extension'], hide_nonstandard_concepts=False, verbose = VERBOSE,
+    hide_vocabs = ['RxNorm Extension'], hide_nonstandard_concepts=False, verbose = VERBOSE, all_descendants=False,
+    format: str = 'json', connect_roots=False, super_node_threshold: Optional[int] = Query(None, ge=1),
+    components=False,
 ) -> Dict:
-    """Return concept graph via HTTP POST"""
+    """Return concept graph via HTTP POST
+
+    :param all_descendants: Include all descendants of the concepts, rather than only their children.
+    :param connect_roots: Include the ancestors that connect the concepts' disconnected roots to a common ancestor.
+    :param super_node_threshold: If set, collapse the leaf children of concepts with more children than this into a
+     placeholder node, so responses stay small however broad the hierarchy. The collapsed concepts are left out of
+     concept_ids, and super_nodes maps each super node to its placeholder_id and n_collapsed. Fetch them with
+     /concept-graph/expand-super-node. See backend/graph/condense.py.
+    :param components: Include the hierarchy (weakly connected component of the whole graph) of each node: in json
+     format, as a map of concept_id to component id; in compact format, as a list parallel to the decoded nodes.
+    :param format: json (default): edges as [source, target] concept_id pairs. compact: node table plus edges as index
+     pairs, with id lists delta-encoded; see compact_concept_graph()."""
+    if not GRAPH_LOADER.ready:
+        return graph_not_ready_response()
+    if format not in CONCEPT_GRAPH_FORMATS:
+        raise HTTPException(status_code=400, detail=f'format must be one of: {", ".join(CONCEPT_GRAPH_FORMATS)}')
     rpt = Api_logger()
     try:
         await rpt.start_rpt(request, params={'codeset_ids': codeset_ids, 'cids': cids})
 
         hide_vocabs = hide_vocabs if isinstance(hide_vocabs, list) else []
-        sg: DiGraph
-        hidden_by_voc: Dict[str, Set[int]]
+        cache_key = concept_graph_cache_key(
+            codeset_ids, cids, hide_vocabs, hide_nonstandard_concepts, all_descendants, connect_roots,
+            super_node_threshold, format, components)
+        content: Union[bytes, None] = await cache_get(cache_key)
+        if content is not None:
+            await rpt.finish()
+            return Response(content=content, media_type='application/json', headers={'X-Cache': 'HIT'})
+        generation: int = GRAPH_LOADER.generation
+        rel_graph: CompactGraph = GRAPH_LOADER.get()  # once, so all of the response comes from the same graph
+
+        sg: CompactGraph
+        hidden_dict: Dict[str, Set[int]]
         nonstandard_concepts_hidden: Set[int]
 
-        sg, concept_ids, hidden_dict, nonstandard_concepts_hidden = await concept_graph(
-            codeset_ids, cids, hide_vocabs, hide_nonstandard_concepts, verbose)
-        missing_from_graph = set(concept_ids) - set(sg.nodes)
+        sg, concept_ids, missing_from_graph, hidden_dict, nonstandard_concepts_hidden, super_nodes = \
+            await condensed_concept_graph(
+                codeset_ids, cids, hide_vocabs, hide_nonstandard_concepts, verbose, all_descendants, connect_roots,
+                super_node_threshold, rel_graph)
 
+        content = json_bytes(concept_graph_response(
+            sg, concept_ids, missing_from_graph, hidden_dict, nonstandard_concepts_hidden, super_nodes, format,
+            components, rel_graph))
+        cache_put(cache_key, content, generation)
         await rpt.finish(rows=len(sg))
-        return {
-            'edges': list(sg.edges),
-            'concept_ids': concept_ids,
-            'missing_from_graph': missing_from_graph,
-            'hidden_by_vocab': hidden_dict,
-            'nonstandard_concepts_hidden': nonstandard_concepts_hidden}
+        return Response(content=content, media_type='application/json', headers={'X-Cache': 'MISS'})
     except Exception as e:
         await rpt.log_error(e)
         raise e
 
 
+def concept_graph_response(
+    sg: CompactGraph, concept_ids: Set[int], missing_from_graph: Set[int], hidden_by_voc: Dict[str, Set[int]],
+    nonstandard_concepts_hidden: Set[int], super_nodes: Union[Dict[int, Dict[str, int]], None] = None,
+    format: str = 'json', components=False, rel_graph: CompactGraph = None
+) -> Dict[str, Any]:
+    """/concept-graph response content, from the outputs of condensed_concept_graph(). See concept_graph_post().
+
+    :param rel_graph: The relationship graph that sg came from. Needed for components."""
+    if format == 'compact':
+        response = compact_concept_graph(
+            sg, concept_ids, missing_from_graph, hidden_by_voc, nonstandard_concepts_hidden)
+    else:
+        response = {
+            'edges': sg.edges.tolist(),
+            'concept_ids': concept_ids,
+            'missing_from_graph': missing_from_graph,
+            'hidden_by_vocab': hidden_by_voc,
+            'nonstandard_concepts_hidden': nonstandard_concepts_hidden}
+    if super_nodes is not None:
+        response['super_nodes'] = super_nodes
+    if components:
+        # Placeholders are in their super node's hierarchy
+        labels: List[int] = component_ids(rel_graph, np.abs(sg.nodes)).tolist()
+        response['components'] = labels if format == 'compact' else dict(zip(sg.nodes.tolist(), labels))
+    return response
+
+
+async def condensed_concept_graph(
+    codeset_ids: Union[List[int], None], cids: Union[List[int], None] = [], hide_vocabs = [],
+    hide_nonstandard_concepts=False, verbose = VERBOSE, all_descendants = False, connect_roots = False,
+    super_node_threshold: Union[int, None] = None, rel_graph: CompactGraph = None
+) -> Tuple[CompactGraph, Set[int], Set[int], Dict[str, Set[int]], Set[int], Union[Dict[int, Dict[str, int]], None]]:
+    """concept_graph(), with super nodes condensed if super_node_threshold is set
+
+    Also caches the collapsed children, so /concept-graph/expand-super-node can page through them w/out redoing this.
+
+    :returns (sg, concept_ids, missing_from_graph, hidden_by_voc, nonstandard_concepts_hidden, super_nodes).
+     super_nodes is None if not condensing."""
+    generation: int = GRAPH_LOADER.generation
+    sg, concept_ids, hidden_by_voc, nonstandard_concepts_hidden = await concept_graph(
+        codeset_ids, cids, hide_vocabs, hide_nonstandard_concepts, verbose, all_descendants, connect_roots, rel_graph)
+    missing_from_graph = set(concept_ids) - set(sg.nodes.tolist())
+    super_nodes: Union[Dict[int, Dict[str, int]], None] = None
+    if super_node_threshold:
+        sg, collapsed = condense_super_nodes(sg, super_node_threshold)
+        cache_put(super_nodes_cache_key(
+            codeset_ids, cids, hide_vocabs, hide_nonstandard_concepts, all_descendants, connect_roots,
+            super_node_threshold), pack_collapsed(collapsed), generation)
+        concept_ids = concept_ids.difference(*[ids.tolist() for ids in collapsed.values()])
+        super_nodes = {node: {'placeholder_id': placeholder_id(node), 'n_collapsed': len(ids)}
+                       for node, ids in collapsed.items()}
+    return sg, concept_ids, missing_from_graph, hidden_by_voc, nonstandard_concepts_hidden, super_nodes
+
+
 async def concept_graph(
     codeset_ids: Union[List[int], None], cids: Union[List[int], None] = [], hide_vocabs = [],
-    hide_nonstandard_concepts=False, verbose = VERBOSE, all_descendants = True
- ) -> Tuple[DiGraph, Set[int], Set[int], Dict[str, Set[int]], Set[int]]:
+    hide_nonstandard_concepts=False, verbose = VERBOSE, all_descendants = False, connect_roots = False,
+    rel_graph: CompactGraph = None
+ ) -> Tuple[CompactGraph, Set[int], Dict[str, Set[int]], Set[int]]:
     """Return concept graph
 
         concepts/concept_ids will include all definition and expansion concepts for codeset_ids
             plus any cids that are passed in
+    :param all_descendants: If True, add all descendants of the concepts (via the reachability index), not just their
+     children.
+    :param connect_roots: If True, add the ancestors that connect the roots of the concepts (those with no parent among
+     them) to their lowest common ancestor. See backend/graph/ancestry.py.
+    :param rel_graph: Relationship graph to use. Defaults to the loaded one; callers that use it again for the same
+     request should get it once and pass it, so a hot swap in between doesn't mix graphs.
     :returns
       hidden_by_voc: Map of vocab to set of concept ids"""
     timer = get_timer('')
     verbose and timer('concept_graph()')
+    rel_graph: CompactGraph = rel_graph if rel_graph is not None else GRAPH_LOADER.get()
 
-    # Get concepts & metadata
-    concepts_unfiltered: List[RowMapping] = get_cset_members_items(
+    # Get concepts & metadata, as parallel arrays. Members' vocab & standard_concept come from cset_members_items, so
+    # members that aren't in the graph or in concepts_with_counts are kept, and reported as missing from the graph.
+    members: List[Union[Dict[str, Any], RowMapping]] = await get_cset_members_items_async(
         codeset_ids=codeset_ids, columns=['concept_id', 'vocabulary_id', 'standard_concept'])
-    concepts: List[Dict[str, Any]]
+    if cids:
+        more = await get_concept_arrays(rel_graph, cids)
+        concepts = concat_concept_arrays(more, encode_concepts(members, more[3]))
+    else:
+        concepts = encode_concepts(members)
     hidden_by_voc: Dict[str, Set[int]]
     nonstandard_concepts_hidden: Set
 
-    if cids:
-        more_concepts = get_concepts(cids)
-        concepts_unfiltered.extend(more_concepts)
-
     # - filter: by vocab & non-standard
-    concepts, hidden_by_voc, nonstandard_concepts_hidden = filter_concepts(
-        concepts_unfiltered, hide_vocabs, hide_nonstandard_concepts)
-    concept_ids: Set[int] = set([c['concept_id'] for c in concepts])
+    keep, hidden_by_voc, nonstandard_concepts_hidden = filter_concept_arrays(
+        *concepts, hide_vocabs, hide_nonstandard_concepts)
+    concept_ids: Set[int] = set(concepts[0][keep].tolist())
     # concept_ids.update(cids)  # future
 
     # 2024-10-22. What if we get all descendants, not just missing in between?
     # 2024-11-18. It's been working ok. Now getting rid of all missing-in-between stuff.
     #               Return to commit fdb472ee1bf14156e87c324f2d7297ea2df3601d to get it back.
-    more_concept_ids: Set[int] = get_all_descendants(REL_GRAPH, concept_ids)
+    more_concept_ids: Set[int] = get_all_descendants(rel_graph, concept_ids, None if all_descendants else 1)
+
+    if connect_roots:
+        more_concept_ids.update(get_connecting_ancestors(rel_graph, concept_ids))
 
     # merge and filter
-    more_concepts: List[RowMapping] = get_concepts(more_concept_ids)
-    concepts_m: List[Dict]
+    more_concepts = await get_concept_arrays(rel_graph, more_concept_ids)
     hidden_by_voc_m: Dict[str, Set[int]]
     nonstandard_concepts_hidden_m: Set
     # - filter more_concepts: by vocab & non-standard
-    concepts_m, hidden_by_voc_m, nonstandard_concepts_hidden_m = filter_concepts(
-        more_concepts, hide_vocabs, hide_nonstandard_concepts)
+    _, hidden_by_voc_m, nonstandard_concepts_hidden_m = filter_concept_arrays(
+        *more_concepts, hide_vocabs, hide_nonstandard_concepts)
 
     # Merge: more_concepts into concept_ids
     concept_ids.update(more_concept_ids)
@@ -121,24 +307,76 @@ async def concept_graph(
     nonstandard_concepts_hidden = nonstandard_concepts_hidden.union(nonstandard_concepts_hidden_m)
 
     # Get subgraph
-    sg: DiGraph = REL_GRAPH.subgraph(concept_ids)
+    sg: CompactGraph = rel_graph.subgraph(concept_ids)
 
     # Return
     verbose and timer('done')
     return sg, concept_ids, hidden_by_voc, nonstandard_concepts_hidden
 
 
-def get_all_descendants(g: nx.DiGraph, subgraph_nodes: Union[List[int], Set[int]]) -> Set[int]:
+async def get_concept_arrays(g: CompactGraph, concept_ids: Union[List[int], Set[int]]) -> ConceptArrays:
+    """Get concept_ids, vocabulary codes, and standard flags of concepts, from the graph's node attributes
+
+    Falls back to querying concepts_with_counts for any concepts the attributes don't cover, or for all of them if the
+    graph has no attributes. Concepts found in neither are left out.
+    :returns (ids, vocabs, standard, vocab_names), as for filter_concept_arrays()"""
+    if g.attributes is None:
+        return encode_concepts(await get_concepts_async(concept_ids))
+    ids = np.fromiter(concept_ids, dtype=np.int64, count=len(concept_ids))
+    found = g.attributes.contains(ids)
+    concepts: ConceptArrays = attribute_arrays(g.attributes, ids[found])
+    if not found.all():
+        concepts = concat_concept_arrays(
+            concepts, encode_concepts(await get_concepts_async(ids[~found].tolist()), concepts[3]))
+    return concepts
+
+
+def get_all_descendants(
+    g: CompactGraph, subgraph_nodes: Union[List[int], Set[int]], depth: Union[int, None] = 1
+) -> Set[int]:
     """Get all descendants of a set of nodes
 
     Using this instead of get_missing_in_between_nodes. this way the front end has the entire descendant tree for all
     concepts being looked at.
+
+    :param depth: Levels of descendants to get. Defaults to 1, i.e. children only. If None, gets all of them.
     """
-    descendants: Set[int] = set()
-    for node in subgraph_nodes:
-        if g.has_node(node):
-            descendants.update(g.successors(node))
-    return descendants
+    return set(g.descendants(subgraph_nodes, depth).tolist())
+
+
+def get_connecting_ancestors(g: CompactGraph, concept_ids: Union[List[int], Set[int]]) -> Set[int]:
+    """Get the ancestors that connect the roots of concept_ids, i.e. those with no parent among them, to a common
+    ancestor. Replaces the old per-node nx.ancestors() approach of find_nearest_common_ancestor() / connect_roots()."""
+    sg: CompactGraph = g.subgraph(concept_ids)
+    roots = sg.nodes[np.diff(sg.rev_offsets) == 0]
+    return set(connecting_ancestors(g, roots).tolist())
+
+
+@router.get("/lowest-common-ancestor")
+def lowest_common_ancestor_route(cids: List[int] = Query(...)) -> Dict[str, Any]:
+    """Lowest common ancestor of concepts, and the ancestors that connect them to it
+
+    Computed on a shortest-path spanning tree of the graph, so this is a common ancestor, but not always the lowest in
+    the full hierarchy. lowest_common_ancestor is null if the concepts have no common ancestor in that tree."""
+    if not GRAPH_LOADER.ready:
+        return graph_not_ready_response()
+    g: CompactGraph = GRAPH_LOADER.get()
+    return {
+        'lowest_common_ancestor': lowest_common_ancestor(g, cids),
+        'connecting_concept_ids': connecting_ancestors(g, cids).tolist()}
+
+
+@router.get("/concept-hierarchies")
+def concept_hierarchies(cids: List[int] = Query(...)) -> Dict[str, Any]:
+    """Which hierarchies (weakly connected components of the graph) concepts are part of, and those hierarchies' roots
+
+    :returns components: Map of concept_id to component id, or -1 if not in the graph. roots: concept_ids."""
+    if not GRAPH_LOADER.ready:
+        return graph_not_ready_response()
+    g: CompactGraph = GRAPH_LOADER.get()
+    return {
+        'components': dict(zip(cids, component_ids(g, cids).tolist())),
+        'roots': component_roots(g, cids).tolist()}
 
 
 # TODO: @Siggie: move below to frontend
@@ -166,24 +404,14 @@ def filter_concepts(
 ) -> Tuple[List[Dict], Dict[str, Set[int]], Set[int]]:
     """Get lists of concepts for graph
 
+    Wrapper around filter_concept_arrays() for concepts as dicts.
+
     :param: concepts: List of concept ids as keys, and metadata as values.
     :returns
       hidden_by_voc: Map of vocab to set of concept ids"""
-    # Hide by vocabulary
-    hidden_by_voc: Dict[str, Set[int]] = {}
-    for vocab in hide_vocabs:  # for each vocab being hidden, separate out the concepts
-        hidden_i: Set[int] = set([c['concept_id'] for c in concepts if c['vocabulary_id'] == vocab])
-        if hidden_i:
-            hidden_by_voc[vocab] = hidden_i
-
-    # Hide non-standard concepts
-    nonstandard_concepts_hidden = set()
-    if hide_nonstandard_concepts:
-        nonstandard_concepts_hidden: Set[int] = set([c['concept_id'] for c in concepts if c['standard_concept'] != 'S'])
-
-    # Get filtered concepts
-    hidden_nodes = set().union(*list(hidden_by_voc.values())).union(nonstandard_concepts_hidden)
-    filtered_concepts: List[Dict[str, Any]] = [c for c in concepts if c['concept_id'] not in hidden_nodes]
+    keep, hidden_by_voc, nonstandard_concepts_hidden = filter_concept_arrays(
+        *encode_concepts(concepts), hide_vocabs, hide_nonstandard_concepts)
+    filtered_concepts: List[Dict[str, Any]] = [c for c, k in zip(concepts, keep.tolist()) if k]
     return filtered_concepts, hidden_by_voc, nonstandard_concepts_hidden
 
 
@@ -194,149 +422,281 @@ print_stack = lambda s: ' | '.join([f"{n} => {','.join([str(x) for x in p])}" fo
 
 
 @router.get("/wholegraph")
-def wholegraph():
-    """Get subgraph edges for the whole graph"""
-    return list(REL_GRAPH.edges)
+def wholegraph(format: str = 'json'):
+    """Get subgraph edges for the whole graph
+
+    Streamed in chunks, so memory use doesn't grow with the size of the graph.
+
+    :param format: json (default): [[source, target], ...]. ndjson: one [source, target] per line. binary:
+     little-endian int32 (or int64, see X-Edge-Dtype header) source, target pairs. arrow: Arrow IPC stream."""
+    if not GRAPH_LOADER.ready:
+        return graph_not_ready_response()
+    if format not in EDGE_FORMATS:
+        raise HTTPException(status_code=400, detail=f'format must be one of: {", ".join(EDGE_FORMATS)}')
+    g: CompactGraph = GRAPH_LOADER.get()
+    return StreamingResponse(
+        stream_edges(g, format), media_type=EDGE_FORMATS[format],
+        headers={'X-Edge-Count': str(g.number_of_edges()), 'X-Edge-Dtype': edge_dtype(g).name})
+
+
+@router.get("/concept-graph/expand-super-node")
+async def expand_super_node(
+    super_node: int, super_node_threshold: int = Query(..., ge=1), codeset_ids: Optional[List[int]] = Query(None),
+    cids: Optional[List[int]] = Query(None), hide_vocabs = ['RxNorm Extension'], hide_nonstandard_concepts=False,
+    all_descendants=False, connect_roots=False, offset: int = 0, limit: int = 1000,
+) -> Dict[str, Any]:
+    """Get a page of the children collapsed under a super node by /concept-graph?super_node_threshold=
+
+    Takes the same parameters as the /concept-graph request that returned the super node. The collapsed children are
+    cached by that request, so pages are usually served from the cache.
+
+    :returns concept_ids: The page of children, sorted. total: Number of collapsed children."""
+    if not GRAPH_LOADER.ready:
+        return graph_not_ready_response()
+    hide_vocabs = hide_vocabs if isinstance(hide_vocabs, list) else []
+    cache_key = super_nodes_cache_key(
+        codeset_ids, cids, hide_vocabs, hide_nonstandard_concepts, all_descendants, connect_roots, super_node_threshold)
+    packed: Union[bytes, None] = await cache_get(cache_key)
+    if packed is None:
+        generation: int = GRAPH_LOADER.generation
+        sg, _, _, _ = await concept_graph(
+            codeset_ids, cids or [], hide_vocabs, hide_nonstandard_concepts, False, all_descendants, connect_roots)
+        packed = pack_collapsed(condense_super_nodes(sg, super_node_threshold)[1])
+        cache_put(cache_key, packed, generation)
+    total, children = collapsed_page(packed, super_node, offset, limit)
+    return {
+        'super_node': super_node,
+        'placeholder_id': placeholder_id(super_node),
+        'total': total,
+        'offset': offset,
+        'limit': limit,
+        'concept_ids': children.tolist(),
+    }
+
+
+@router.get("/concept-graph/layout")
+async def concept_graph_layout(
+    request: Request, codeset_ids: Optional[List[int]] = Query(None), cids: Optional[List[int]] = Query(None),
+    hide_vocabs = ['RxNorm Extension'], hide_nonstandard_concepts=False, all_descendants=False, connect_roots=False,
+    super_node_threshold: Optional[int] = Query(None, ge=1),
+):
+    """Layered layout of the graph that /concept-graph returns for the same parameters
 
+    Layers and within-layer order are computed server side (see backend/graph/layout.py), and cached with the same
+    normalized key as /concept-graph responses, so popular concept sets are only laid out once.
 
-def condense_super_nodes(sg, threshhold=10):  # todo
-    """Condense super nodes"""
-    super_nodes = [node for node, degree in sg.out_degree() if degree > threshhold]
-    # for node in super_nodes:
-    # sg.discard(node) -- n
-    return NotImplementedError(super_nodes)
+    :returns nodes: concept_ids, including super node placeholders. layer, order: Parallel to nodes. n_layers."""
+    if not GRAPH_LOADER.ready:
+        return graph_not_ready_response()
+    rpt = Api_logger()
+    try:
+        await rpt.start_rpt(request, params={'codeset_ids': codeset_ids, 'cids': cids})
+        hide_vocabs = hide_vocabs if isinstance(hide_vocabs, list) else []
+        cache_key = concept_graph_cache_key(
+            codeset_ids, cids, hide_vocabs, hide_nonstandard_concepts, all_descendants, connect_roots,
+            super_node_threshold, 'layout')
+        content: Union[bytes, None] = await cache_get(cache_key)
+        if content is not None:
+            await rpt.finish()
+            return Response(content=content, media_type='application/json', headers={'X-Cache': 'HIT'})
+        generation: int = GRAPH_LOADER.generation
+
+        sg, _, _, _, _, _ = await condensed_concept_graph(
+            codeset_ids, cids or [], hide_vocabs, hide_nonstandard_concepts, False, all_descendants, connect_roots,
+            super_node_threshold)
+        content = json_bytes(layered_layout(sg))
+        cache_put(cache_key, content, generation)
+        await rpt.finish(rows=len(sg))
+        return Response(content=content, media_type='application/json', headers={'X-Cache': 'MISS'})
+    except Exception as e:
+        await rpt.log_error(e)
+        raise e
 
 
-# noinspection PyPep8Naming
-def expand_super_node(G, subgraph_nodes, super_node):  # todo
-    """Expand super node"""
-    # sg = G.subgraph(subgraph_nodes)
-    return NotImplementedError(G, subgraph_nodes, super_node)
-
-
-def from_pydot_layout(g):  # Todo
-    """From PyDot layout"""
-    return NotImplementedError(g)
-# def find_nearest_common_ancestor(G, nodes):
-#     all_ancestors = [set(nx.ancestors(G, node)) for node in nodes]
-#     common_ancestors = set.intersection(*all_ancestors)
-#
-#     # Find the lowest common ancestor
-#     lowest_common_ancestor = None
-#     for ancestor in common_ancestors:
-#         if all(ancestor in ancestors or ancestor == node for node, ancestors in zip(nodes, all_ancestors)):
-#             if lowest_common_ancestor is None or not ancestor in nx.ancestors(G, lowest_common_ancestor):
-#                 lowest_common_ancestor = ancestor
-#
-#     return lowest_common_ancestor
-#
-#
-# def connect_roots(G, target_nodes):
-#     # Find the nearest common ancestor
-#     nca = find_nearest_common_ancestor(G, target_nodes)
-#
-#     # Create a subgraph including the paths from the nearest common ancestor to the target nodes
-#     edges_to_include = set()
-#     for node in target_nodes:
-#         path = nx.shortest_path(G, nca, node)
-#         edges_to_include.update([tuple(l) for l in zip(path, path[1:])])
-#
-#     SG = G.edge_subgraph(edges_to_include).copy()
-#     return SG
-
-
-def generate_graph_edges() -> Iterable[Row]:
-    """Generate graph edges"""
+def get_graph_edges(progress: Callable[[int], None] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Get all graph edges, as (source_ids, target_ids) arrays, via binary COPY"""
     with get_db_connection() as con:
         # moving the sql to ddl-20-concept_graph.jinja.sql
+        return copy_edges(con, f'{SCHEMA}.concept_graph', progress=progress)
 
-        query = f"""
-        SELECT * FROM {SCHEMA}.concept_graph
-        """
 
-        result = con.execute(text(query))
+def get_node_attributes() -> NodeAttributes:
+    """Get vocabulary_id, standard_concept, etc of all concepts, as compact columns"""
+    with get_db_connection() as con:
+        return NodeAttributes.from_db(con, f'{SCHEMA}.concepts_with_counts')
+
 
-        for row in result:
-            yield row
+def get_progress_timer(name: str, progress: Callable[[str], None] = None) -> Callable[[str], None]:
+    """get_timer(), also passing each step's message to an optional progress callback"""
+    timer = get_timer(name)
+
+    def step(msg: str = ''):
+        """Step"""
+        timer(msg)
+        if progress:
+            progress(f'{name}: {msg}')
+    return step
 
 
 # todo: control verbosity?
-def create_rel_graphs(save_to_pickle: bool) -> DiGraph:
+def create_rel_graphs(
+    save_snapshot: bool, graph_path: str = GRAPH_PATH, progress: Callable[[str], None] = None
+) -> CompactGraph:
     """Create relationship graphs"""
-    timer = get_timer('create_rel_graphs')
+    timer = get_progress_timer('create_rel_graphs', progress)
 
     timer('get edge records')
-    edge_generator = generate_graph_edges()
+    # read before streaming edges: if vocab is refreshed mid-build, the snapshot will correctly be seen as outdated
+    vocab_refreshed: Union[str, None] = check_db_status_var('last_refreshed_vocab_tables')
+    sources, targets = get_graph_edges(progress=lambda n: timer(f'{commify(n)} rows loaded'))
 
+    timer('building compact graph')
     # noinspection PyPep8Naming
-    G = nx.DiGraph()
-    if save_to_pickle:
-        msg = 'loading and pickling'
-        pickle_file = open(GRAPH_PATH, 'ab')
-    else:
-        msg = 'loading'
-        pickle_file = None
-
-    timer(msg)
-    rownum = 0
-    chunk_size = 10000
-    msg = msg.replace('ing', 'ed')
-    edges = []
-    chunks_loaded = 0
-    for source, target in edge_generator:
-        edges.append((source, target))
-        rownum += 1
-        if rownum >= chunk_size:
-            chunks_loaded += 1
-            G.add_edges_from(edges)
-            edges = []
-            if chunks_loaded % 100 == 0:
-                timer(f'{commify(chunks_loaded * chunk_size)} rows {msg}')
-            rownum = 0
-
-    if save_to_pickle:
-        timer('saving to pickle')
-        pickle.dump(G, pickle_file)  # , pickle.HIGHEST_PROTOCOL
+    G = CompactGraph.from_edges(sources, targets)
+    timer('building reachability index')
+    G.reachability = ReachabilityIndex.build(G)
+    timer('building ancestor index')
+    G.ancestry = AncestorIndex.build(G)
+    timer('building component index')
+    G.components = ComponentIndex.build(G)
+    timer('loading node attributes')
+    G.attributes = get_node_attributes()
+
+    if save_snapshot:
+        timer(f'saving snapshot to {graph_path}')
+        save_graph_snapshot(G, graph_path, vocab_refreshed)
 
     timer('done')
     return G # , Gu
 
 
 def is_graph_up_to_date(graph_path: str = GRAPH_PATH) -> bool:
-    """Determine if the networkx relationship_graph derived from OMOP vocab is current"""
-    voc_last_updated = dp.parse(check_db_status_var('last_refreshed_vocab_tables'))
-    graph_last_updated = datetime.fromtimestamp(os.path.getmtime(graph_path))
-    if voc_last_updated.tzinfo and not graph_last_updated.tzinfo:  # if one has timezone, both need
-        graph_last_updated = graph_last_updated.replace(tzinfo=voc_last_updated.tzinfo)
-    return graph_last_updated > voc_last_updated
+    """Determine if the relationship_graph derived from OMOP vocab is current
+
+    Compares the vocab refresh timestamp recorded in the snapshot header when the graph was built against the current
+    `last_refreshed_vocab_tables`, rather than relying on file modification times."""
+    try:
+        header = read_header(graph_path)
+    except (OSError, SnapshotError):
+        return False
+    return header.get('vocab_refreshed') == check_db_status_var('last_refreshed_vocab_tables')
+
+
+def get_graph_delta() -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Get the edges added and removed by the last vocab refresh, as
+    (added_sources, added_targets, removed_sources, removed_targets)"""
+    with get_db_connection() as con:
+        added = copy_edges(con, f'{SCHEMA}.concept_graph_delta', where='added')
+        removed = copy_edges(con, f'{SCHEMA}.concept_graph_delta', where='NOT added')
+    return (*added, *removed)
+
+
+def update_graph_from_delta(
+    graph_path: str = GRAPH_PATH, progress: Callable[[str], None] = None
+) -> Union[CompactGraph, None]:
+    """Bring an outdated snapshot up to date by applying the edges added/removed by the last vocab refresh, rather than
+    rebuilding it from all of concept_graph. See record_concept_graph_delta().
+
+    :return: The updated graph, or None if the snapshot wasn't built from the graph that the delta applies to, in which
+    case a full rebuild is needed."""
+    timer = get_progress_timer('update_graph_from_delta', progress)
+    try:
+        header = read_header(graph_path)
+    except (OSError, SnapshotError):
+        return None
+    # read before fetching the delta: if vocab is refreshed meanwhile, the snapshot will correctly be seen as outdated
+    vocab_refreshed: Union[str, None] = check_db_status_var('last_refreshed_vocab_tables')
+    delta_base: Union[str, None] = check_db_status_var('concept_graph_delta_base')
+    if delta_base is None or header.get('vocab_refreshed') != delta_base or delta_base == vocab_refreshed:
+        return None
+
+    timer('get edge delta')
+    added_sources, added_targets, removed_sources, removed_targets = get_graph_delta()
+    timer(f'applying {commify(len(added_sources))} added and {commify(len(removed_sources))} removed edges')
+    # noinspection PyPep8Naming
+    G = load_graph_snapshot(graph_path, verify=True).apply_delta(
+        added_sources, added_targets, removed_sources, removed_targets)
+    timer('building reachability index')
+    G.reachability = ReachabilityIndex.build(G)
+    timer('building ancestor index')
+    G.ancestry = AncestorIndex.build(G)
+    timer('building component index')
+    G.components = ComponentIndex.build(G)
+    timer('loading node attributes')
+    G.attributes = get_node_attributes()
+    timer(f'saving snapshot to {graph_path}')
+    save_graph_snapshot(G, graph_path, vocab_refreshed, {'updated_from': delta_base})
+    timer('done')
+    return G
 
 
 # noinspection PyPep8Naming for_G
-def load_relationship_graph(graph_path: str = GRAPH_PATH, update_if_outdated=True, save=True) -> DiGraph:
-    """Load relationship graph from disk"""
-    timer = get_timer('./load_relationship_graph')
+def load_relationship_graph(
+    graph_path: str = GRAPH_PATH, update_if_outdated=True, save=True, verify=False,
+    progress: Callable[[str], None] = None
+) -> CompactGraph:
+    """Load relationship graph from disk
+
+    The snapshot is memory-mapped read-only, so all workers on a host share one copy of the graph in the page cache.
+
+    :param verify: Check an existing snapshot's contents against the checksum in its header, rebuilding it if corrupt.
+     This reads every page of the file, so is off by default. Snapshots that were just rebuilt or updated from the vocab
+     delta are always verified.
+    :param progress: Optional callback that receives a message at each step."""
+    timer = get_progress_timer('load_relationship_graph', progress)
     timer(f'loading {graph_path}')
-    up_to_date = True if not update_if_outdated else is_graph_up_to_date(graph_path)
-    if os.path.isfile(graph_path) and up_to_date:
-        with open(graph_path, 'rb') as pickle_file:
-            G: DiGraph = pickle.load(pickle_file)
-    else:
-        G: DiGraph = create_rel_graphs(save)
+
+    def load_if_current() -> Union[CompactGraph, None]:
+        """Load snapshot if it exists, is up to date, and is valid"""
+        up_to_date = True if not update_if_outdated else is_graph_up_to_date(graph_path)
+        if os.path.isfile(graph_path) and up_to_date:
+            try:
+                return load_graph_snapshot(graph_path, verify)
+            except SnapshotError as err:
+                warnings.warn(f'Could not load graph snapshot; rebuilding. {err}')
+        return None
+
+    G: Union[CompactGraph, None] = load_if_current()
+    if G is None and not save:
+        G = create_rel_graphs(save, graph_path, progress)
+    elif G is None:
+        timer('waiting for any other worker rebuilding the snapshot')
+        with snapshot_lock(graph_path):
+            G = load_if_current()  # another worker may have just rebuilt it
+            if G is None:
+                updated: Union[CompactGraph, None] = None
+                if update_if_outdated:
+                    try:
+                        updated = update_graph_from_delta(graph_path, progress)
+                    except Exception as err:
+                        warnings.warn(f'Could not update graph snapshot from vocab delta; rebuilding. {err}')
+                if updated is None:
+                    create_rel_graphs(save, graph_path, progress)
+                # swap private, freshly built arrays for the shared mapping, checking that the write was good
+                G = load_graph_snapshot(graph_path, verify=True)
     timer('done')
     return G
 
 
-LOAD_FROM_PICKLE = False
-LOAD_RELGRAPH = True
+def get_graph_version(graph_path: str = GRAPH_PATH) -> Tuple[Union[str, None], Union[str, None]]:
+    """Vocab refresh timestamp, and content hash of the snapshot file. A change in the former means the graph needs
+    updating; in the latter, that another worker has already written a new snapshot that can just be mapped."""
+    try:
+        snapshot_hash = read_header(graph_path).get('content_hash')
+    except (OSError, SnapshotError):
+        snapshot_hash = None
+    return check_db_status_var('last_refreshed_vocab_tables'), snapshot_hash
 
-if __name__ == '__main__':
-    pass
-else:
-    # if you don't want graph loaded, then somewhere up in the import tree, do this
-    #   import builtins
-    #   builtins.DONT_LOAD_GRAPH = True
-    import builtins
-    if hasattr(builtins, 'DONT_LOAD_GRAPH') and builtins.DONT_LOAD_GRAPH:
-        warnings.warn('not loading relationship graph')
-    else:
-        REL_GRAPH = load_relationship_graph()
+
+def loaded_graph_version(g: CompactGraph, version: Tuple[Union[str, None], Union[str, None]]) -> Tuple:
+    """Version of a just-loaded graph: the vocab refresh timestamp read before loading, so a refresh mid-load is still
+    seen, and the content hash of the snapshot actually loaded. Loading may itself (re)write the snapshot, so the hash
+    read before loading would differ, and cause a second, pointless reload."""
+    return version[0] if version else None, g.content_hash
+
+
+# Loaded in the background when the app starts; see app.py. Scripts & tests can use GRAPH_LOADER.wait(). Reloaded and
+# swapped in when the vocab is refreshed, after which cached responses built from the old graph are dropped.
+GRAPH_LOADER = GraphLoader(
+    load_relationship_graph, version_func=get_graph_version, watch_seconds=GRAPH_WATCH_SECONDS,
+    on_swap=CONCEPT_GRAPH_CACHE.clear, loaded_version_func=loaded_graph_version)
@@ -570,9 +570,12 @@ def fetch_cset_and_member_objects(
 def concept_set_members__from_csets_and_members__to_db(con: Connection, csets_and_members: CSETS_AND_MEMBERS_TYPE):
     """Take a 'csets_and_members' object and take what is needed to insert data into concept_set_members table."""
     container_lookup = {x['conceptSetId']: x for x in csets_and_members['OMOPConceptSetContainer']}
+    # One insert for all csets, so that big refreshes go through COPY; see insert_from_dicts()
+    table_objs: List[Dict] = []
     for cset in csets_and_members['OMOPConceptSet']:
         container = container_lookup[cset['properties']['conceptSetNameOMOP']]
-        concept_set_members__cset_rows_to_db(con, cset, cset['member_items'], container)
+        table_objs.extend(concept_set_members__cset_rows(cset, cset['member_items'], container))
+    insert_from_dicts(con, 'concept_set_members', table_objs, skip_if_already_exists=True)
 
 
 def csets_and_members_to_db(
@@ -753,11 +756,11 @@ def concept_enclave_to_db(
 # todo: New func for multiple csets in a single insert?
 # TODO: @Sigfried: I have some 'not sure' fields, I'm not sure if the field in concept_set_members should be taken from
 #  the cset or the member. I think the cset, but not 100% sure. And in one case, got from container. - joeflack4
-def concept_set_members__cset_rows_to_db(con: Connection, cset: Dict, members: List[Dict], container: Dict):
-    """Insert multiple rows into concept_set_members"""
+def concept_set_members__cset_rows(cset: Dict, members: List[Dict], container: Dict) -> List[Dict]:
+    """Rows of concept_set_members for a cset"""
     cset: Dict = cset['properties'] if 'properties' in cset else cset
     members: List[Dict] = [x['properties'] if 'properties' in x else x for x in members]
-    table_objs: List[Dict] = [{
+    return [{
         'codeset_id': cset['codesetId'],
         'concept_id': member['conceptId'],
         'concept_set_name': cset['conceptSetNameOMOP'],
@@ -766,7 +769,11 @@ def concept_set_members__cset_rows_to_db(con: Connection, cset: Dict, members: L
         'concept_name': member.get('conceptName', None),
         'archived': container.get('archived', False),
     } for member in members]
-    insert_from_dicts(con, 'concept_set_members', table_objs, skip_if_already_exists=True)
+
+
+def concept_set_members__cset_rows_to_db(con: Connection, cset: Dict, members: List[Dict], container: Dict):
+    """Insert multiple rows into concept_set_members"""
+    insert_from_dicts(con, 'concept_set_members', concept_set_members__cset_rows(cset, members, container))
 
 
 # deprecated?: The only function that calls this, concept_set_members_enclave_to_db(), has been deprecated
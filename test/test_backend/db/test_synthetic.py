@@ -0,0 +1,104 @@
+"""Tests for synthetic data generation
+
+How to run:
+    python -m unittest discover
+"""
+import os
+import sys
+import unittest
+from collections import defaultdict
+from pathlib import Path
+
+import numpy as np
+
+TEST_DIR = os.path.dirname(__file__)
+PROJECT_ROOT = Path(TEST_DIR).parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+from backend.db.synthetic import generate, generate_hierarchy, transitive_closure
+
+
+class TestSynthetic(unittest.TestCase):
+    """Tests for synthetic data generation"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tables = generate(3000, 40, seed=7)
+
+    def test_hierarchy_is_leveled_dag(self):
+        """Every edge goes from a lower level to a higher one, and every non-root has a parent on the level above"""
+        level, parent, child = generate_hierarchy(np.random.default_rng(0), 500, root_share=0.01)
+        self.assertTrue((level[parent] < level[child]).all())
+        has_parent_above = np.zeros(len(level), dtype=bool)
+        has_parent_above[child[level[parent] == level[child] - 1]] = True
+        self.assertTrue((has_parent_above == (level > 0)).all())
+
+    def test_transitive_closure(self):
+        """Closure matches a breadth-first search from each node, including min and max separation"""
+        level, parent, child = generate_hierarchy(np.random.default_rng(1), 300, root_share=0.02)
+        anc, desc, min_sep, max_sep = transitive_closure(level, parent, child)
+        parents = defaultdict(list)
+        for p, c in zip(parent.tolist(), child.tolist()):
+            parents[c].append(p)
+        expected = {}
+        for node in range(len(level)):
+            frontier, dist = {node}, 0
+            while frontier:
+                for a in frontier:
+                    lo, hi = expected.get((a, node), (dist, dist))
+                    expected[(a, node)] = (min(lo, dist), max(hi, dist))
+                frontier, dist = {p for x in frontier for p in parents[x]}, dist + 1
+        actual = {(a, d): (lo, hi) for a, d, lo, hi in zip(
+            anc.tolist(), desc.tolist(), min_sep.tolist(), max_sep.tolist())}
+        self.assertEqual(len(actual), len(anc))
+        self.assertEqual(actual, expected)
+
+    def test_columns(self):
+        """Tables have the columns that load_csv() and the DDL expect"""
+        self.assertEqual(list(self.tables['concept_ancestor'].columns), [
+            'ancestor_concept_id', 'descendant_concept_id', 'min_levels_of_separation', 'max_levels_of_separation'])
+        self.assertEqual(list(self.tables['concept_set_members'].columns), [
+            'codeset_id', 'concept_id', 'concept_set_name', 'is_most_recent_version', 'version', 'concept_name',
+            'archived'])
+        self.assertEqual(list(self.tables['concept_set_counts_clamped'].columns), [
+            'codeset_id', 'approx_distinct_person_count', 'approx_total_record_count'])
+
+    def test_referential_integrity(self):
+        """Members, items and edges refer to existing concepts and codesets, and primary keys are unique"""
+        t = self.tables
+        concept_ids = set(t['concept']['concept_id'])
+        codeset_ids = set(t['code_sets']['codeset_id'])
+        self.assertEqual(len(concept_ids), len(t['concept']))
+        self.assertEqual(len(codeset_ids), len(t['code_sets']))
+        for table, cols in [
+            ('concept_ancestor', ['ancestor_concept_id', 'descendant_concept_id']),
+            ('concept_relationship', ['concept_id_1', 'concept_id_2']),
+            ('concept_set_members', ['concept_id']), ('concept_set_version_item', ['concept_id'])
+        ]:
+            for col in cols:
+                self.assertTrue(set(t[table][col]) <= concept_ids, f'{table}.{col}')
+        self.assertEqual(set(t['concept_set_members']['codeset_id']), codeset_ids)
+        self.assertFalse(t['concept_set_members'].duplicated(['codeset_id', 'concept_id']).any())
+        self.assertTrue(set(t['code_sets']['concept_set_name']) <= set(t['concept_set_container']['concept_set_name']))
+
+    def test_members_are_item_expansion(self):
+        """Members are the included items and their descendants, minus the excluded ones and theirs"""
+        t = self.tables
+        ca = t['concept_ancestor']
+        descendants = ca.groupby('ancestor_concept_id')['descendant_concept_id'].apply(set).to_dict()
+        members = t['concept_set_members'].groupby('codeset_id')['concept_id'].apply(set).to_dict()
+        for codeset_id, items in t['concept_set_version_item'].groupby('codeset_id'):
+            included, excluded = set(), set()
+            for row in items.itertuples():
+                ids = descendants[row.concept_id] if row.includeDescendants else {row.concept_id}
+                (excluded if row.isExcluded else included).update(ids)
+            self.assertEqual(members[codeset_id], included - excluded)
+
+    def test_deterministic(self):
+        """Same seed, same data"""
+        again = generate(3000, 40, seed=7)
+        for table, df in self.tables.items():
+            self.assertTrue(df.equals(again[table]), table)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -8,14 +8,18 @@ import sys
 import unittest
 from pathlib import Path
 from typing import Dict, List
+from unittest import mock
 
 from sqlalchemy.engine.base import Connection
 
 TEST_DIR = os.path.dirname(__file__)
 PROJECT_ROOT = Path(TEST_DIR).parent.parent.parent
 sys.path.insert(0, str(PROJECT_ROOT))
-from backend.db.utils import get_db_connection, get_idle_connections, insert_fetch_statuses, run_sql, \
-    select_failed_fetches, sql_query
+from backend.db.utils import COPY_THRESHOLD_ROWS, SCHEMA, UNIQUE_KEYS, copy_chunks, dedupe_by_key, \
+    get_db_connection, get_engine, get_engine_stats, get_idle_connections, has_unique_key, insert_fetch_statuses, \
+    insert_from_dicts, on_conflict_clause, run_sql, select_failed_fetches, sql_query, update_from_dicts
+from enclave_wrangler.models import PKEYS
+from test.utils import TEST_SCHEMA
 
 
 # todo: add datetime to setUp and tearDown: It might be possible, despite failsafes being in place to prevent refreshes
@@ -83,6 +87,125 @@ class TestIdleConnections(unittest.TestCase):
         msg = f'{len(idle_cnx)} exceeds the theshold of {threshold} for interval {interval}.'
         self.assertLessEqual(len(idle_cnx), threshold, msg=msg)
 
+
+class TestEnginePool(unittest.TestCase):
+
+    def test_pooled_connections(self):
+        """Test that connections come from one pooled engine per schema, with the schema's search_path"""
+        self.assertIs(get_engine(schema=SCHEMA), get_engine(schema=SCHEMA))
+        self.assertIsNot(get_engine(schema=SCHEMA), get_engine(schema=''))
+        for _ in range(3):
+            with get_db_connection() as con:
+                search_path = sql_query(con, 'SHOW search_path;')[0]['search_path']
+                self.assertEqual(search_path, SCHEMA)
+        stats = [x for x in get_engine_stats() if x['schema'] == SCHEMA and not x['local']][0]
+        self.assertGreaterEqual(stats['checkouts'], 3)
+        # Connections were reused rather than opened each time
+        self.assertLess(stats['connects'], stats['checkouts'])
+        self.assertEqual(stats['checked_out'], 0)
+
+
+class TestCopy(unittest.TestCase):
+
+    def test_copy_chunks(self):
+        """Test that rows are formatted as CSV for COPY: NULLs unquoted and empty, everything else quoted, in chunks"""
+        rows = [
+            {'id': 1, 'name': 'a "quoted", name', 'flag': True, 'info': {'k': 1}},
+            {'id': 2, 'name': '', 'flag': None},
+            {'id': 3, 'name': None, 'flag': False, 'info': None}]
+        chunks = [x.getvalue() for x in copy_chunks(rows, ['id', 'name', 'flag', 'info'], chunk_size=2)]
+        self.assertEqual(chunks, [
+            '"1","a ""quoted"", name","True","{""k"": 1}"\n"2","",,\n',
+            '"3",,"False",\n'])
+
+    def test_copy_round_trip(self):
+        """Test that a batch big enough to go through COPY comes back from the DB as it went in, incl. NULLs, empty
+        strings, quotes, commas, and newlines"""
+        table = f'{TEST_SCHEMA}.test_copy_from_dicts'
+        names = ['plain', 'a "quoted", name', 'two\nlines', '', None, 'back\\slash']
+        rows = [
+            {'id': i, 'name': names[i % len(names)], 'flag': None if i % 3 == 0 else bool(i % 2),
+             'info': None if i % 4 == 0 else {'k': i, 'v': names[i % len(names)]}}
+            for i in range(COPY_THRESHOLD_ROWS + 5)]
+        with get_db_connection(schema=TEST_SCHEMA) as con:
+            try:
+                run_sql(con, f'DROP TABLE IF EXISTS {table};')
+                run_sql(con, f'CREATE TABLE {table} (id int, name text, flag boolean, info jsonb);')
+                insert_from_dicts(con, table, rows, skip_if_already_exists=False)
+                results = [dict(x) for x in sql_query(con, f'SELECT id, name, flag, info FROM {table} ORDER BY id;')]
+            finally:
+                run_sql(con, f'DROP TABLE IF EXISTS {table};')
+        self.assertEqual(results, rows)
+
+    def test_update_needs_pkey(self):
+        """Test that updating a table w/out a primary key in PKEYS fails before touching the DB"""
+        with self.assertRaises(ValueError):
+            update_from_dicts(None, 'concept_ancestor', [{'ancestor_concept_id': 1}])
+
+    def test_update_round_trip(self):
+        """Test that only the given rows, and columns, are updated, matching on the primary key from PKEYS; that NULLs
+        are written; and that a table w/out one in PKEYS is refused"""
+        table = 'test_update_from_dicts'
+        rows = [{'codeset_id': 1, 'concept_id': i, 'name': f'name {i}', 'n': i} for i in range(10)]
+        updates = [
+            {'codeset_id': 1, 'concept_id': 2, 'name': 'a "new", name'},
+            {'codeset_id': 1, 'concept_id': 5, 'name': None},
+            {'codeset_id': 1, 'concept_id': 5, 'name': 'last one wins'},
+            {'codeset_id': 1, 'concept_id': 7, 'name': None},
+            {'codeset_id': 2, 'concept_id': 3, 'name': 'no such row'}]
+        expected = [dict(x) for x in rows]
+        expected[2]['name'], expected[5]['name'], expected[7]['name'] = 'a "new", name', 'last one wins', None
+        with get_db_connection(schema=TEST_SCHEMA) as con:
+            try:
+                run_sql(con, f'DROP TABLE IF EXISTS {table};')
+                run_sql(con, f'CREATE TABLE {table} (codeset_id int, concept_id int, name text, n int);')
+                insert_from_dicts(con, table, rows, skip_if_already_exists=False)
+                with self.assertRaises(ValueError):
+                    update_from_dicts(con, table, updates)
+                with mock.patch.dict(PKEYS, {table: ['codeset_id', 'concept_id']}):
+                    update_from_dicts(con, table, updates)
+                results = [dict(x) for x in sql_query(con, f'SELECT * FROM {table} ORDER BY codeset_id, concept_id;')]
+            finally:
+                run_sql(con, f'DROP TABLE IF EXISTS {table};')
+        self.assertEqual(results, expected)
+
+
+class TestUpsert(unittest.TestCase):
+
+    def test_on_conflict_clause(self):
+        """Test that upserts skip existing keys, or update all non-key columns from EXCLUDED"""
+        pk, cols = ['codeset_id', 'concept_id'], ['codeset_id', 'concept_id', 'concept_name']
+        self.assertEqual(on_conflict_clause(pk, cols), 'ON CONFLICT ("codeset_id", "concept_id") DO NOTHING')
+        self.assertEqual(
+            on_conflict_clause(pk, cols, update=True),
+            'ON CONFLICT ("codeset_id", "concept_id") DO UPDATE SET "concept_name" = EXCLUDED."concept_name"')
+        self.assertEqual(on_conflict_clause(pk, pk, update=True), 'ON CONFLICT ("codeset_id", "concept_id") DO NOTHING')
+
+    def test_has_unique_key_per_column_set(self):
+        """Test that a table's unique column sets are matched against each set of columns asked about, and that tables
+        w/out any, or that don't exist, aren't cached, so keys added later, or to a recreated table, are seen"""
+        table = f'{TEST_SCHEMA}.test_has_unique_key'
+        with mock.patch.dict(UNIQUE_KEYS, clear=True), get_db_connection(schema=TEST_SCHEMA) as con:
+            try:
+                self.assertFalse(has_unique_key(con, table, ['codeset_id', 'concept_id']))
+                run_sql(con, f'CREATE TABLE {table} (codeset_id int, concept_id int, version int);')
+                self.assertFalse(has_unique_key(con, table, ['codeset_id', 'concept_id']))
+                self.assertEqual(UNIQUE_KEYS, {})
+                run_sql(con, f'ALTER TABLE {table} ADD PRIMARY KEY (codeset_id, concept_id);')
+                self.assertTrue(has_unique_key(con, table, ['concept_id', 'codeset_id']))
+                self.assertFalse(has_unique_key(con, table, ['codeset_id']))
+                self.assertFalse(has_unique_key(con, table, ['codeset_id', 'concept_id', 'version']))
+                run_sql(con, f'DROP TABLE {table};')
+                run_sql(con, f'CREATE TABLE {table} (codeset_id int, concept_id int, version int);')
+                self.assertFalse(has_unique_key(con, table, ['codeset_id', 'concept_id']))
+            finally:
+                run_sql(con, f'DROP TABLE IF EXISTS {table};')
+
+    def test_dedupe_by_key(self):
+        """Test that the last row for each key is kept"""
+        rows = [{'id': 1, 'v': 'a'}, {'id': 2, 'v': 'b'}, {'id': 1, 'v': 'c'}]
+        self.assertEqual(dedupe_by_key(rows, ['id']), [{'id': 1, 'v': 'c'}, {'id': 2, 'v': 'b'}])
+
 # Uncomment this and run this file and run directly to run all tests
 # if __name__ == '__main__':
 #     unittest.main()
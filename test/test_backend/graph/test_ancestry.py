@@ -0,0 +1,113 @@
+"""Tests for AncestorIndex
+
+How to run:
+    python -m unittest discover
+"""
+import os
+import random
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+import networkx as nx
+import numpy as np
+
+THIS_DIR = Path(os.path.dirname(__file__))
+PROJECT_ROOT = THIS_DIR.parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+from backend.graph.ancestry import AncestorIndex, connecting_ancestors, lowest_common_ancestor
+from backend.graph.snapshot import load_graph_snapshot, save_graph_snapshot
+from test.test_backend.graph.test_compact_graph import EDGES, graphs, random_dag
+
+
+def random_tree(n_nodes=500, seed=3):
+    """Random forest of 3 trees, with sparse concept_ids"""
+    rand = random.Random(seed)
+    ids = rand.sample(range(1, 10_000_000), n_nodes)
+    return [(ids[rand.randrange(i)], ids[i]) for i in range(3, n_nodes)]
+
+
+class TestAncestorIndex(unittest.TestCase):
+    """Tests for AncestorIndex, checked against networkx"""
+
+    def test_depth(self):
+        """Test depths are the shortest distance from a root"""
+        g, nxg = graphs(random_dag())
+        index = AncestorIndex.build(g)
+        roots = [v for v in nxg.nodes if not nxg.in_degree(v)]
+        distances = nx.multi_source_dijkstra_path_length(nxg, roots)
+        for i, node in enumerate(g.nodes.tolist()):
+            self.assertEqual(index.depth[i], distances[node])
+            parent = index.up[0][i]
+            if index.depth[i]:
+                self.assertTrue(nxg.has_edge(int(g.nodes[parent]), node))
+                self.assertEqual(index.depth[parent], index.depth[i] - 1)
+
+    def test_tree_lca(self):
+        """Test that in a forest, the LCA is the true LCA"""
+        g, nxg = graphs(random_tree())
+        rand = random.Random(0)
+        nodes = list(nxg.nodes)
+        for _ in range(200):
+            a, b = rand.sample(nodes, 2)
+            self.assertEqual(lowest_common_ancestor(g, [a, b]), nx.lowest_common_ancestor(nxg, a, b))
+        for _ in range(50):
+            sample = rand.sample(nodes, 5)
+            expected = sample[0]
+            for node in sample[1:]:
+                expected = expected if expected is None else nx.lowest_common_ancestor(nxg, expected, node)
+            self.assertEqual(lowest_common_ancestor(g, sample), expected)
+
+    def test_dag_lca(self):
+        """Test that in a DAG, the LCA is a common ancestor"""
+        g, nxg = graphs(random_dag())
+        rand = random.Random(1)
+        nodes = list(nxg.nodes)
+        for _ in range(200):
+            sample = rand.sample(nodes, 3)
+            lca = lowest_common_ancestor(g, sample)
+            if lca is not None:
+                for node in sample:
+                    self.assertTrue(lca == node or lca in nx.ancestors(nxg, node))
+
+    def test_connecting_ancestors(self):
+        """Test that the roots get connected to their LCA through their ancestors"""
+        g, nxg = graphs(EDGES)
+        np.testing.assert_array_equal(connecting_ancestors(g, [4, 9]), [2, 8])
+        np.testing.assert_array_equal(connecting_ancestors(g, [4, 6]), [1, 2, 3])
+        # 31 is in another tree, and 5 is already connected via 2
+        np.testing.assert_array_equal(connecting_ancestors(g, [4, 5, 6, 31, -1]), [1, 2, 3])
+        self.assertEqual(len(connecting_ancestors(g, [4])), 0)
+        self.assertEqual(len(connecting_ancestors(g, [])), 0)
+
+        g, nxg = graphs(random_tree())
+        rand = random.Random(2)
+        sample = rand.sample(list(nxg.nodes), 10)
+        connected = set(connecting_ancestors(g, sample).tolist())
+        sg = nxg.subgraph(connected | set(sample)).to_undirected()
+        components = nx.number_connected_components(sg)
+        trees = {next(n for n in [node, *nx.ancestors(nxg, node)] if not nxg.in_degree(n)) for node in sample}
+        self.assertEqual(components, len(trees))
+
+    def test_cycle(self):
+        """Test that nodes only reachable through a cycle still get an index"""
+        g, _ = graphs([(1, 2), (2, 3), (3, 2), (4, 5), (5, 4)])
+        index = AncestorIndex.build(g)
+        self.assertTrue((index.depth >= 0).all())
+        self.assertEqual(lowest_common_ancestor(g, [2, 3]), 2)
+
+    def test_snapshot(self):
+        """Test that the index is saved and loaded with the graph"""
+        g, _ = graphs(random_dag())
+        g.ancestry = AncestorIndex.build(g)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'graph.snapshot')
+            save_graph_snapshot(g, path)
+            loaded = load_graph_snapshot(path, verify=True)
+            np.testing.assert_array_equal(loaded.ancestry.depth, g.ancestry.depth)
+            np.testing.assert_array_equal(loaded.ancestry.up, g.ancestry.up)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+"""Tests for NodeAttributes
+
+How to run:
+    python -m unittest discover
+"""
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+THIS_DIR = Path(os.path.dirname(__file__))
+PROJECT_ROOT = THIS_DIR.parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+from backend.graph.attributes import NodeAttributes, code_dtype
+from backend.graph.compact_graph import CompactGraph
+from backend.graph.snapshot import load_graph_snapshot, save_graph_snapshot
+
+CONCEPTS = [
+    {'concept_id': 30, 'vocabulary_id': 'SNOMED', 'standard_concept': 'S'},
+    {'concept_id': 10, 'vocabulary_id': 'RxNorm Extension', 'standard_concept': None},
+    {'concept_id': 20, 'vocabulary_id': 'SNOMED', 'standard_concept': 'C'},
+    {'concept_id': 40, 'vocabulary_id': 'ICD10CM', 'standard_concept': None},
+]
+
+
+def node_attributes() -> NodeAttributes:
+    """Attributes of CONCEPTS"""
+    return NodeAttributes.from_values(
+        [c['concept_id'] for c in CONCEPTS],
+        {name: [c[name] for c in CONCEPTS] for name in ('vocabulary_id', 'standard_concept')})
+
+
+class TestNodeAttributes(unittest.TestCase):
+    """Tests for NodeAttributes"""
+
+    def test_lookups(self):
+        """Test codes, masks, and records"""
+        attrs = node_attributes()
+        self.assertEqual(attrs.concept_ids.tolist(), [10, 20, 30, 40])
+        self.assertEqual(attrs.codes['vocabulary_id'].dtype, np.uint8)
+        ids = [30, 10, 99]  # 99: unknown
+        self.assertEqual(attrs.decode('vocabulary_id', attrs.get_codes('vocabulary_id', ids)),
+                         ['SNOMED', 'RxNorm Extension', None])
+        self.assertEqual(attrs.is_in('vocabulary_id', ['SNOMED', 'LOINC'], ids).tolist(), [True, False, False])
+        self.assertEqual(attrs.is_in('standard_concept', ['S'], ids).tolist(), [True, False, False])
+        self.assertEqual(attrs.contains(ids).tolist(), [True, True, False])
+        self.assertEqual(
+            sorted(attrs.records(ids + [20, 40]), key=lambda c: c['concept_id']),
+            sorted(CONCEPTS, key=lambda c: c['concept_id']))
+
+    def test_code_dtype(self):
+        """Test that codes use the smallest dtype that fits"""
+        self.assertEqual(code_dtype(255), np.uint8)
+        self.assertEqual(code_dtype(256), np.uint16)
+        self.assertEqual(code_dtype(70000), np.uint32)
+
+    def test_snapshot(self):
+        """Test that node attributes are saved and loaded with the graph"""
+        g = CompactGraph.from_edges([10, 20], [20, 30])
+        g.attributes = node_attributes()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join(tmp_dir, 'relationship_graph.snapshot')
+            save_graph_snapshot(g, path)
+            loaded = load_graph_snapshot(path, verify=True)
+            self.assertEqual(loaded.attributes.dictionaries, g.attributes.dictionaries)
+            self.assertEqual(loaded.attributes.records([10, 20, 30, 40]), g.attributes.records([10, 20, 30, 40]))
+            self.assertIsNone(load_graph_snapshot(path).reachability)
+            save_graph_snapshot(CompactGraph.from_edges([1], [2]), path)
+            self.assertIsNone(load_graph_snapshot(path).attributes)
+
+
+if __name__ == '__main__':
+    unittest.main()
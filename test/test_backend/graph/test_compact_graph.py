@@ -0,0 +1,116 @@
+"""Tests for CompactGraph
+
+How to run:
+    python -m unittest discover
+"""
+import os
+import random
+import sys
+import unittest
+from pathlib import Path
+
+import networkx as nx
+import numpy as np
+
+THIS_DIR = Path(os.path.dirname(__file__))
+PROJECT_ROOT = THIS_DIR.parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+from backend.graph.compact_graph import CompactGraph
+
+# Small hierarchy, w/ a DAG cross-edge (2 -> 8), a duplicate edge, and an isolated pair (30 -> 31)
+EDGES = [(1, 2), (1, 3), (2, 4), (2, 5), (3, 6), (3, 7), (7, 8), (2, 8), (8, 9), (8, 9), (30, 31)]
+
+
+def random_dag(n_nodes=300, n_edges=900, seed=42):
+    """Random DAG with sparse, non-contiguous concept_ids"""
+    rand = random.Random(seed)
+    ids = rand.sample(range(1, 10_000_000), n_nodes)
+    edges = set()
+    while len(edges) < n_edges:
+        i, j = sorted(rand.sample(range(n_nodes), 2))
+        edges.add((ids[i], ids[j]))
+    return list(edges)
+
+
+def graphs(edges):
+    """Get equivalent compact and networkx graphs"""
+    arr = np.array(edges)
+    return CompactGraph.from_edges(arr[:, 0], arr[:, 1]), nx.DiGraph(edges)
+
+
+class TestCompactGraph(unittest.TestCase):
+    """Tests for CompactGraph, checked against networkx"""
+
+    def test_from_edges(self):
+        """Test from_edges()"""
+        g, nxg = graphs(EDGES)
+        self.assertEqual(len(g), len(nxg))
+        self.assertEqual(g.number_of_edges(), nxg.number_of_edges())
+        self.assertEqual(set(map(tuple, g.edges.tolist())), set(nxg.edges))
+        self.assertEqual(g.fwd_targets.dtype, np.int32)
+        self.assertEqual(g.rev_sources.dtype, np.int32)
+
+    def test_neighbors(self):
+        """Test successors() and predecessors()"""
+        for edges in (EDGES, random_dag()):
+            g, nxg = graphs(edges)
+            for node in nxg.nodes:
+                self.assertEqual(set(g.successors(node).tolist()), set(nxg.successors(node)))
+                self.assertEqual(set(g.predecessors(node).tolist()), set(nxg.predecessors(node)))
+        self.assertFalse(g.has_node(-1))
+        self.assertEqual(len(g.successors(-1)), 0)
+
+    def test_descendants(self):
+        """Test descendants() and ancestors()"""
+        g, nxg = graphs(random_dag())
+        for node in list(nxg.nodes)[:50]:
+            self.assertEqual(set(g.descendants([node]).tolist()), nx.descendants(nxg, node))
+            self.assertEqual(set(g.ancestors([node]).tolist()), nx.ancestors(nxg, node))
+        g, _ = graphs(EDGES)
+        self.assertEqual(set(g.descendants([1], depth=1).tolist()), {2, 3})
+        self.assertEqual(set(g.descendants([1], depth=2).tolist()), {2, 3, 4, 5, 6, 7, 8})
+
+    def test_subgraph(self):
+        """Test subgraph()"""
+        for edges in (EDGES, random_dag()):
+            g, nxg = graphs(edges)
+            rand = random.Random(0)
+            nodes = rand.sample(list(nxg.nodes), len(nxg) // 3) + [-5]  # -5: not in graph
+            sg, nx_sg = g.subgraph(nodes), nxg.subgraph(nodes)
+            self.assertEqual(set(sg.nodes.tolist()), set(nx_sg.nodes))
+            self.assertEqual(set(map(tuple, sg.edges.tolist())), set(nx_sg.edges))
+            np.testing.assert_array_equal(g.induced_edges(nodes), sg.edges)
+            # Same arrays as building the subgraph from its edges
+            rebuilt = CompactGraph.from_edges(sg.edges[:, 0], sg.edges[:, 1]).with_nodes(sg.nodes)
+            for name in ('node_ids', 'fwd_offsets', 'fwd_targets', 'rev_offsets', 'rev_sources'):
+                np.testing.assert_array_equal(getattr(sg, name), getattr(rebuilt, name))
+
+    def test_apply_delta(self):
+        """Test apply_delta() gives the same graph as rebuilding from the updated edges"""
+        edges = random_dag()
+        g, _ = graphs(edges)
+        rand = random.Random(1)
+        removed = rand.sample(edges, 100) + [(-1, -2), (edges[0][0], -3)]  # last 2: not in graph
+        added = random_dag(n_nodes=50, n_edges=80, seed=7) + [edges[1]]  # last: already in graph
+        expected = (set(edges) - set(removed)) | set(added)
+        removed_arr, added_arr = np.array(removed), np.array(added)
+        updated = g.apply_delta(added_arr[:, 0], added_arr[:, 1], removed_arr[:, 0], removed_arr[:, 1])
+        rebuilt, _ = graphs(list(expected))
+        self.assertEqual(set(map(tuple, updated.edges.tolist())), expected)
+        for name in ('node_ids', 'fwd_offsets', 'fwd_targets', 'rev_offsets', 'rev_sources'):
+            np.testing.assert_array_equal(getattr(updated, name), getattr(rebuilt, name))
+        # A node left without edges is dropped
+        g, _ = graphs(EDGES)
+        self.assertFalse(g.apply_delta([], [], [30], [31]).has_node(30))
+
+    def test_empty(self):
+        """Test empty graph"""
+        g = CompactGraph.from_edges([], [])
+        self.assertEqual(len(g), 0)
+        self.assertEqual(g.edges.shape, (0, 2))
+        self.assertEqual(len(g.subgraph([1, 2]).nodes), 0)
+        self.assertEqual(g.induced_edges([1, 2]).shape, (0, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+"""Tests for ComponentIndex
+
+How to run:
+    python -m unittest discover
+"""
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+import networkx as nx
+import numpy as np
+
+THIS_DIR = Path(os.path.dirname(__file__))
+PROJECT_ROOT = THIS_DIR.parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+from backend.graph.components import ComponentIndex, component_ids, component_roots, in_components, \
+    share_component
+from backend.graph.snapshot import load_graph_snapshot, save_graph_snapshot
+from test.test_backend.graph.test_compact_graph import EDGES, graphs, random_dag
+
+
+class TestComponentIndex(unittest.TestCase):
+    """Tests for ComponentIndex, checked against networkx"""
+
+    def test_components(self):
+        """Test that components and their roots match networkx"""
+        for edges in (EDGES, random_dag(n_nodes=2000, n_edges=1800, seed=5), [(1, 2), (2, 3), (3, 1), (4, 5)]):
+            g, nxg = graphs(edges)
+            index = ComponentIndex.build(g)
+            expected = list(nx.weakly_connected_components(nxg))
+            self.assertEqual(index.n_components(), len(expected))
+            for nodes in expected:
+                labels = component_ids(g, list(nodes))
+                self.assertEqual(len(set(labels.tolist())), 1)
+                roots = {v for v in nodes if not nxg.in_degree(v)}
+                self.assertEqual(set(component_roots(g, list(nodes)[:1]).tolist()), roots)
+
+    def test_lookups(self):
+        """Test share_component() and in_components()"""
+        g, _ = graphs(EDGES)
+        self.assertTrue(share_component(g, [4, 30], [9]))
+        self.assertFalse(share_component(g, [4, 5], [31, -1]))
+        np.testing.assert_array_equal(component_ids(g, [1, 31, -1]), [0, 1, -1])
+        np.testing.assert_array_equal(in_components(g, [1, 31, -1], [1]), [False, True, False])
+        np.testing.assert_array_equal(component_roots(g, [9, 31]), [1, 30])
+        self.assertEqual(len(component_roots(g, [-1])), 0)
+
+    def test_snapshot(self):
+        """Test that the index is saved and loaded with the graph"""
+        g, _ = graphs(random_dag(n_nodes=2000, n_edges=1800, seed=5))
+        g.components = ComponentIndex.build(g)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'graph.snapshot')
+            save_graph_snapshot(g, path)
+            loaded = load_graph_snapshot(path, verify=True)
+            for name, arr in g.components.arrays().items():
+                np.testing.assert_array_equal(loaded.components.arrays()[name], arr)
+
+
+if __name__ == '__main__':
+    unittest.main()
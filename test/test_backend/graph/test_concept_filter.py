@@ -0,0 +1,98 @@
+"""Tests for vectorized concept filtering
+
+How to run:
+    python -m unittest discover
+"""
+import os
+import random
+import sys
+import unittest
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+
+THIS_DIR = Path(os.path.dirname(__file__))
+PROJECT_ROOT = THIS_DIR.parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+from backend.graph.attributes import NodeAttributes
+from backend.graph.concept_filter import attribute_arrays, concat_concept_arrays, encode_concepts, \
+    filter_concept_arrays
+
+VOCABS = ['SNOMED', 'RxNorm', 'RxNorm Extension', 'ICD10CM', None]
+STANDARD = ['S', 'C', None]
+
+
+def filter_concepts_loop(concepts: List[Dict[str, Any]], hide_vocabs: List[str], hide_nonstandard_concepts=False):
+    """Reference: the original, loop-based filter_concepts()"""
+    hidden_by_voc = {}
+    for vocab in hide_vocabs:
+        hidden_i = set([c['concept_id'] for c in concepts if c['vocabulary_id'] == vocab])
+        if hidden_i:
+            hidden_by_voc[vocab] = hidden_i
+    nonstandard_concepts_hidden = set()
+    if hide_nonstandard_concepts:
+        nonstandard_concepts_hidden = set([c['concept_id'] for c in concepts if c['standard_concept'] != 'S'])
+    hidden_nodes = set().union(*list(hidden_by_voc.values())).union(nonstandard_concepts_hidden)
+    return [c for c in concepts if c['concept_id'] not in hidden_nodes], hidden_by_voc, nonstandard_concepts_hidden
+
+
+def random_concepts(n: int, seed: int) -> List[Dict[str, Any]]:
+    """Concepts with random attributes. Some ids repeat, as when a concept is in more than one concept set."""
+    rand = random.Random(seed)
+    return [
+        {'concept_id': rand.randrange(n), 'vocabulary_id': rand.choice(VOCABS),
+         'standard_concept': rand.choice(STANDARD)} for _ in range(n)]
+
+
+class TestFilterConceptArrays(unittest.TestCase):
+    """Tests for filter_concept_arrays()"""
+
+    def assert_same_as_loop(self, concepts, hide_vocabs, hide_nonstandard_concepts):
+        """Check results match filter_concepts_loop()"""
+        keep, hidden_by_voc, nonstandard = filter_concept_arrays(
+            *encode_concepts(concepts), hide_vocabs, hide_nonstandard_concepts)
+        expected = filter_concepts_loop(concepts, hide_vocabs, hide_nonstandard_concepts)
+        self.assertEqual([c for c, k in zip(concepts, keep) if k], expected[0])
+        self.assertEqual(hidden_by_voc, expected[1])
+        self.assertEqual(list(hidden_by_voc), list(expected[1]))
+        self.assertEqual(nonstandard, expected[2])
+
+    def test_same_as_loop(self):
+        """Test results are identical to the loop-based implementation"""
+        for seed in range(20):
+            concepts = random_concepts(200, seed)
+            for hide_vocabs in ([], ['RxNorm Extension'], ['ICD10CM', 'SNOMED', 'Unknown'], [None]):
+                for hide_nonstandard_concepts in (False, True):
+                    self.assert_same_as_loop(concepts, hide_vocabs, hide_nonstandard_concepts)
+
+    def test_empty(self):
+        """Test with no concepts"""
+        self.assert_same_as_loop([], ['RxNorm Extension'], True)
+
+    def test_attribute_arrays(self):
+        """Test arrays from node attributes, combined with encoded records for concepts they don't cover"""
+        concepts = random_concepts(100, 0)
+        unique = list({c['concept_id']: c for c in concepts}.values())
+        covered, rest = unique[:60], unique[60:]
+        attributes = NodeAttributes.from_values(
+            [c['concept_id'] for c in covered],
+            {name: [c[name] for c in covered] for name in ('vocabulary_id', 'standard_concept')})
+        from_attributes = attribute_arrays(attributes, [c['concept_id'] for c in unique])
+        np.testing.assert_array_equal(from_attributes[0], [c['concept_id'] for c in covered])
+        arrays = concat_concept_arrays(from_attributes, encode_concepts(rest, from_attributes[3]))
+
+        keep, hidden_by_voc, nonstandard = filter_concept_arrays(*arrays, ['RxNorm Extension', 'ICD10CM'], True)
+        _, expected_hidden, expected_nonstandard = filter_concepts_loop(unique, ['RxNorm Extension', 'ICD10CM'], True)
+        self.assertEqual(hidden_by_voc, expected_hidden)
+        self.assertEqual(nonstandard, expected_nonstandard)
+        self.assertEqual(
+            set(arrays[0][keep].tolist()),
+            {c['concept_id'] for c in unique} - set().union(*expected_hidden.values()) - expected_nonstandard)
+
+        with self.assertRaises(ValueError):
+            concat_concept_arrays(from_attributes, encode_concepts(rest))
+
+
+if __name__ == '__main__':
+    unittest.main()
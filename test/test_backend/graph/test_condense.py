@@ -0,0 +1,81 @@
+"""Tests for super node condensation
+
+How to run:
+    python -m unittest discover
+"""
+import os
+import sys
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+THIS_DIR = Path(os.path.dirname(__file__))
+PROJECT_ROOT = THIS_DIR.parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+from backend.graph.compact_graph import CompactGraph
+from backend.graph.condense import collapsed_page, condense_super_nodes, pack_collapsed, placeholder_id
+from test.test_backend.graph.test_compact_graph import random_dag
+
+# 1 has 6 children: 10-13 are leaves, 14 has a child, 15 has another parent (2). 2 has 2 children. 3 is isolated.
+EDGES = [(1, 10), (1, 11), (1, 12), (1, 13), (1, 14), (1, 15), (14, 20), (2, 15), (2, 16)]
+
+
+def graph(edges) -> CompactGraph:
+    """Graph from list of edges"""
+    arr = np.array(edges)
+    return CompactGraph.from_edges(arr[:, 0], arr[:, 1])
+
+
+class TestCondense(unittest.TestCase):
+    """Tests for condense_super_nodes() and collapsed_page()"""
+
+    def test_condense(self):
+        """Test that only leaf children w/ no other parent get collapsed, and only under super nodes"""
+        g = graph(EDGES).with_nodes([3])
+        condensed, collapsed = condense_super_nodes(g, threshold=3)
+        self.assertEqual(list(collapsed), [1])
+        np.testing.assert_array_equal(collapsed[1], [10, 11, 12, 13])
+        self.assertEqual(
+            set(map(tuple, condensed.edges.tolist())),
+            {(1, 14), (1, 15), (14, 20), (2, 15), (2, 16), (1, placeholder_id(1))})
+        self.assertTrue(condensed.has_node(3))
+
+    def test_no_super_nodes(self):
+        """Test that the graph is unchanged if no node is over the threshold"""
+        g = graph(EDGES)
+        condensed, collapsed = condense_super_nodes(g, threshold=6)
+        self.assertIs(condensed, g)
+        self.assertEqual(collapsed, {})
+
+    def test_bounded(self):
+        """Test that condensing keeps every node or accounts for it as collapsed, and bounds fan-out of leaves"""
+        hub_edges = [(1, i) for i in range(100, 5100)] + random_dag(n_nodes=200, n_edges=400)
+        g = graph(hub_edges)
+        condensed, collapsed = condense_super_nodes(g, threshold=50)
+        n_collapsed = sum(len(ids) for ids in collapsed.values())
+        self.assertEqual(len(condensed), len(g) - n_collapsed + len(collapsed))
+        self.assertLessEqual(condensed.out_degree([1])[0], 1)
+        for node, ids in collapsed.items():
+            np.testing.assert_array_equal(ids, np.sort(ids))
+            self.assertTrue((condensed.index_of(ids) < 0).all())
+            self.assertTrue(condensed.has_node(placeholder_id(node)))
+
+    def test_collapsed_page(self):
+        """Test that pages read from packed collapsed children match slices of the unpacked ones"""
+        hub_edges = [(1, i) for i in range(100, 400)] + [(2, i) for i in range(500, 560)] + [(3, 4)]
+        _, collapsed = condense_super_nodes(graph(hub_edges), threshold=50)
+        packed = pack_collapsed(collapsed)
+        for node, ids in collapsed.items():
+            for offset, limit in [(0, 1000), (0, 25), (50, 25), (len(ids) - 5, 25), (len(ids) + 5, 25)]:
+                total, page = collapsed_page(packed, node, offset, limit)
+                self.assertEqual(total, len(ids))
+                np.testing.assert_array_equal(page, ids[offset:offset + limit])
+        for node in (3, 0, 1000):
+            total, page = collapsed_page(packed, node, 0, 10)
+            self.assertEqual((total, len(page)), (0, 0))
+        self.assertEqual(collapsed_page(pack_collapsed({}), 1, 0, 10)[0], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
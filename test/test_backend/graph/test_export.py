@@ -0,0 +1,89 @@
+"""Tests for streaming edge export and compact graph responses
+
+How to run:
+    python -m unittest discover
+"""
+import json
+import os
+import sys
+import unittest
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+
+THIS_DIR = Path(os.path.dirname(__file__))
+PROJECT_ROOT = THIS_DIR.parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+from backend.graph.compact_graph import CompactGraph
+from backend.graph.export import compact_concept_graph, edge_dtype, stream_edges
+from test.test_backend.graph.test_compact_graph import random_dag
+
+
+class TestStreamEdges(unittest.TestCase):
+    """Tests for stream_edges()"""
+
+    def setUp(self):
+        """Set up"""
+        edges = np.array(random_dag())
+        self.graph = CompactGraph.from_edges(edges[:, 0], edges[:, 1])
+        self.expected = self.graph.edges.tolist()
+
+    def _stream(self, fmt: str, g: CompactGraph = None) -> bytes:
+        """Stream edges in small chunks"""
+        return b''.join(stream_edges(self.graph if g is None else g, fmt, chunk_edges=100))
+
+    def test_json(self):
+        """Test json and ndjson formats"""
+        self.assertEqual(json.loads(self._stream('json')), self.expected)
+        self.assertEqual([json.loads(line) for line in self._stream('ndjson').splitlines()], self.expected)
+        empty = CompactGraph.from_edges([], [])
+        self.assertEqual(json.loads(self._stream('json', empty)), [])
+        self.assertEqual(self._stream('ndjson', empty), b'')
+
+    def test_binary(self):
+        """Test binary format, including fallback to int64 for ids that don't fit in int32"""
+        pairs = np.frombuffer(self._stream('binary'), dtype='<i4').reshape(-1, 2)
+        self.assertEqual(pairs.tolist(), self.expected)
+        big = CompactGraph.from_edges([1, 2 ** 40], [2 ** 40, 3])
+        self.assertEqual(edge_dtype(big), np.dtype('<i8'))
+        pairs = np.frombuffer(self._stream('binary', big), dtype='<i8').reshape(-1, 2)
+        self.assertEqual(pairs.tolist(), big.edges.tolist())
+
+    def test_arrow(self):
+        """Test Arrow IPC stream format"""
+        table = pa.ipc.open_stream(self._stream('arrow')).read_all()
+        self.assertEqual(list(zip(table['source'].to_pylist(), table['target'].to_pylist())),
+                         [tuple(e) for e in self.expected])
+
+    def test_unknown_format(self):
+        """Test that unknown formats are rejected"""
+        with self.assertRaises(ValueError):
+            self._stream('xml')
+
+
+class TestCompactConceptGraph(unittest.TestCase):
+    """Tests for compact_concept_graph()"""
+
+    def test_round_trip(self):
+        """Test that the compact format decodes to the same graph and id sets"""
+        edges = np.array(random_dag())
+        g = CompactGraph.from_edges(edges[:, 0], edges[:, 1])
+        sg = g.subgraph(g.nodes[::2])
+        concept_ids = set(sg.nodes.tolist()) | {1, 2}
+        hidden = {'RxNorm Extension': {5, 3}, 'ATC': set()}
+        content = json.loads(json.dumps(compact_concept_graph(sg, concept_ids, {1, 2}, hidden, {7})))
+
+        nodes = np.cumsum(content['nodes'])
+        np.testing.assert_array_equal(nodes, sg.nodes)
+        pairs = np.array(content['edges']).reshape(-1, 2)
+        self.assertEqual(nodes[pairs].tolist(), sg.edges.tolist())
+        self.assertEqual(set(np.cumsum(content['concept_ids']).tolist()), concept_ids)
+        self.assertEqual(np.cumsum(content['missing_from_graph']).tolist(), [1, 2])
+        self.assertEqual({k: np.cumsum(v).tolist() for k, v in content['hidden_by_vocab'].items()},
+                         {'RxNorm Extension': [3, 5], 'ATC': []})
+        self.assertEqual(content['nonstandard_concepts_hidden'], [7])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+"""Tests for binary COPY edge ingest
+
+How to run:
+    python -m unittest discover
+"""
+import os
+import struct
+import sys
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+THIS_DIR = Path(os.path.dirname(__file__))
+PROJECT_ROOT = THIS_DIR.parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+from backend.graph.ingest import COPY_SIGNATURE, BinaryCopyParser, CopyFormatError
+
+
+def copy_output(edges, header_extension=b'') -> bytes:
+    """Binary COPY output, as Postgres would send it, for a (bigint, bigint) query"""
+    out = COPY_SIGNATURE + struct.pack('>ii', 0, len(header_extension)) + header_extension
+    for source, target in edges:
+        out += struct.pack('>hiqiq', 2, 8, source, 8, target)
+    return out + struct.pack('>h', -1)
+
+
+def parse(data: bytes, block_size: int, chunk_bytes: int):
+    """Feed data to a parser in blocks, as psycopg2's copy_expert() does"""
+    parser = BinaryCopyParser(chunk_bytes=chunk_bytes)
+    for i in range(0, len(data), block_size):
+        parser.write(data[i:i + block_size])
+    return parser.result()
+
+
+class TestBinaryCopyParser(unittest.TestCase):
+    """Tests for BinaryCopyParser"""
+    edges = [(i, 2 ** 40 + i * 7) for i in range(1, 1000)]
+
+    def test_parse(self):
+        """Test parsing, with blocks and chunks that split the header and tuples at arbitrary points"""
+        data = copy_output(self.edges, header_extension=b'ext')
+        for block_size, chunk_bytes in [(len(data), 1 << 20), (1, 1), (7, 100), (8192, 1000), (5, 26)]:
+            sources, targets = parse(data, block_size, chunk_bytes)
+            self.assertEqual(sources.dtype, np.int64)
+            self.assertEqual(list(zip(sources.tolist(), targets.tolist())), self.edges)
+
+    def test_columns(self):
+        """Test tuples of other than 2 columns"""
+        rows = [(1, 0, 3), (2, 5, 0), (3, 1, 1)]
+        data = COPY_SIGNATURE + struct.pack('>ii', 0, 0)
+        for row in rows:
+            data += struct.pack('>h', 3) + b''.join(struct.pack('>iq', 8, x) for x in row)
+        data += struct.pack('>h', -1)
+        parser = BinaryCopyParser(n_columns=3, chunk_bytes=40)
+        for i in range(0, len(data), 9):
+            parser.write(data[i:i + 9])
+        self.assertEqual([col.tolist() for col in parser.result()], [list(col) for col in zip(*rows)])
+        with self.assertRaises(CopyFormatError):
+            parse(data, 64, 64)  # 2 column parser
+
+    def test_empty(self):
+        """Test a table with no rows"""
+        sources, targets = parse(copy_output([]), 3, 10)
+        self.assertEqual((len(sources), len(targets)), (0, 0))
+
+    def test_invalid(self):
+        """Test that malformed output is rejected"""
+        data = copy_output(self.edges[:10])
+        for bad in [
+            b'not a copy stream' + data,  # bad signature
+            data[:-2],  # no trailer
+            data[:-5],  # truncated tuple
+            data + b'\0',  # trailing data
+            data.replace(struct.pack('>hi', 2, 8), struct.pack('>hi', 2, 4), 1),  # not bigint
+        ]:
+            with self.assertRaises(CopyFormatError):
+                parse(bad, 64, 128)
+
+
+if __name__ == '__main__':
+    unittest.main()
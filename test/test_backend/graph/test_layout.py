@@ -0,0 +1,80 @@
+"""Tests for layered layout
+
+How to run:
+    python -m unittest discover
+"""
+import os
+import sys
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+THIS_DIR = Path(os.path.dirname(__file__))
+PROJECT_ROOT = THIS_DIR.parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+from backend.graph.compact_graph import CompactGraph
+from backend.graph.layout import assign_layers, layered_layout, order_layers
+from test.test_backend.graph.test_compact_graph import EDGES, random_dag
+
+
+def graph(edges) -> CompactGraph:
+    """Graph from list of edges"""
+    arr = np.array(edges)
+    return CompactGraph.from_edges(arr[:, 0], arr[:, 1])
+
+
+def crossings(g: CompactGraph, layer: np.ndarray, pos: np.ndarray) -> int:
+    """Number of crossings between edges that each span one layer"""
+    src = np.repeat(np.arange(len(g)), np.diff(g.fwd_offsets))
+    tgt = g.fwd_targets
+    n = 0
+    for i in range(len(src)):
+        for j in range(i + 1, len(src)):
+            if layer[src[i]] == layer[src[j]] and layer[tgt[i]] == layer[tgt[j]] == layer[src[i]] + 1:
+                n += int((pos[src[i]] - pos[src[j]]) * (pos[tgt[i]] - pos[tgt[j]]) < 0)
+    return n
+
+
+class TestLayout(unittest.TestCase):
+    """Tests for assign_layers(), order_layers(), and layered_layout()"""
+
+    def test_layers(self):
+        """Test that edges point down, and each node is one layer below its deepest parent"""
+        g = graph(random_dag())
+        layer = assign_layers(g)
+        src = np.repeat(np.arange(len(g)), np.diff(g.fwd_offsets))
+        self.assertTrue((layer[g.fwd_targets] > layer[src]).all())
+        for i in range(len(g)):
+            parents = g.rev_sources[g.rev_offsets[i]:g.rev_offsets[i + 1]]
+            self.assertEqual(layer[i], layer[parents].max() + 1 if len(parents) else 0)
+        # Cycles fall back to shortest distance from a root
+        np.testing.assert_array_equal(assign_layers(graph([(1, 2), (2, 3), (3, 2)])), [0, 1, 2])
+
+    def test_order(self):
+        """Test that orders are a permutation within each layer, and sweeps don't add crossings"""
+        g = graph(random_dag(n_nodes=60, n_edges=120))
+        layer = assign_layers(g)
+        pos = order_layers(g, layer)
+        for i in np.unique(layer):
+            np.testing.assert_array_equal(np.sort(pos[layer == i]), np.arange((layer == i).sum()))
+        self.assertLessEqual(crossings(g, layer, pos), crossings(g, layer, order_layers(g, layer, sweeps=0)))
+        # A crossing that one sweep removes: 1 -> 4, 2 -> 3
+        g = graph([(1, 4), (2, 3)])
+        layer = assign_layers(g)
+        self.assertEqual(crossings(g, layer, order_layers(g, layer, sweeps=0)), 1)
+        self.assertEqual(crossings(g, layer, order_layers(g, layer, sweeps=1)), 0)
+
+    def test_layered_layout(self):
+        """Test output lists"""
+        layout = layered_layout(graph(EDGES))
+        self.assertEqual(layout['nodes'], [1, 2, 3, 4, 5, 6, 7, 8, 9, 30, 31])
+        self.assertEqual(layout['layer'], [0, 1, 1, 2, 2, 2, 2, 3, 4, 0, 1])
+        self.assertEqual(layout['n_layers'], 5)
+        self.assertEqual(len(layout['order']), 11)
+        empty = layered_layout(CompactGraph.from_edges([], []))
+        self.assertEqual(empty, {'nodes': [], 'layer': [], 'order': [], 'n_layers': 0})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,139 @@
+"""Tests for GraphLoader
+
+How to run:
+    python -m unittest discover
+"""
+import os
+import sys
+import threading
+import unittest
+from pathlib import Path
+
+THIS_DIR = Path(os.path.dirname(__file__))
+PROJECT_ROOT = THIS_DIR.parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+from backend.graph.compact_graph import CompactGraph
+from backend.graph.loader import GraphLoader, GraphNotReadyError
+
+
+class TestGraphLoader(unittest.TestCase):
+    """Tests for GraphLoader"""
+
+    def test_load_in_background(self):
+        """Test that the graph isn't available until load_func returns, and is afterwards"""
+        release = threading.Event()
+
+        def load(progress):
+            progress('building')
+            release.wait(5)
+            return CompactGraph.from_edges([1, 2], [2, 3])
+
+        loader = GraphLoader(load).start()
+        self.assertEqual(loader.state, 'loading')
+        self.assertFalse(loader.ready)
+        self.assertRaises(GraphNotReadyError, loader.get)
+        release.set()
+        g = loader.wait(5)
+        self.assertTrue(loader.ready)
+        self.assertEqual(g.number_of_edges(), 2)
+        status = loader.status()
+        self.assertEqual((status['nodes'], status['edges']), (3, 2))
+        self.assertEqual(status['progress'][0]['msg'], 'building')
+
+    def test_failure(self):
+        """Test that a failed load is reported, and can be restarted"""
+        calls = []
+
+        def load(progress):
+            calls.append(1)
+            if len(calls) == 1:
+                raise RuntimeError('db unavailable')
+            return CompactGraph.from_edges([1], [2])
+
+        loader = GraphLoader(load)
+        self.assertRaises(GraphNotReadyError, loader.wait, 5)
+        self.assertEqual(loader.state, 'failed')
+        self.assertIn('db unavailable', loader.status()['error'])
+        loader.start()
+        self.assertEqual(len(loader.wait(5)), 2)
+        self.assertIsNone(loader.status()['error'])
+
+    def test_reload_on_version_change(self):
+        """Test that a new graph is swapped in when the version changes, while references to the old one stay valid"""
+        version, swaps = ['v1'], []
+        graphs = iter([CompactGraph.from_edges([1], [2]), CompactGraph.from_edges([1, 2], [2, 3])])
+        loader = GraphLoader(
+            lambda progress: next(graphs), version_func=lambda: version[0], on_swap=lambda: swaps.append(1))
+        old = loader.wait(5)
+        self.assertEqual((loader.version, loader.generation), ('v1', 1))
+        self.assertFalse(loader.check_for_update())
+
+        version[0] = 'v2'
+        self.assertTrue(loader.check_for_update())
+        self.assertEqual(len(loader.get()), 3)
+        self.assertEqual(len(old), 2)
+        self.assertEqual((loader.version, loader.generation, len(swaps)), ('v2', 2, 1))
+        self.assertFalse(loader.check_for_update())
+
+    def test_loaded_version(self):
+        """Test that when loading writes a new snapshot, the graph's version has the new snapshot's hash, so the next
+        check doesn't reload it again"""
+        snapshot = {'hash': None}
+
+        def load(progress):
+            snapshot['hash'] = f'hash{len(snapshot)}'  # e.g. a rebuild writing the snapshot
+            snapshot[snapshot['hash']] = True
+            g = CompactGraph.from_edges([1], [2])
+            g.content_hash = snapshot['hash']
+            return g
+
+        version = ['v1']
+        loader = GraphLoader(
+            load, version_func=lambda: (version[0], snapshot['hash']),
+            loaded_version_func=lambda g, v: (v[0], g.content_hash))
+        loader.wait(5)
+        self.assertEqual(loader.version, ('v1', 'hash1'))
+        self.assertFalse(loader.check_for_update())
+        version[0] = 'v2'
+        self.assertTrue(loader.check_for_update())
+        self.assertEqual((loader.version, loader.generation), (('v2', 'hash2'), 2))
+        self.assertFalse(loader.check_for_update())
+
+    def test_failed_reload_keeps_graph(self):
+        """Test that if reloading fails, the current graph stays in use, and the reload is retried"""
+        version, calls = ['v1'], []
+
+        def load(progress):
+            calls.append(1)
+            if len(calls) == 2:
+                raise RuntimeError('db unavailable')
+            return CompactGraph.from_edges([1] * len(calls), list(range(2, len(calls) + 2)))
+
+        loader = GraphLoader(load, version_func=lambda: version[0])
+        g = loader.wait(5)
+        version[0] = 'v2'
+        self.assertFalse(loader.check_for_update())
+        self.assertIs(loader.get(), g)
+        self.assertTrue(loader.ready)
+        self.assertIn('db unavailable', loader.status()['reload_error'])
+        self.assertTrue(loader.check_for_update())
+        self.assertEqual(loader.get().number_of_edges(), 3)
+        self.assertIsNone(loader.status()['reload_error'])
+
+    def test_watcher(self):
+        """Test that the watcher thread reloads the graph when the version changes"""
+        version, swapped = ['v1'], threading.Event()
+        loader = GraphLoader(
+            lambda progress: CompactGraph.from_edges([1], [2]), version_func=lambda: version[0], watch_seconds=0.01,
+            on_swap=swapped.set)
+        try:
+            loader.wait(5)
+            version[0] = 'v2'
+            self.assertTrue(swapped.wait(5))
+            self.assertEqual(loader.status()['generation'], 2)
+        finally:
+            loader.stop_watching()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+"""Tests for ReachabilityIndex
+
+How to run:
+    python -m unittest discover
+"""
+import os
+import random
+import sys
+import unittest
+from pathlib import Path
+
+import networkx as nx
+import numpy as np
+
+THIS_DIR = Path(os.path.dirname(__file__))
+PROJECT_ROOT = THIS_DIR.parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+from backend.graph.compact_graph import CompactGraph
+from backend.graph.reachability import ReachabilityIndex
+from test.test_backend.graph.test_compact_graph import EDGES, random_dag
+
+
+class TestReachabilityIndex(unittest.TestCase):
+    """Tests for ReachabilityIndex, checked against networkx"""
+
+    @staticmethod
+    def _graphs(edges):
+        """Get equivalent indexed compact graph and networkx graph"""
+        arr = np.array(edges)
+        g = CompactGraph.from_edges(arr[:, 0], arr[:, 1])
+        g.reachability = ReachabilityIndex.build(g, max_intervals_per_node=100)
+        return g, nx.DiGraph(edges)
+
+    def test_descendants(self):
+        """Test descendants() of single nodes and of sets of nodes that descend from one another"""
+        for edges in (EDGES, random_dag(), random_dag(n_nodes=1000, n_edges=1500, seed=3)):
+            g, nxg = self._graphs(edges)
+            self.assertIsNotNone(g.reachability)
+            for node in nxg.nodes:
+                self.assertEqual(set(g.descendants([node]).tolist()), nx.descendants(nxg, node))
+            rand = random.Random(0)
+            for _ in range(50):
+                nodes = rand.sample(list(nxg.nodes), 4) + [-1]  # -1: not in graph
+                expected = set().union(*[nx.descendants(nxg, x) for x in nodes[:-1]])
+                self.assertEqual(set(g.descendants(nodes).tolist()), expected)
+
+    def test_is_ancestor(self):
+        """Test is_ancestor()"""
+        g, nxg = self._graphs(random_dag())
+        rand = random.Random(0)
+        for _ in range(2000):
+            a, b = rand.sample(list(nxg.nodes), 2)
+            self.assertEqual(g.is_ancestor(a, b), nx.has_path(nxg, a, b))
+        self.assertFalse(g.is_ancestor(a, a))
+        self.assertFalse(g.is_ancestor(a, -1))
+
+    def test_not_indexable(self):
+        """Test that graphs with cycles, or too many cross-edges for the budget, aren't indexed"""
+        g = CompactGraph.from_edges([1, 2, 3], [2, 3, 1])
+        self.assertIsNone(ReachabilityIndex.build(g))
+        arr = np.array(random_dag())
+        g = CompactGraph.from_edges(arr[:, 0], arr[:, 1])
+        self.assertIsNone(ReachabilityIndex.build(g, max_intervals_per_node=2))
+
+    def test_empty(self):
+        """Test empty graph"""
+        g = CompactGraph.from_edges([], [])
+        g.reachability = ReachabilityIndex.build(g)
+        self.assertEqual(len(g.descendants([1])), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+"""Tests for ResponseCache
+
+How to run:
+    python -m unittest discover
+"""
+import os
+import sys
+import unittest
+from pathlib import Path
+
+THIS_DIR = Path(os.path.dirname(__file__))
+PROJECT_ROOT = THIS_DIR.parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+from backend.graph.response_cache import ResponseCache
+
+
+class TestResponseCache(unittest.TestCase):
+    """Tests for ResponseCache"""
+
+    def test_lru_eviction(self):
+        """Test that least recently used entries are evicted to stay within the memory budget"""
+        cache = ResponseCache(max_bytes=30)
+        cache.put('a', b'a' * 10)
+        cache.put('b', b'b' * 10)
+        cache.put('c', b'c' * 10)
+        self.assertEqual(cache.get('a'), b'a' * 10)  # 'a' is now most recently used
+        cache.put('d', b'd' * 10)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), b'c' * 10)
+        cache.put('too big', b'x' * 31)
+        self.assertIsNone(cache.get('too big'))
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['evictions']), (2, 2, 1))
+        self.assertEqual((stats['entries'], stats['bytes']), (3, 30))
+
+    def test_replace(self):
+        """Test that replacing an entry doesn't double count its size"""
+        cache = ResponseCache(max_bytes=20)
+        cache.put('a', b'1' * 10)
+        cache.put('a', b'2' * 15)
+        self.assertEqual(cache.nbytes, 15)
+        self.assertEqual(cache.get('a'), b'2' * 15)
+
+    def test_invalidation(self):
+        """Test that entries are dropped when the data version changes, which is checked at most so often"""
+        version = ['2024-01-01']
+        cache = ResponseCache(max_bytes=100, version_func=lambda: version[0], version_check_seconds=0)
+        cache.put('a', b'a')
+        self.assertEqual(cache.get('a'), b'a')
+        version[0] = '2024-01-02'
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['invalidations'], 1)
+
+        cache = ResponseCache(max_bytes=100, version_func=lambda: version[0], version_check_seconds=3600)
+        cache.get('a')
+        cache.put('a', b'a')
+        version[0] = '2024-01-03'
+        self.assertEqual(cache.get('a'), b'a')  # not rechecked yet
+        cache.check_version(force=True)
+        self.assertIsNone(cache.get('a'))
+
+    def test_no_check_on_access(self):
+        """Test that w/ check_on_access=False, the version is only checked when the caller asks"""
+        calls = []
+        cache = ResponseCache(
+            max_bytes=100, version_func=lambda: calls.append(1) or len(calls), version_check_seconds=0,
+            check_on_access=False)
+        cache.put('a', b'a')
+        self.assertEqual(cache.get('a'), b'a')
+        self.assertEqual(calls, [])
+        self.assertTrue(cache.version_check_due())
+        cache.check_version()
+        self.assertEqual(calls, [1])
+
+
+if __name__ == '__main__':
+    unittest.main()
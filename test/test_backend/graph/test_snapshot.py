@@ -0,0 +1,117 @@
+"""Tests for graph snapshots
+
+How to run:
+    python -m unittest discover
+"""
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+
+THIS_DIR = Path(os.path.dirname(__file__))
+PROJECT_ROOT = THIS_DIR.parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+from backend.graph.compact_graph import CompactGraph
+from backend.graph.reachability import ReachabilityIndex
+from backend.graph.snapshot import SnapshotError, load_graph_snapshot, read_header, save_graph_snapshot, \
+    write_arrays
+from test.test_backend.graph.test_compact_graph import random_dag
+
+
+class TestSnapshot(unittest.TestCase):
+    """Tests for backend/graph/snapshot.py"""
+
+    def setUp(self):
+        """Set up"""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, 'relationship_graph.snapshot')
+        edges = np.array(random_dag())
+        self.graph = CompactGraph.from_edges(edges[:, 0], edges[:, 1])
+
+    def tearDown(self):
+        """Tear down"""
+        self.tmp_dir.cleanup()
+
+    def test_round_trip(self):
+        """Test save_graph_snapshot() and load_graph_snapshot()"""
+        save_graph_snapshot(self.graph, self.path)
+        loaded = load_graph_snapshot(self.path)
+        for name in ('node_ids', 'fwd_offsets', 'fwd_targets', 'rev_offsets', 'rev_sources'):
+            expected, actual = getattr(self.graph, name), getattr(loaded, name)
+            self.assertEqual(actual.dtype, expected.dtype)
+            np.testing.assert_array_equal(actual, expected)
+            self.assertFalse(actual.flags.writeable)
+        self.assertEqual(read_header(self.path)['n_edges'], self.graph.number_of_edges())
+        self.assertEqual(loaded.content_hash, read_header(self.path)['content_hash'])
+        self.assertIsNone(self.graph.content_hash)
+
+    def test_reachability_index(self):
+        """Test that the reachability index is saved and loaded with the graph"""
+        self.graph.reachability = ReachabilityIndex.build(self.graph, max_intervals_per_node=100)
+        save_graph_snapshot(self.graph, self.path)
+        loaded = load_graph_snapshot(self.path, verify=True)
+        self.assertIsNotNone(loaded.reachability)
+        for name, arr in self.graph.reachability.arrays().items():
+            np.testing.assert_array_equal(loaded.reachability.arrays()[name], arr)
+        node = self.graph.nodes[0]
+        np.testing.assert_array_equal(loaded.descendants([node]), self.graph.descendants([node]))
+
+    def test_empty_graph(self):
+        """Test snapshot of a graph with no nodes"""
+        save_graph_snapshot(CompactGraph.from_edges([], []), self.path)
+        self.assertEqual(len(load_graph_snapshot(self.path)), 0)
+
+    def test_invalid_files(self):
+        """Test that missing, foreign, and truncated files raise SnapshotError"""
+        with self.assertRaises(SnapshotError):
+            load_graph_snapshot(self.path)
+        with open(self.path, 'wb') as f:
+            f.write(b'not a snapshot file')
+        with self.assertRaises(SnapshotError):
+            load_graph_snapshot(self.path)
+        save_graph_snapshot(self.graph, self.path)
+        with open(self.path, 'r+b') as f:
+            f.truncate(os.path.getsize(self.path) - 100)
+        with self.assertRaises(SnapshotError):
+            load_graph_snapshot(self.path)
+
+    def test_header(self):
+        """Test that header records vocab timestamp, edge count, and content hash"""
+        save_graph_snapshot(self.graph, self.path, vocab_refreshed='2024-11-18T00:00:00-05:00')
+        header = read_header(self.path)
+        self.assertEqual(header['vocab_refreshed'], '2024-11-18T00:00:00-05:00')
+        self.assertEqual(header['n_edges'], self.graph.number_of_edges())
+        self.assertEqual(len(header['content_hash']), 64)
+        load_graph_snapshot(self.path, verify=True)
+
+    def test_checksum(self):
+        """Test that corrupted array contents fail verification"""
+        save_graph_snapshot(self.graph, self.path)
+        offset = read_header(self.path)['arrays']['fwd_targets']['offset']
+        with open(self.path, 'r+b') as f:
+            f.seek(offset)
+            f.write(b'\xff\xff\xff\x7f')
+        load_graph_snapshot(self.path)  # not verified: loads
+        with self.assertRaises(SnapshotError):
+            load_graph_snapshot(self.path, verify=True)
+
+    def test_atomic_write(self):
+        """Test that a failed write leaves the previous snapshot intact, and no temporary files behind"""
+        save_graph_snapshot(self.graph, self.path)
+        size = os.path.getsize(self.path)
+        with mock.patch('backend.graph.snapshot.os.replace', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                write_arrays(self.path, {'x': np.arange(3)})
+        self.assertEqual(os.path.getsize(self.path), size)
+        self.assertEqual(os.listdir(self.tmp_dir.name), [os.path.basename(self.path)])
+        # Rewriting does not grow the file, as appending to the old pickle did
+        save_graph_snapshot(self.graph, self.path)
+        self.assertEqual(os.path.getsize(self.path), size)
+
+
+if __name__ == '__main__':
+    unittest.main()
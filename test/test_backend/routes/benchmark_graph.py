@@ -0,0 +1,179 @@
+"""Benchmarks for concept_graph(), using the workloads in test_graph.py's TEST_CASES_FAST
+
+For each case, runs concept_graph() (via condensed_concept_graph()) and serialization of the /concept-graph response,
+and records wall time, peak Python memory (tracemalloc, which includes numpy arrays), node / edge counts, and response
+size. Time is measured w/out tracemalloc, and memory in a separate run. Results are compared against a stored baseline,
+and the run fails if there is no baseline, or if any case is slower or uses more memory than the baseline by more than
+the threshold, or goes over its timeoutSeconds.
+
+Needs the DB (for concept set members) and a relationship graph snapshot, which can be a local one.
+
+How to run:
+    python test/test_backend/routes/benchmark_graph.py  # compare against baseline
+    python test/test_backend/routes/benchmark_graph.py --save-baseline  # after an intended change, or on new hardware
+"""
+import asyncio
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from pathlib import Path
+from typing import Any, Dict, List, Set, Tuple
+
+THIS_DIR = Path(os.path.dirname(__file__))
+PROJECT_ROOT = THIS_DIR.parent.parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+from backend.db.utils import dispose_async_engines, get_async_db_connection
+from backend.graph.compact_graph import CompactGraph
+from backend.graph.snapshot import load_graph_snapshot
+from backend.routes import graph as graph_routes
+from backend.routes.graph import GRAPH_PATH, concept_graph_response, condensed_concept_graph, json_bytes
+from test.test_backend.routes.test_graph import HIDE_VOCABS, TestGraph
+
+DESC = 'Benchmark concept_graph() on the test_graph.py workloads, and compare against a baseline.'
+BASELINE_PATH = THIS_DIR / 'static' / 'benchmark_graph_baseline.json'
+DEFAULT_THRESHOLD = 0.5
+# Don't flag time regressions smaller than this; below it, timings are mostly noise
+MIN_SECONDS_DIFF = 0.05
+
+
+def get_cases() -> List[Dict[str, Any]]:
+    """Benchmark cases, from test_graph.py's TEST_CASES_FAST"""
+    cases = TestGraph._get_test_cases()
+    return [{
+        'name': case['testName'],
+        'codeset_ids': [int(x) for x in case['codeset_ids']],
+        'hide_vocabs': [x.strip() for x in case.get('hide_vocabs') or []] or HIDE_VOCABS,
+        'timeout_seconds': float(case['timeoutSeconds']),
+    } for case in cases]
+
+
+async def run_once(case: Dict[str, Any], response_format='json') -> Tuple[CompactGraph, Set[int], bytes]:
+    """Run a case once: concept_graph(), and serialization of the response"""
+    sg, concept_ids, missing, hidden, nonstandard, super_nodes = await condensed_concept_graph(
+        case['codeset_ids'], [], case['hide_vocabs'])
+    content = json_bytes(concept_graph_response(
+        sg, concept_ids, missing, hidden, nonstandard, super_nodes, response_format))
+    return sg, concept_ids, content
+
+
+async def run_case(case: Dict[str, Any], response_format='json', repeat=1) -> Dict[str, Any]:
+    """Run a case `repeat` times, and report the fastest time. Then run it once more w/ tracemalloc on, for peak memory.
+    Tracing slows down allocations, so it's kept out of the timed runs."""
+    wall_times = []
+    for i in range(repeat):
+        gc.collect()
+        t0 = time.perf_counter()
+        sg, concept_ids, content = await run_once(case, response_format)
+        wall_times.append(time.perf_counter() - t0)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        await run_once(case, response_format)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'wall_seconds': round(min(wall_times), 4),
+        'peak_mb': round(peak / 1024 / 1024, 2),
+        'nodes': len(sg),
+        'edges': sg.number_of_edges(),
+        'concept_ids': len(concept_ids),
+        'response_bytes': len(content),
+    }
+
+
+async def run_cases(cases: List[Dict[str, Any]], response_format='json', repeat=1) -> Dict[str, Dict[str, Any]]:
+    """Run cases in one event loop, so they share its async engine. The engine connects before any case is timed, and
+    is disposed at the end."""
+    try:
+        async with get_async_db_connection():
+            pass
+        results: Dict[str, Dict[str, Any]] = {}
+        for case in cases:
+            results[case['name']] = await run_case(case, response_format, repeat)
+            print(f'{case["name"]}: {json.dumps(results[case["name"]])}')
+        return results
+    finally:
+        await dispose_async_engines()
+
+
+def compare(
+    results: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], cases: List[Dict[str, Any]],
+    threshold: float = DEFAULT_THRESHOLD
+) -> List[str]:
+    """Regressions of results vs baseline, as messages. Changed counts are reported too, since they mean the cases
+    aren't measuring the same work, e.g. the DB or vocab was refreshed."""
+    problems: List[str] = []
+    for case in cases:
+        name, result = case['name'], results[case['name']]
+        if result['wall_seconds'] > case['timeout_seconds']:
+            problems.append(f'{name}: took {result["wall_seconds"]}s; timeout is {case["timeout_seconds"]}s')
+        base = baseline.get(name)
+        if not base:
+            continue
+        if result['wall_seconds'] > base['wall_seconds'] * (1 + threshold) and \
+                result['wall_seconds'] - base['wall_seconds'] > MIN_SECONDS_DIFF:
+            problems.append(f'{name}: wall time {result["wall_seconds"]}s vs baseline {base["wall_seconds"]}s')
+        if result['peak_mb'] > base['peak_mb'] * (1 + threshold):
+            problems.append(f'{name}: peak memory {result["peak_mb"]}MB vs baseline {base["peak_mb"]}MB')
+        for key in ('nodes', 'edges', 'concept_ids'):
+            if result[key] != base.get(key):
+                problems.append(f'{name}: {key} {result[key]} vs baseline {base.get(key)}')
+    return problems
+
+
+def benchmark(
+    graph_path: str = GRAPH_PATH, baseline_path: str = str(BASELINE_PATH), save_baseline=False,
+    threshold: float = DEFAULT_THRESHOLD, response_format='json', repeat=1, cases: List[str] = None
+) -> bool:
+    """Run benchmarks, and compare against, or save, the baseline. Returns True if there were no regressions."""
+    graph_routes.GRAPH_LOADER.load_func = lambda progress=None: load_graph_snapshot(graph_path)
+    graph_routes.GRAPH_LOADER.watch_seconds = 0  # no hot-swapping mid-run
+    g = graph_routes.GRAPH_LOADER.wait()
+    print(f'Graph: {g}')
+    all_cases = get_cases()
+    selected = [c for c in all_cases if not cases or c['name'] in cases]
+    results: Dict[str, Dict[str, Any]] = asyncio.run(run_cases(selected, response_format, repeat))
+
+    if save_baseline:
+        os.makedirs(os.path.dirname(baseline_path), exist_ok=True)
+        with open(baseline_path, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'Saved baseline to {baseline_path}')
+        return True
+    if not os.path.exists(baseline_path):
+        # Otherwise only timeouts would be checked, and regressions would pass unnoticed
+        print(f'FAILED: No baseline at {baseline_path}. Run with --save-baseline, on a reference snapshot, to create '
+              f'one.')
+        return False
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    problems = compare(results, baseline, selected, threshold)
+    for problem in problems:
+        print(f'REGRESSION: {problem}')
+    return not problems
+
+
+def cli():
+    """Command line interface"""
+    parser = ArgumentParser(prog='Graph benchmarks', description=DESC)
+    parser.add_argument('-g', '--graph-path', default=GRAPH_PATH, help='Relationship graph snapshot to load.')
+    parser.add_argument('-b', '--baseline-path', default=str(BASELINE_PATH), help='Baseline results JSON.')
+    parser.add_argument(
+        '-s', '--save-baseline', action='store_true', default=False,
+        help='Save results as the new baseline, instead of comparing against it.')
+    parser.add_argument(
+        '-t', '--threshold', type=float, default=DEFAULT_THRESHOLD,
+        help='Fail if time or memory exceed the baseline by more than this fraction.')
+    parser.add_argument('-f', '--response-format', default='json', choices=['json', 'compact'])
+    parser.add_argument('-r', '--repeat', type=int, default=1, help='Runs per case. The fastest time is reported.')
+    parser.add_argument('-c', '--cases', nargs='+', required=False, help='Names of cases to run. Default: all.')
+    sys.exit(0 if benchmark(**vars(parser.parse_args())) else 1)
+
+
+if __name__ == '__main__':
+    cli()
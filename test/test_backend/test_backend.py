@@ -1,4 +1,5 @@
 """Tests for backend web server and utilities"""
+import asyncio
 import os
 from typing import Dict, Union
 
@@ -16,7 +17,10 @@ TEST_DIR = THIS_TEST_DIR.parent
 PROJECT_ROOT = TEST_DIR.parent
 sys.path.insert(0, str(PROJECT_ROOT))
 from backend.db.analysis import InvalidCompareSchemaError, counts_compare_schemas, counts_over_time
-from backend.routes.db import get_concepts, get_researchers, get_cset_members_items
+from backend.db.queries import get_concepts_async
+from backend.db.utils import dispose_async_engines
+from backend.routes.db import get_concepts, get_csets, get_csets_async, get_researchers, get_cset_members_items, \
+    get_cset_members_items_async
 
 
 TEST_DIR = os.path.dirname(__file__)
@@ -330,6 +334,35 @@ class TestBackend(unittest.TestCase):
         ].sort(key=key)
         self.assertEquals(csmi, expected)
 
+    def test_async_queries_match_sync(self):
+        """Test that the async versions of get_cset_members_items(), get_csets(), and get_concepts() return the same
+        rows as the sync ones"""
+        codeset_ids = [396155663, 643758668]
+        concept_ids = [4091006, 4052321]
+
+        async def fetch():
+            """Run the async queries in one event loop, sharing its engine, and dispose of it at the end"""
+            try:
+                return (
+                    await get_cset_members_items_async(codeset_ids),
+                    await get_cset_members_items_async(codeset_ids, column='concept_id'),
+                    await get_csets_async(codeset_ids), await get_concepts_async(concept_ids))
+            finally:
+                await dispose_async_engines()
+        members_items, member_ids, csets, concepts = asyncio.run(fetch())
+
+        key = lambda d: f"{d['codeset_id']}.{d['concept_id']}"
+        self.assertEqual(
+            sorted([dict(x) for x in members_items], key=key),
+            sorted([dict(x) for x in get_cset_members_items(codeset_ids)], key=key))
+        self.assertEqual(sorted(member_ids), sorted(get_cset_members_items(codeset_ids, column='concept_id')))
+        key = lambda d: d['codeset_id']
+        self.assertEqual(sorted(csets, key=key), sorted(get_csets(codeset_ids), key=key))
+        key = lambda d: d['concept_id']
+        self.assertEqual(
+            sorted([dict(x) for x in concepts], key=key),
+            sorted([dict(x) for x in get_concepts(concept_ids)], key=key))
+
     def test_get_cset_members_items__cols(self):
         """Test test_get_cset_members_items() using columns param.
 